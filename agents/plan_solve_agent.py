@@ -5,34 +5,84 @@
 # @File    : plan_solve_agent.py
 # @Software: PyCharm
 
+import re
 import ast
-from typing import Optional, List, Dict
+import json
+import asyncio
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Tuple
+
+from pydantic import BaseModel
+
 from core.agent import Agent
 from core.llm import AgentsLLM
 from core.config import Config
-from core.message import Message
+from core.message import FastMessage
+from core.plan_cache import PlanCache
+from core.run_checkpoint import RunCheckpointStore, restore_state
 from utils.log import Log
+from utils.token_counter import count_tokens
 
 logger = Log()
 
 # 默认规划器提示词模板
 DEFAULT_PLANNER_PROMPT = """
-你是一个顶级的AI规划专家。你的任务是将用户提出的复杂问题分解成一个由多个简单步骤组成的行动计划。
-请确保计划中的每个步骤都是一个独立的、可执行的子任务，并且严格按照逻辑顺序排列。
-你的输出必须是一个Python列表，其中每个元素都是一个描述子任务的字符串。
+你是一个顶级的AI规划专家。你的任务是将用户提出的复杂问题分解成一个由多个简单步骤组成的行动计划，并标明步骤之间的依赖关系。
+请确保计划中的每个步骤都是一个独立的、可执行的子任务。只有确实需要用到某个步骤的结果时才依赖它，互不依赖的步骤会被同时执行。
+步骤按逻辑顺序从1开始编号，只能依赖编号更小的步骤，最后一个步骤负责汇总得出最终答案。
+你的输出必须是一个Python列表，其中每个元素都是一个字典：id 为步骤编号，step 为子任务描述，depends_on 为所依赖步骤的编号列表。
 
 问题: {question}
 
 请严格按照以下格式输出你的计划:
 ```python
-["步骤1", "步骤2", "步骤3", ...]
+[{{"id": 1, "step": "步骤1", "depends_on": []}}, {{"id": 2, "step": "步骤2", "depends_on": []}}, {{"id": 3, "step": "步骤3", "depends_on": [1, 2]}}, ...]
+```
+"""
+
+# 计划格式修复提示词：只整理格式，不重新规划
+DEFAULT_REPAIR_PROMPT = """
+下面是一份格式不正确的行动计划。请不要修改、增加或删除任何步骤，只把它整理为合法的Python列表。
+每个元素是一个字典：id 为步骤编号，step 为子任务描述，depends_on 为所依赖步骤的编号列表。
+
+# 原始输出:
+{response}
+
+请严格按照以下格式输出:
+```python
+[{{"id": 1, "step": "步骤1", "depends_on": []}}, ...]
+```
+"""
+
+# 增量重新规划提示词：保留已完成的步骤，只修订剩余部分
+DEFAULT_REPLANNER_PROMPT = """
+你是一个顶级的AI规划专家。下面的计划在执行过程中遇到了问题，你的任务是只修订尚未完成的部分。
+已完成步骤的结果会被保留，不要重复这些步骤。
+
+问题: {question}
+
+# 原计划:
+{plan}
+
+# 已完成的步骤与结果:
+{completed}
+
+# 失败的步骤:
+{failed}
+
+请给出替代剩余部分的新步骤，编号从 {next_id} 开始，可以依赖已完成步骤的编号，最后一个步骤负责汇总得出最终答案。
+请严格按照以下格式输出:
+```python
+[{{"id": {next_id}, "step": "步骤", "depends_on": []}}, ...]
 ```
 """
 
 # 默认执行器提示词模板
 DEFAULT_EXECUTOR_PROMPT = """
-你是一位顶级的AI执行专家。你的任务是严格按照给定的计划，一步步地解决问题。
-你将收到原始问题、完整的计划、以及到目前为止已经完成的步骤和结果。
+你是一位顶级的AI执行专家。你的任务是按照给定的计划，解决其中的一个步骤。
+你将收到原始问题、完整的计划、以及当前步骤所依赖的步骤和结果。
 请你专注于解决"当前步骤"，并仅输出该步骤的最终答案，不要输出任何额外的解释或对话。
 
 # 原始问题:
@@ -41,7 +91,7 @@ DEFAULT_EXECUTOR_PROMPT = """
 # 完整计划:
 {plan}
 
-# 历史步骤与结果:
+# 依赖步骤与结果:
 {history}
 
 # 当前步骤:
@@ -51,17 +101,160 @@ DEFAULT_EXECUTOR_PROMPT = """
 """
 
 
+# 模型常输出的中文引号
+_QUOTE_TABLE = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+# 编号列表中的一行：1. xxx / 1、xxx / 1) xxx / - xxx / * xxx
+_LIST_ITEM_PATTERN = re.compile(r"^\s*(?:\d+\s*[.、)）]|[-*•])\s*(.+)$")
+
+
+class PlanStep(BaseModel):
+    """计划中的一个步骤"""
+
+    id: int
+    description: str
+    # 所依赖步骤的编号，执行时只会收到这些步骤的结果
+    depends_on: List[int] = []
+
+
+class StepFailed(Exception):
+    """计划中的某个步骤执行失败"""
+
+    def __init__(self, step: PlanStep, reason: str):
+        super().__init__(f"步骤 {step.id} 执行失败: {reason}")
+        self.step = step
+        self.reason = reason
+
+
+def normalize_plan(items: List[Any]) -> List[PlanStep]:
+    """
+    将计划规范为从1开始连续编号的步骤列表
+
+    字典元素按 depends_on 建立依赖；字符串元素是旧的纯列表格式，依赖之前的所有步骤，与逐步执行等价。
+    指向未知步骤、自身或之后步骤的依赖会被丢弃，保证依赖图无环且列表顺序即为一个合法的执行顺序。
+
+    Args:
+        items: 模型输出或检查点中的计划
+
+    Returns:
+        步骤列表
+    """
+    steps: List[PlanStep] = []
+    id_map: Dict[str, int] = {}
+    for index, item in enumerate(items, 1):
+        if isinstance(item, PlanStep):
+            item = item.model_dump()
+        if isinstance(item, dict):
+            description = str(item.get("step") or item.get("description") or "")
+            raw_deps = item.get("depends_on") or []
+            depends_on = set()
+            for dep in raw_deps if isinstance(raw_deps, list) else [raw_deps]:
+                if str(dep) in id_map:
+                    depends_on.add(id_map[str(dep)])
+                else:
+                    logger.warning(f"⚠️ 步骤 {index} 依赖了不存在或尚未出现的步骤 {dep}，已忽略")
+            id_map[str(item.get("id", index))] = index
+            steps.append(PlanStep(id=index, description=description, depends_on=sorted(depends_on)))
+        else:
+            steps.append(PlanStep(id=index, description=str(item), depends_on=list(range(1, index))))
+    return steps
+
+
+class StepContext:
+    """
+    执行器的有界上下文
+
+    当前步骤所依赖的结果中，最近的 recent_steps 个原样保留，更早的压缩为摘要；摘要按步骤缓存，
+    每个步骤的结果只压缩一次。总量超过 max_tokens 时从最早的摘要开始省略，
+    因此长计划中每一步的提示词大小有上界，不再随步骤数增长。
+    """
+
+    def __init__(self, max_tokens: int = 2048, recent_steps: int = 3, summary_tokens: int = 64,
+                 summarizer: Optional[Callable[[str, str], str]] = None):
+        """
+        Args:
+            max_tokens: 依赖步骤与结果部分的token预算
+            recent_steps: 原样保留的最近步骤数
+            summary_tokens: 单个步骤摘要的token上限
+            summarizer: 摘要函数 summarizer(步骤描述, 结果) -> 摘要，默认截取结果开头，不额外调用LLM
+        """
+        self.max_tokens = max_tokens
+        self.recent_steps = recent_steps
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        # 步骤编号 -> (结果, 摘要)
+        self._summaries: Dict[int, Tuple[str, str]] = {}
+
+    def render(self, plan: List[PlanStep], outputs: Dict[int, str]) -> str:
+        """
+        将依赖步骤的结果渲染为提示词中的上下文
+
+        Args:
+            plan: 执行计划
+            outputs: 依赖步骤的结果 {步骤编号: 结果}
+
+        Returns:
+            上下文文本，没有依赖时为空字符串
+        """
+        descriptions = {step.id: step.description for step in plan}
+        step_ids = sorted(outputs)
+        recent = set(step_ids[-self.recent_steps:]) if self.recent_steps > 0 else set()
+        budget = self.max_tokens
+        entries: List[str] = []
+        omitted = 0
+        # 从最新的步骤向前填充预算
+        for step_id in reversed(step_ids):
+            description, result = descriptions.get(step_id, ""), outputs[step_id]
+            entry = f"步骤 {step_id}: {description}\n结果: {result}\n\n" if step_id in recent else ""
+            if not entry or count_tokens(entry) > budget:
+                entry = f"步骤 {step_id}: {description}\n结果摘要: {self._summary(step_id, description, result)}\n\n"
+            cost = count_tokens(entry)
+            if cost > budget:
+                omitted = len(step_ids) - len(entries)
+                break
+            budget -= cost
+            entries.append(entry)
+        entries.reverse()
+        if omitted:
+            entries.insert(0, f"（更早的 {omitted} 个步骤已省略）\n\n")
+        return "".join(entries)
+
+    def _summary(self, step_id: int, description: str, result: str) -> str:
+        cached = self._summaries.get(step_id)
+        if cached is not None and cached[0] == result:
+            return cached[1]
+        summary = self.summarizer(description, result) if self.summarizer else re.sub(r"\s+", " ", result).strip()
+        if count_tokens(summary) > self.summary_tokens:
+            while summary and count_tokens(summary) > self.summary_tokens:
+                summary = summary[:int(len(summary) * 0.8)]
+            summary += "…"
+        self._summaries[step_id] = (result, summary)
+        return summary
+
+
 class Planner:
-    """规划器 - 负责将复杂问题分解为简单步骤"""
+    """规划器 - 负责将复杂问题分解为带依赖关系的简单步骤"""
 
-    def __init__(self, llm_client: AgentsLLM, prompt_template: Optional[str] = None):
+    def __init__(self, llm_client: AgentsLLM, prompt_template: Optional[str] = None,
+                 cache: Optional[PlanCache] = None):
+        """
+        Args:
+            llm_client: LLM实例
+            prompt_template: 规划器提示词模板
+            cache: 计划缓存，相似的问题直接复用已有计划，不再调用LLM
+        """
         self.llm_client = llm_client
         self.prompt_template = prompt_template if prompt_template else DEFAULT_PLANNER_PROMPT
+        self.cache = cache
+        # 提示词模板或模型不同，生成的计划不可互相复用
+        self.cache_namespace = hashlib.sha1(
+            f"{llm_client.model}\n{self.prompt_template}".encode("utf-8")).hexdigest()[:16]
 
-    def plan(self, question: str, **kwargs) -> List[str]:
+    def plan(self, question: str, **kwargs) -> List[PlanStep]:
         """
         生成执行计划
 
+        模型输出无法解析时，先用一次只整理格式的LLM调用修复，而不是重新规划。
+
         Args:
             question: 要解决的问题
             **kwargs: LLM调用参数
@@ -69,66 +262,363 @@ class Planner:
         Returns:
             步骤列表
         """
-        prompt = self.prompt_template.format(question=question)
-        messages = [{"role": "user", "content": prompt}]
-
+        cached = self._cached_plan(question)
+        if cached is not None:
+            return cached
         logger.info("--- 正在生成计划 ---")
-        response_text = self.llm_client.think(messages, **kwargs) or ""
-        logger.info(f"✅ 计划已生成:\n{response_text}")
+        response_text = self.llm_client.think(self._build_messages(question), **kwargs) or ""
+        items = self._extract_plan(response_text)
+        if items is None and response_text.strip():
+            items = self._extract_plan(self.llm_client.think(self._repair_messages(response_text), **kwargs) or "")
+        return self._store_plan(question, self._to_plan(items, response_text))
+
+    async def aplan(self, question: str, **kwargs) -> List[PlanStep]:
+        """plan 的异步版本"""
+        cached = self._cached_plan(question)
+        if cached is not None:
+            return cached
+        logger.info("--- 正在生成计划 ---")
+        response_text = await self.llm_client.athink(self._build_messages(question), **kwargs) or ""
+        items = self._extract_plan(response_text)
+        if items is None and response_text.strip():
+            items = self._extract_plan(
+                await self.llm_client.athink(self._repair_messages(response_text), **kwargs) or "")
+        return self._store_plan(question, self._to_plan(items, response_text))
+
+    def replan(self, question: str, plan: List[PlanStep], results: Dict[int, str], failed: StepFailed,
+               **kwargs) -> Tuple[List[PlanStep], Dict[int, str]]:
+        """
+        增量重新规划：保留已完成的步骤及其结果，只让模型修订剩余部分
 
-        try:
-            # 提取Python代码块中的列表
-            plan_str = response_text.split("```python")[1].split("```")[0].strip()
-            plan = ast.literal_eval(plan_str)
-            return plan if isinstance(plan, list) else []
-        except (ValueError, SyntaxError, IndexError) as e:
-            logger.error(f"❌ 解析计划时出错: {e}。 原始响应: {response_text}")
-            return []
-        except Exception as e:
-            logger.error(f"❌ 解析计划时发生未知错误: {e}")
+        Args:
+            question: 原始问题
+            plan: 当前计划
+            results: 已完成步骤的结果 {步骤编号: 结果}
+            failed: 失败信息
+            **kwargs: LLM调用参数
+
+        Returns:
+            (新计划, 按新编号映射后的已完成结果)
+        """
+        logger.info(f"--- 正在修订剩余计划（{failed}） ---")
+        response_text = self.llm_client.think(self._replan_messages(question, plan, results, failed), **kwargs) or ""
+        return self._merge_plan(plan, results, self._extract_plan(response_text))
+
+    async def areplan(self, question: str, plan: List[PlanStep], results: Dict[int, str], failed: StepFailed,
+                      **kwargs) -> Tuple[List[PlanStep], Dict[int, str]]:
+        """replan 的异步版本"""
+        logger.info(f"--- 正在修订剩余计划（{failed}） ---")
+        response_text = await self.llm_client.athink(self._replan_messages(question, plan, results, failed),
+                                                     **kwargs) or ""
+        return self._merge_plan(plan, results, self._extract_plan(response_text))
+
+    def _cached_plan(self, question: str) -> Optional[List[PlanStep]]:
+        if self.cache is None:
+            return None
+        hit = self.cache.get(question, self.cache_namespace)
+        if hit is None:
+            return None
+        plan, similarity = hit
+        logger.info(f"♻️ 复用缓存的计划（相似度 {similarity:.2f}），共 {len(plan)} 步")
+        return normalize_plan(plan)
+
+    def _store_plan(self, question: str, plan: List[PlanStep]) -> List[PlanStep]:
+        # 解析失败的空计划不缓存，下次重新规划
+        if self.cache is not None and plan:
+            self.cache.set(question, [step.model_dump() for step in plan], self.cache_namespace)
+        return plan
+
+    def _build_messages(self, question: str) -> List[Dict[str, str]]:
+        return [{"role": "user", "content": self.prompt_template.format(question=question)}]
+
+    @staticmethod
+    def _repair_messages(response_text: str) -> List[Dict[str, str]]:
+        logger.warning("⚠️ 计划格式无法解析，尝试修复格式")
+        return [{"role": "user", "content": DEFAULT_REPAIR_PROMPT.format(response=response_text)}]
+
+    @staticmethod
+    def _replan_messages(question: str, plan: List[PlanStep], results: Dict[int, str],
+                         failed: StepFailed) -> List[Dict[str, str]]:
+        completed = "".join(
+            f"步骤 {step.id}: {step.description}\n结果: {results[step.id][:200]}\n\n"
+            for step in plan if step.id in results
+        )
+        prompt = DEFAULT_REPLANNER_PROMPT.format(
+            question=question,
+            plan=Executor.format_plan(plan),
+            completed=completed if completed else "无",
+            failed=f"步骤 {failed.step.id}: {failed.step.description}（{failed.reason}）",
+            next_id=max(step.id for step in plan) + 1
+        )
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _merge_plan(plan: List[PlanStep], results: Dict[int, str],
+                    revised: Optional[List[Any]]) -> Tuple[List[PlanStep], Dict[int, str]]:
+        """
+        已完成的步骤按原顺序排在前面，其后接修订的步骤，统一重新编号
+
+        修订结果无法解析时沿用原计划的剩余步骤，即原样重试失败的步骤。
+        """
+        done = [step for step in plan if step.id in results]
+        if not revised:
+            logger.warning("⚠️ 修订的计划无法解析，重试原计划的剩余步骤")
+            revised = [step.model_dump() for step in plan if step.id not in results]
+        merged = normalize_plan([step.model_dump() for step in done] + list(revised))
+        # 已完成步骤的依赖也都已完成，重新编号后它们恰好占据前 len(done) 个编号
+        remapped = {new.id: results[old.id] for old, new in zip(done, merged)}
+        return merged, remapped
+
+    @staticmethod
+    def _extract_plan(response_text: str) -> Optional[List[Any]]:
+        """
+        宽松地从模型输出中提取计划列表，无法提取时返回None
+
+        依次尝试：代码块（python/json/无标注）、文本中第一个 [ 到最后一个 ] 之间的内容，
+        每段分别按Python字面量和JSON解析，并修正中文引号、末尾多余逗号等常见问题；
+        最后退化为按编号列表（1. xxx / - xxx）逐行提取步骤。
+        """
+        candidates = re.findall(r"```(?:python|json|py)?\s*\n?(.*?)```", response_text, re.S)
+        if "[" in response_text and "]" in response_text:
+            candidates.append(response_text[response_text.index("["):response_text.rindex("]") + 1])
+        for candidate in candidates:
+            candidate = candidate.strip()
+            repaired = re.sub(r",\s*([\]}])", r"\1", candidate.translate(_QUOTE_TABLE))
+            for text in (candidate, repaired):
+                for parse in (ast.literal_eval, json.loads):
+                    try:
+                        items = parse(text)
+                    except (ValueError, SyntaxError, TypeError):
+                        continue
+                    if isinstance(items, list) and items:
+                        return items
+
+        lines = [match.group(1).strip() for match in map(_LIST_ITEM_PATTERN.match, response_text.splitlines())
+                 if match]
+        return lines or None
+
+    @staticmethod
+    def _to_plan(items: Optional[List[Any]], response_text: str) -> List[PlanStep]:
+        logger.info(f"✅ 计划已生成:\n{response_text}")
+        if items is None:
+            logger.error(f"❌ 解析计划时出错，原始响应: {response_text}")
             return []
+        return normalize_plan(items)
+
+    @classmethod
+    def _parse_plan(cls, response_text: str) -> List[PlanStep]:
+        """从模型输出中解析计划列表，失败时返回空列表"""
+        return cls._to_plan(cls._extract_plan(response_text), response_text)
 
 
 class Executor:
-    """执行器 - 负责按计划逐步执行"""
+    """
+    执行器 - 负责按依赖关系执行计划
 
-    def __init__(self, llm_client: AgentsLLM, prompt_template: Optional[str] = None):
+    依赖都已完成的步骤立即开始执行，互不依赖的步骤并行，总耗时取决于依赖图的关键路径而不是步骤数；
+    每个步骤的提示词只包含其依赖步骤的结果。计划的最后一步的结果即最终答案。
+    """
+
+    def __init__(self, llm_client: AgentsLLM, prompt_template: Optional[str] = None, max_parallel_steps: int = 4,
+                 context: Optional[StepContext] = None):
+        """
+        Args:
+            llm_client: LLM实例
+            prompt_template: 执行器提示词模板
+            max_parallel_steps: 同时执行的步骤数上限
+            context: 依赖步骤结果的上下文管理，默认使用 StepContext()
+        """
         self.llm_client = llm_client
         self.prompt_template = prompt_template if prompt_template else DEFAULT_EXECUTOR_PROMPT
+        self.max_parallel_steps = max_parallel_steps
+        self.context = context if context else StepContext()
 
-    def execute(self, question: str, plan: List[str], **kwargs) -> str:
+    def execute(self, question: str, plan: List[PlanStep], completed: Optional[Dict[int, str]] = None,
+                on_step: Optional[Callable[[int, str], None]] = None, **kwargs) -> str:
         """
         按计划执行任务
 
+        步骤按计划顺序提交到有界线程池，线程内先等待依赖步骤的结果。依赖总是排在前面，
+        先提交的步骤先获得线程，因此等待不会占满线程池造成死锁。
+
         Args:
             question: 原始问题
             plan: 执行计划
+            completed: 已完成步骤的结果 {步骤编号: 结果}（从检查点恢复时提供），这些步骤不再执行
+            on_step: 每完成一步调用 on_step(步骤编号, 结果)，用于保存检查点
             **kwargs: LLM调用参数
 
         Returns:
             最终答案
         """
-        history = ""
-        final_answer = ""
+        plan = normalize_plan(plan)
+        if not plan:
+            return ""
+        results = dict(completed or {})
+        pending = [step for step in plan if step.id not in results]
 
         logger.info("\n--- 正在执行计划 ---")
-        for i, step in enumerate(plan, 1):
-            logger.info(f"\n-> 正在执行步骤 {i}/{len(plan)}: {step}")
-            prompt = self.prompt_template.format(
-                question=question,
-                plan=plan,
-                history=history if history else "无",
-                current_step=step
-            )
-            messages = [{"role": "user", "content": prompt}]
-
-            response_text = self.llm_client.think(messages, **kwargs) or ""
-
-            history += f"步骤 {i}: {step}\n结果: {response_text}\n\n"
-            final_answer = response_text
-            logger.info(f"✅ 步骤 {i} 已完成，结果: {final_answer}")
+        if pending:
+            futures: Dict[int, Future] = {}
+
+            def run_step(step: PlanStep) -> str:
+                outputs = {dep: results[dep] if dep in results else futures[dep].result() for dep in step.depends_on}
+                logger.info(f"\n-> 正在执行步骤 {step.id}/{len(plan)}: {step.description}")
+                return self._check_result(step, self.llm_client.think(
+                    self._build_messages(question, plan, step, outputs), **kwargs))
+
+            failure: Optional[BaseException] = None
+            pool = ThreadPoolExecutor(max_workers=self.max_parallel_steps, thread_name_prefix="plan-step")
+            try:
+                for step in pending:
+                    # 每个步骤一份上下文副本，保持指标标签等上下文变量
+                    futures[step.id] = pool.submit(contextvars.copy_context().run, run_step, step)
+                step_ids = {future: step_id for step_id, future in futures.items()}
+                # 某一步失败后仍然收集其他步骤的结果，已经完成的LLM调用不会被丢弃
+                for future in as_completed(step_ids):
+                    try:
+                        results[step_ids[future]] = future.result()
+                    except StepFailed as e:
+                        failure = failure or e
+                        continue
+                    if on_step:
+                        on_step(step_ids[future], results[step_ids[future]])
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+            # 与最终答案无关的步骤失败不影响结果
+            if failure is not None and plan[-1].id not in results:
+                raise failure
+
+        return results.get(plan[-1].id, "")
+
+    async def aexecute(self, question: str, plan: List[PlanStep], completed: Optional[Dict[int, str]] = None,
+                       on_step: Optional[Callable[[int, str], None]] = None, **kwargs) -> str:
+        """execute 的异步版本"""
+        plan = normalize_plan(plan)
+        if not plan:
+            return ""
+        results = dict(completed or {})
 
-        return final_answer
+        logger.info("\n--- 正在执行计划 ---")
+        tasks = self._schedule(question, plan, results, on_step, kwargs)
+        try:
+            failure = await self._gather(tasks)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        if failure is not None and plan[-1].id not in results:
+            raise failure
+        return results.get(plan[-1].id, "")
+
+    async def astream(self, question: str, plan: List[PlanStep], completed: Optional[Dict[int, str]] = None,
+                      on_step: Optional[Callable[[int, str], None]] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        异步执行计划，最后一步的回答即最终答案，边生成边产出
+
+        最后一步的依赖一完成就开始流式生成，不等待与它无关的步骤。
+
+        Args:
+            question: 原始问题
+            plan: 执行计划
+            completed: 已完成步骤的结果
+            on_step: 每完成一步的回调
+            **kwargs: LLM调用参数（最后一步只使用 temperature）
+
+        Yields:
+            最终答案片段
+        """
+        plan = normalize_plan(plan)
+        if not plan:
+            return
+        results = dict(completed or {})
+        final = plan[-1]
+        if final.id in results:
+            yield results[final.id]
+            return
+
+        tasks = self._schedule(question, plan, results, on_step, kwargs, skip=final.id)
+        try:
+            try:
+                outputs = {dep: results[dep] if dep in results else await tasks[dep] for dep in final.depends_on}
+            except StepFailed:
+                await self._gather(tasks)
+                raise
+            logger.info(f"\n-> 正在执行步骤 {final.id}/{len(plan)}: {final.description}")
+            messages = self._build_messages(question, plan, final, outputs)
+            collected = []
+            async for chunk in self.llm_client.astream(messages, kwargs.get("temperature", 0)):
+                collected.append(chunk)
+                yield chunk
+            # 没有产出任何内容时才能安全地重新规划
+            self._check_result(final, "".join(collected))
+            if on_step:
+                on_step(final.id, "".join(collected))
+            await self._gather(tasks)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    def _schedule(self, question: str, plan: List[PlanStep], results: Dict[int, str],
+                  on_step: Optional[Callable[[int, str], None]], kwargs: Dict[str, Any],
+                  skip: Optional[int] = None) -> Dict[int, asyncio.Task]:
+        """为每个未完成的步骤创建任务，任务先等待依赖步骤的任务，再在并发上限内调用LLM"""
+        semaphore = asyncio.Semaphore(self.max_parallel_steps)
+        tasks: Dict[int, asyncio.Task] = {}
+
+        async def run_step(step: PlanStep) -> str:
+            outputs = {dep: results[dep] if dep in results else await tasks[dep] for dep in step.depends_on}
+            async with semaphore:
+                logger.info(f"\n-> 正在执行步骤 {step.id}/{len(plan)}: {step.description}")
+                response_text = await self.llm_client.athink(self._build_messages(question, plan, step, outputs),
+                                                             **kwargs)
+            results[step.id] = self._check_result(step, response_text)
+            if on_step:
+                on_step(step.id, response_text)
+            return response_text
+
+        for step in plan:
+            if step.id not in results and step.id != skip:
+                tasks[step.id] = asyncio.ensure_future(run_step(step))
+        return tasks
+
+    @staticmethod
+    async def _gather(tasks: Dict[int, asyncio.Task]) -> Optional[StepFailed]:
+        """等待所有步骤结束（某一步失败时其他仍在执行的步骤照常完成），返回第一个步骤失败"""
+        failure = None
+        for outcome in await asyncio.gather(*tasks.values(), return_exceptions=True):
+            if isinstance(outcome, StepFailed):
+                failure = failure or outcome
+            elif isinstance(outcome, BaseException):
+                raise outcome
+        return failure
+
+    @staticmethod
+    def _check_result(step: PlanStep, result: Optional[str]) -> str:
+        """LLM调用失败时 think 返回None，没有结果的步骤视为失败"""
+        if not result or not result.strip():
+            logger.warning(f"⚠️ 步骤 {step.id} 未得到结果: {step.description}")
+            raise StepFailed(step, "模型没有返回结果")
+        logger.info(f"✅ 步骤 {step.id} 已完成，结果: {result}")
+        return result
+
+    @staticmethod
+    def format_plan(plan: List[PlanStep]) -> str:
+        lines = []
+        for step in plan:
+            dependency = f"（依赖步骤 {', '.join(map(str, step.depends_on))}）" if step.depends_on else ""
+            lines.append(f"{step.id}. {step.description}{dependency}")
+        return "\n".join(lines)
+
+    def _build_messages(self, question: str, plan: List[PlanStep], step: PlanStep,
+                        outputs: Dict[int, str]) -> List[Dict[str, str]]:
+        history = self.context.render(plan, outputs)
+        prompt = self.prompt_template.format(
+            question=question,
+            plan=self.format_plan(plan),
+            history=history if history else "无",
+            current_step=step.description
+        )
+        return [{"role": "user", "content": prompt}]
 
 
 class PlanAndSolveAgent(Agent):
@@ -136,9 +626,9 @@ class PlanAndSolveAgent(Agent):
     Plan and Solve Agent - 分解规划与逐步执行的智能体
 
     这个Agent能够：
-    1. 将复杂问题分解为简单步骤
-    2. 按照计划逐步执行
-    3. 维护执行历史和上下文
+    1. 将复杂问题分解为带依赖关系的简单步骤
+    2. 按依赖关系执行计划，互不依赖的步骤并行
+    3. 每个步骤只携带其依赖步骤的结果
     4. 得出最终答案
 
     特别适合多步骤推理、数学问题、复杂分析等任务。
@@ -150,7 +640,12 @@ class PlanAndSolveAgent(Agent):
             llm: AgentsLLM,
             system_prompt: Optional[str] = None,
             config: Optional[Config] = None,
-            custom_prompts: Optional[Dict[str, str]] = None
+            custom_prompts: Optional[Dict[str, str]] = None,
+            checkpoint_store: Optional[RunCheckpointStore] = None,
+            max_parallel_steps: int = 4,
+            step_context: Optional[StepContext] = None,
+            plan_cache: Optional[PlanCache] = None,
+            max_replans: int = 2
     ):
         """
         初始化PlanAndSolveAgent
@@ -161,6 +656,11 @@ class PlanAndSolveAgent(Agent):
             system_prompt: 系统提示词
             config: 配置对象
             custom_prompts: 自定义提示词模板 {"planner": "", "executor": ""}
+            checkpoint_store: 步骤级检查点存储，run 时传入 run_id 即可在重启后跳过已生成的计划和已完成的步骤
+            max_parallel_steps: 同时执行的互不依赖步骤数上限
+            step_context: 执行器的有界上下文，控制每一步携带的依赖结果（近期原样保留，较早的压缩为摘要）
+            plan_cache: 计划缓存，可在多个Agent实例之间共享，模板化的相似问题直接复用计划
+            max_replans: 步骤失败时最多重新规划的次数，每次只修订剩余步骤，已完成的结果保留
         """
         super().__init__(name, llm, system_prompt, config)
 
@@ -172,15 +672,18 @@ class PlanAndSolveAgent(Agent):
             planner_prompt = None
             executor_prompt = None
 
-        self.planner = Planner(self.llm, planner_prompt)
-        self.executor = Executor(self.llm, executor_prompt)
+        self.planner = Planner(self.llm, planner_prompt, plan_cache)
+        self.executor = Executor(self.llm, executor_prompt, max_parallel_steps, step_context)
+        self.checkpoint_store = checkpoint_store
+        self.max_replans = max_replans
 
-    def run(self, input_text: str, **kwargs) -> str:
+    def run(self, input_text: str, run_id: Optional[str] = None, **kwargs) -> str:
         """
         运行Plan and Solve Agent
 
         Args:
             input_text: 要解决的问题
+            run_id: 运行ID，配置了 checkpoint_store 时用于保存和恢复步骤进度
             **kwargs: 其他参数
 
         Returns:
@@ -188,26 +691,147 @@ class PlanAndSolveAgent(Agent):
         """
         print(f"\n🤖 {self.name} 开始处理问题: {input_text}")
 
-        # 1. 生成计划
-        plan = self.planner.plan(input_text, **kwargs)
+        # 1. 生成计划（或从检查点恢复计划与已完成步骤）
+        state = self._restore(run_id, input_text)
+        if state is not None:
+            plan, results = state
+        else:
+            plan, results = self.planner.plan(input_text, **kwargs), {}
+            self._checkpoint(run_id, input_text, plan, results)
         if not plan:
-            final_answer = "无法生成有效的行动计划，任务终止。"
-            print(f"\n--- 任务终止 ---\n{final_answer}")
+            return self._finish(input_text, None, run_id)
+
+        # 2. 执行计划；某一步失败时保留已完成步骤的结果，只修订剩余部分
+        for replans in range(self.max_replans + 1):
+            try:
+                final_answer = self.executor.execute(input_text, plan, completed=results,
+                                                     on_step=self._step_saver(run_id, input_text, plan, results),
+                                                     **kwargs)
+                return self._finish(input_text, final_answer, run_id)
+            except StepFailed as e:
+                if replans == self.max_replans:
+                    return self._finish(input_text, None, run_id, failure=e)
+                plan, results = self.planner.replan(input_text, plan, results, e, **kwargs)
+                self._checkpoint(run_id, input_text, plan, results)
+
+    async def arun(self, input_text: str, run_id: Optional[str] = None, **kwargs) -> str:
+        """
+        异步运行Plan and Solve Agent
 
-            # 保存到历史记录
-            self.add_message(Message(input_text, "user"))
-            self.add_message(Message(final_answer, "assistant"))
+        Args:
+            input_text: 要解决的问题
+            run_id: 运行ID，配置了 checkpoint_store 时用于保存和恢复步骤进度
+            **kwargs: 其他参数
 
-            return final_answer
+        Returns:
+            最终答案
+        """
+        collected = []
+        async for chunk in self._astream(input_text, stream_last_step=False, run_id=run_id, **kwargs):
+            collected.append(chunk)
+        return "".join(collected)
 
-        # 2. 执行计划
-        final_answer = self.executor.execute(input_text, plan, **kwargs)
-        print(f"\n--- 任务完成 ---\n最终答案: {final_answer}")
+    async def astream(self, input_text: str, run_id: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        异步流式运行，最后一步（即最终答案）边生成边产出
 
-        # 保存到历史记录
-        self.add_message(Message(input_text, "user"))
-        self.add_message(Message(final_answer, "assistant"))
+        Args:
+            input_text: 要解决的问题
+            run_id: 运行ID，配置了 checkpoint_store 时用于保存和恢复步骤进度
+            **kwargs: 其他参数
 
+        Yields:
+            最终答案片段
+        """
+        async for chunk in self._astream(input_text, stream_last_step=True, run_id=run_id, **kwargs):
+            yield chunk
+
+    async def _astream(self, input_text: str, stream_last_step: bool, run_id: Optional[str] = None,
+                       **kwargs) -> AsyncIterator[str]:
+        print(f"\n🤖 {self.name} 开始处理问题: {input_text}")
+
+        state = self._restore(run_id, input_text)
+        if state is not None:
+            plan, results = state
+        else:
+            plan, results = await self.planner.aplan(input_text, **kwargs), {}
+            self._checkpoint(run_id, input_text, plan, results)
+        if not plan:
+            yield self._finish(input_text, None, run_id)
+            return
+
+        for replans in range(self.max_replans + 1):
+            on_step = self._step_saver(run_id, input_text, plan, results)
+            try:
+                if stream_last_step:
+                    # 最后一步没有产出任何内容时才会失败，因此重新规划不会产生重复的输出
+                    collected = []
+                    async for chunk in self.executor.astream(input_text, plan, completed=results, on_step=on_step,
+                                                             **kwargs):
+                        collected.append(chunk)
+                        yield chunk
+                    self._finish(input_text, "".join(collected), run_id)
+                else:
+                    final_answer = await self.executor.aexecute(input_text, plan, completed=results, on_step=on_step,
+                                                                **kwargs)
+                    yield self._finish(input_text, final_answer, run_id)
+                return
+            except StepFailed as e:
+                if replans == self.max_replans:
+                    yield self._finish(input_text, None, run_id, failure=e)
+                    return
+                plan, results = await self.planner.areplan(input_text, plan, results, e, **kwargs)
+                self._checkpoint(run_id, input_text, plan, results)
+
+    def _restore(self, run_id: Optional[str], input_text: str):
+        """有可用检查点时返回 (计划, 已完成步骤的结果)，否则返回None"""
+        state = restore_state(self.checkpoint_store, run_id, "plan_solve", input_text)
+        if state is None:
+            return None
+        print(f"♻️ 从检查点恢复运行 {run_id}：计划共 {len(state['plan'])} 步，已完成 {len(state['results'])} 步")
+        # JSON对象的键只能是字符串
+        return normalize_plan(state["plan"]), {int(step_id): result for step_id, result in state["results"].items()}
+
+    def _checkpoint(self, run_id: Optional[str], input_text: str, plan: List[PlanStep], results: Dict[int, str]):
+        if self.checkpoint_store is not None and run_id is not None and plan:
+            self.checkpoint_store.save(run_id, {
+                "agent": "plan_solve",
+                "input": input_text,
+                "plan": [step.model_dump() for step in plan],
+                "results": {str(step_id): result for step_id, result in results.items()}
+            })
+
+    def _step_saver(self, run_id: Optional[str], input_text: str, plan: List[PlanStep],
+                    results: Dict[int, str]) -> Callable[[int, str], None]:
+        """返回执行器的 on_step 回调：记录步骤结果并保存检查点"""
+        def on_step(step_id: int, result: str):
+            results[step_id] = result
+            self._checkpoint(run_id, input_text, plan, results)
+
+        return on_step
+
+    def _finish(self, input_text: str, final_answer: Optional[str], run_id: Optional[str],
+                failure: Optional[StepFailed] = None) -> str:
+        """
+        结束任务并保存到历史记录
+
+        final_answer 为None表示任务终止：未能生成计划，或重新规划次数用完后仍有步骤失败。
+        后一种情况保留检查点，之后可以用同一个 run_id 从已完成的步骤继续。
+        """
+        if failure is not None:
+            final_answer = f"{failure}，重新规划 {self.max_replans} 次后仍未完成，任务终止。"
+            print(f"\n--- 任务终止 ---\n{final_answer}")
+        elif final_answer is None:
+            final_answer = "无法生成有效的行动计划，任务终止。"
+            print(f"\n--- 任务终止 ---\n{final_answer}")
+        else:
+            print(f"\n--- 任务完成 ---\n最终答案: {final_answer}")
+        if self.checkpoint_store is not None and run_id is not None and failure is None:
+            self.checkpoint_store.delete(run_id)
+
+        # 保存到历史记录
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(final_answer or "", "assistant"))
         return final_answer
 
 if __name__ == "__main__":
@@ -6,11 +6,12 @@
 # @Software: PyCharm
 
 import re
-from typing import Optional, List, Tuple
+from typing import Optional, List, Dict, Tuple
 from core.agent import Agent
 from core.llm import AgentsLLM
 from core.config import Config
-from core.message import Message
+from core.message import FastMessage
+from core.run_checkpoint import RunCheckpointStore, restore_state
 from tools.registry import ToolRegistry
 
 # 默认ReAct提示词模板
@@ -41,6 +42,72 @@ Action: 选择合适的工具获取信息，格式为：
 
 现在开始你的推理和行动："""
 
+# 模型常在Action之后继续编造Observation和后续步骤，遇到这些序列时由服务端截断
+DEFAULT_STOP_SEQUENCES = ["\nObservation:", "\nObservation："]
+
+
+class ReActStreamParser:
+    """
+    ReAct输出的增量解析器
+
+    逐片段接收模型输出，一旦出现完整的 `Action: 工具名[...]`（包括 `Finish[...]`）就判定本步结束，
+    调用方可以立即断开连接，不再为之后生成的内容付费。方括号按嵌套深度匹配，参数中可以包含成对的方括号。
+    """
+
+    _ACTION_PATTERN = re.compile(r"Action:\s*\w+\[")
+
+    def __init__(self):
+        self.text = ""
+        self.end: Optional[int] = None
+        # 下一次查找 Action 的起点（当前未完成行的行首）
+        self._search_from = 0
+        # 找到 Action 后，方括号扫描的位置与深度
+        self._scan_from: Optional[int] = None
+        self._depth = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    @property
+    def result(self) -> str:
+        """截止到完整Action为止的输出；尚未完整时返回已收到的全部内容"""
+        return self.text[:self.end] if self.end is not None else self.text
+
+    def feed(self, chunk: str) -> bool:
+        """
+        接收一个输出片段
+
+        Args:
+            chunk: 新的输出片段
+
+        Returns:
+            是否已经收到完整的Action
+        """
+        if self.end is not None:
+            return True
+        self.text += chunk
+
+        if self._scan_from is None:
+            match = self._ACTION_PATTERN.search(self.text, self._search_from)
+            if match is None:
+                self._search_from = self.text.rfind("\n", self._search_from) + 1
+                return False
+            self._scan_from = match.end()
+            self._depth = 1
+
+        for index in range(self._scan_from, len(self.text)):
+            char = self.text[index]
+            if char == "[":
+                self._depth += 1
+            elif char == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = index + 1
+                    return True
+        self._scan_from = len(self.text)
+        return False
+
 
 class ReActAgent(Agent):
     """
@@ -63,7 +130,10 @@ class ReActAgent(Agent):
             system_prompt: Optional[str] = None,
             config: Optional[Config] = None,
             max_steps: int = 5,
-            custom_prompt: Optional[str] = None
+            custom_prompt: Optional[str] = None,
+            early_stop: bool = True,
+            stop_sequences: Optional[List[str]] = None,
+            checkpoint_store: Optional[RunCheckpointStore] = None
     ):
         """
         初始化ReActAgent
@@ -76,6 +146,9 @@ class ReActAgent(Agent):
             config: 配置对象
             max_steps: 最大执行步数
             custom_prompt: 自定义提示词模板
+            early_stop: 是否在收到完整的Action后立即停止生成
+            stop_sequences: 停止序列，默认截断模型编造的Observation
+            checkpoint_store: 步骤级检查点存储，run 时传入 run_id 即可在重启后从最后完成的步骤继续
         """
         super().__init__(name, llm, system_prompt, config)
 
@@ -87,6 +160,9 @@ class ReActAgent(Agent):
 
         self.max_steps = max_steps
         self.current_history: List[str] = []
+        self.early_stop = early_stop
+        self.stop_sequences = stop_sequences if stop_sequences is not None else DEFAULT_STOP_SEQUENCES
+        self.checkpoint_store = checkpoint_store
 
         # 设置提示词模板：用户自定义优先，否则使用默认模板
         self.prompt_template = custom_prompt if custom_prompt else DEFAULT_REACT_PROMPT
@@ -122,19 +198,19 @@ class ReActAgent(Agent):
         else:
             self.tool_registry.register_tool(tool)
 
-    def run(self, input_text: str, **kwargs) -> str:
+    def run(self, input_text: str, run_id: Optional[str] = None, **kwargs) -> str:
         """
         运行ReAct Agent
 
         Args:
             input_text: 用户问题
+            run_id: 运行ID，配置了 checkpoint_store 时用于保存和恢复步骤进度
             **kwargs: 其他参数
 
         Returns:
             最终答案
         """
-        self.current_history = []
-        current_step = 0
+        current_step = self._restore(run_id, input_text)
 
         print(f"\n🤖 {self.name} 开始处理问题: {input_text}")
 
@@ -142,66 +218,156 @@ class ReActAgent(Agent):
             current_step += 1
             print(f"\n--- 第 {current_step} 步 ---")
 
-            # 构建提示词
-            tools_desc = self.tool_registry.get_tools_description()
-            history_str = "\n".join(self.current_history)
-            prompt = self.prompt_template.format(
-                tools=tools_desc,
-                question=input_text,
-                history=history_str
-            )
-
-            # 调用LLM
-            messages = [{"role": "user", "content": prompt}]
-            response_text = self.llm.think(messages, **kwargs)
-
-            if not response_text:
-                print("❌ 错误：LLM未能返回有效响应。")
+            # 调用LLM：流式解析，收到完整的Action后立即停止生成
+            messages = self._build_step_messages(input_text)
+            if self.early_stop:
+                parser = ReActStreamParser()
+                response_text = self.llm.think(messages, stop=self.stop_sequences, stop_when=parser.feed, **kwargs)
+            else:
+                parser, response_text = None, self.llm.think(messages, **kwargs)
+
+            step = self._handle_response(response_text, parser)
+            if step is None:
                 break
+            action, tool_name, tool_input = step
+
+            # 检查是否完成
+            if tool_name == "Finish":
+                return self._finish(input_text, tool_input, run_id)
+            if tool_name is not None:
+                # 调用工具
+                observation = self.tool_registry.execute_tool(tool_name, tool_input)
+                self._record_observation(action, observation)
+            self._checkpoint(run_id, input_text, current_step)
+
+        return self._finish(input_text, None, run_id)
 
-            # 解析输出
-            thought, action = self._parse_output(response_text)
+    async def arun(self, input_text: str, run_id: Optional[str] = None, **kwargs) -> str:
+        """
+        异步运行ReAct Agent，LLM调用和工具调用都不占用线程
+
+        Args:
+            input_text: 用户问题
+            run_id: 运行ID，配置了 checkpoint_store 时用于保存和恢复步骤进度
+            **kwargs: 其他参数
+
+        Returns:
+            最终答案
+        """
+        current_step = self._restore(run_id, input_text)
 
-            if thought:
-                print(f"🤔 思考: {thought}")
+        print(f"\n🤖 {self.name} 开始处理问题: {input_text}")
 
-            if not action:
-                print("⚠️ 警告：未能解析出有效的Action，流程终止。")
+        while current_step < self.max_steps:
+            current_step += 1
+            print(f"\n--- 第 {current_step} 步 ---")
+
+            messages = self._build_step_messages(input_text)
+            if self.early_stop:
+                parser = ReActStreamParser()
+                response_text = await self.llm.athink(messages, stop=self.stop_sequences, stop_when=parser.feed,
+                                                      **kwargs)
+            else:
+                parser, response_text = None, await self.llm.athink(messages, **kwargs)
+
+            step = self._handle_response(response_text, parser)
+            if step is None:
                 break
+            action, tool_name, tool_input = step
+
+            if tool_name == "Finish":
+                return self._finish(input_text, tool_input, run_id)
+            if tool_name is not None:
+                observation = await self.tool_registry.aexecute_tool(tool_name, tool_input)
+                self._record_observation(action, observation)
+            self._checkpoint(run_id, input_text, current_step)
+
+        return self._finish(input_text, None, run_id)
+
+    def _build_step_messages(self, input_text: str) -> List[Dict[str, str]]:
+        """根据工具、问题和执行历史构建本步的提示词"""
+        prompt = self.prompt_template.format(
+            tools=self.tool_registry.get_tools_description(),
+            question=input_text,
+            history="\n".join(self.current_history)
+        )
+        return [{"role": "user", "content": prompt}]
+
+    def _handle_response(self, response_text: Optional[str], parser: Optional[ReActStreamParser]
+                         ) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        解析一步的模型输出
 
-            # 检查是否完成
-            if action.startswith("Finish"):
-                final_answer = self._parse_action_input(action)
-                print(f"🎉 最终答案: {final_answer}")
+        Returns:
+            None 表示流程终止；否则为 (action, 工具名, 工具输入)，
+            完成时工具名为 "Finish"、工具输入为最终答案，Action格式无效时工具名为None
+        """
+        if not response_text:
+            print("❌ 错误：LLM未能返回有效响应。")
+            return None
+        if parser is not None and parser.complete:
+            response_text = parser.result
+
+        # 解析输出
+        thought, action = self._parse_output(response_text)
 
-                # 保存到历史记录
-                self.add_message(Message(input_text, "user"))
-                self.add_message(Message(final_answer, "assistant"))
+        if thought:
+            print(f"🤔 思考: {thought}")
 
-                return final_answer
+        if not action:
+            print("⚠️ 警告：未能解析出有效的Action，流程终止。")
+            return None
 
-            # 执行工具调用
-            tool_name, tool_input = self._parse_action(action)
-            if not tool_name or tool_input is None:
-                self.current_history.append("Observation: 无效的Action格式，请检查。")
-                continue
+        if action.startswith("Finish"):
+            return action, "Finish", self._parse_action_input(action)
 
-            print(f"🎬 行动: {tool_name}[{tool_input}]")
+        tool_name, tool_input = self._parse_action(action)
+        if not tool_name or tool_input is None:
+            self.current_history.append("Observation: 无效的Action格式，请检查。")
+            return action, None, None
 
-            # 调用工具
-            observation = self.tool_registry.execute_tool(tool_name, tool_input)
-            print(f"👀 观察: {observation}")
+        print(f"🎬 行动: {tool_name}[{tool_input}]")
+        return action, tool_name, tool_input
 
-            # 更新历史
-            self.current_history.append(f"Action: {action}")
-            self.current_history.append(f"Observation: {observation}")
+    def _record_observation(self, action: str, observation: str):
+        """记录工具调用与观察结果"""
+        print(f"👀 观察: {observation}")
+        self.current_history.append(f"Action: {action}")
+        self.current_history.append(f"Observation: {observation}")
 
-        print("⏰ 已达到最大步数，流程终止。")
-        final_answer = "抱歉，我无法在限定步数内完成这个任务。"
+    def _restore(self, run_id: Optional[str], input_text: str) -> int:
+        """重置执行历史，有可用检查点时恢复，返回已完成的步数"""
+        self.current_history = []
+        state = restore_state(self.checkpoint_store, run_id, "react", input_text)
+        if state is None:
+            return 0
+        self.current_history = list(state["history"])
+        print(f"♻️ 从检查点恢复运行 {run_id}：已完成 {state['step']} 步")
+        return state["step"]
+
+    def _checkpoint(self, run_id: Optional[str], input_text: str, step: int):
+        """一步完成后保存执行历史（包含工具观察结果）"""
+        if self.checkpoint_store is not None and run_id is not None:
+            self.checkpoint_store.save(run_id, {
+                "agent": "react",
+                "input": input_text,
+                "step": step,
+                "history": self.current_history
+            })
+
+    def _finish(self, input_text: str, final_answer: Optional[str], run_id: Optional[str] = None) -> str:
+        """结束流程并保存到历史记录，final_answer 为None表示未能在限定步数内完成"""
+        if self.checkpoint_store is not None and run_id is not None:
+            self.checkpoint_store.delete(run_id)
+        if final_answer is None:
+            print("⏰ 已达到最大步数，流程终止。")
+            final_answer = "抱歉，我无法在限定步数内完成这个任务。"
+        else:
+            print(f"🎉 最终答案: {final_answer}")
 
         # 保存到历史记录
-        self.add_message(Message(input_text, "user"))
-        self.add_message(Message(final_answer, "assistant"))
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(final_answer or "", "assistant"))
 
         return final_answer
 
@@ -5,11 +5,11 @@
 # @File    : reflection_agent.py
 # @Software: PyCharm
 
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Generator
 from core.agent import Agent
 from core.llm import AgentsLLM
 from core.config import Config
-from core.message import Message
+from core.message import FastMessage
 
 # 默认提示词模板
 DEFAULT_PROMPTS = {
@@ -133,6 +133,46 @@ class ReflectionAgent(Agent):
         Returns:
             最终优化后的结果
         """
+        steps = self._reflection_steps(input_text)
+        try:
+            prompt = next(steps)
+            while True:
+                prompt = steps.send(self._get_llm_response(prompt, **kwargs))
+        except StopIteration as done:
+            return done.value
+
+    async def arun(self, input_text: str, **kwargs) -> str:
+        """
+        异步运行Reflection Agent，流程与 run 相同
+
+        Args:
+            input_text: 任务描述
+            **kwargs: 其他参数
+
+        Returns:
+            最终优化后的结果
+        """
+        steps = self._reflection_steps(input_text)
+        try:
+            prompt = next(steps)
+            while True:
+                prompt = steps.send(await self._aget_llm_response(prompt, **kwargs))
+        except StopIteration as done:
+            return done.value
+
+    def _reflection_steps(self, input_text: str) -> Generator[str, str, str]:
+        """
+        执行-反思-优化循环，run 与 arun 共用
+
+        每次需要调用LLM时 yield 提示词，由调用方把LLM响应 send 回来，
+        同步和异步版本只在如何获取响应上不同。
+
+        Args:
+            input_text: 任务描述
+
+        Returns:
+            最终优化后的结果（通过 StopIteration.value 返回）
+        """
         print(f"\n🤖 {self.name} 开始处理任务: {input_text}")
 
         # 重置记忆
@@ -140,8 +180,7 @@ class ReflectionAgent(Agent):
 
         # 1. 初始执行
         print("\n--- 正在进行初始尝试 ---")
-        initial_prompt = self.prompts["initial"].format(task=input_text)
-        initial_result = self._get_llm_response(initial_prompt, **kwargs)
+        initial_result = yield self.prompts["initial"].format(task=input_text)
         self.memory.add_record("execution", initial_result)
 
         # 2. 迭代循环：反思与优化
@@ -151,11 +190,10 @@ class ReflectionAgent(Agent):
             # a. 反思
             print("\n-> 正在进行反思...")
             last_result = self.memory.get_last_execution()
-            reflect_prompt = self.prompts["reflect"].format(
+            feedback = yield self.prompts["reflect"].format(
                 task=input_text,
                 content=last_result
             )
-            feedback = self._get_llm_response(reflect_prompt, **kwargs)
             self.memory.add_record("reflection", feedback)
 
             # b. 检查是否需要停止
@@ -165,20 +203,19 @@ class ReflectionAgent(Agent):
 
             # c. 优化
             print("\n-> 正在进行优化...")
-            refine_prompt = self.prompts["refine"].format(
+            refined_result = yield self.prompts["refine"].format(
                 task=input_text,
                 last_attempt=last_result,
                 feedback=feedback
             )
-            refined_result = self._get_llm_response(refine_prompt, **kwargs)
             self.memory.add_record("execution", refined_result)
 
         final_result = self.memory.get_last_execution()
         print(f"\n--- 任务完成 ---\n最终结果:\n{final_result}")
 
         # 保存到历史记录
-        self.add_message(Message(input_text, "user"))
-        self.add_message(Message(final_result, "assistant"))
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(final_result or "", "assistant"))
 
         return final_result
 
@@ -187,6 +224,11 @@ class ReflectionAgent(Agent):
         messages = [{"role": "user", "content": prompt}]
         return self.llm.think(messages, **kwargs) or ""
 
+    async def _aget_llm_response(self, prompt: str, **kwargs) -> str:
+        """_get_llm_response 的异步版本"""
+        messages = [{"role": "user", "content": prompt}]
+        return await self.llm.athink(messages, **kwargs) or ""
+
 if __name__ == "__main__":
     from core.llm import AgentsLLM
 
@@ -7,18 +7,74 @@
 
 """简单Agent实现 - 基于OpenAI原生API"""
 
-from typing import Optional, Iterator, TYPE_CHECKING
+from typing import Optional, Iterator, AsyncIterator, Iterable, List, Dict, Tuple, Union, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
 import re
+import asyncio
+import json
+import time
+import weakref
 
 from core.agent import Agent
 from core.llm import AgentsLLM
 from core.config import Config
-from core.message import Message
+from core.message import FastMessage
+from core.stream import TeeSink, CallbackSink
 
 # if TYPE_CHECKING:
 #     from tools.registry import ToolRegistry
 
 
+TOOL_CALL_PATTERN = re.compile(r'\[TOOL_CALL:([^:]+):([^\]]+)\]')
+TOOL_CALL_PREFIX = "[TOOL_CALL:"
+
+
+class ToolCallStreamParser:
+    """
+    工具调用标记的增量检测器
+
+    逐片段接收模型输出，每当一个 `[TOOL_CALL:name:params]` 的右方括号到达，
+    就立即返回该工具调用，调用方可以在模型继续生成的同时开始执行工具。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.calls: List[Dict[str, str]] = []
+        # 下一次查找的起点：已完成标记之后，或尚未闭合的标记开头
+        self._scan_from = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        """
+        接收一个输出片段
+
+        Args:
+            chunk: 新的输出片段
+
+        Returns:
+            本次新完成的工具调用列表
+        """
+        self.text += chunk
+        new_calls = []
+        for match in TOOL_CALL_PATTERN.finditer(self.text, self._scan_from):
+            tool_name, parameters = match.groups()
+            new_calls.append({
+                'tool_name': tool_name.strip(),
+                'parameters': parameters.strip(),
+                'original': match.group(0)
+            })
+            self._scan_from = match.end()
+
+        pending = self.text.find(TOOL_CALL_PREFIX, self._scan_from)
+        if pending != -1:
+            self._scan_from = pending
+        else:
+            # 末尾可能是标记前缀的一部分（如 "[TOOL_"），保留这一段等待后续片段
+            self._scan_from = max(self._scan_from, len(self.text) - len(TOOL_CALL_PREFIX) + 1)
+
+        self.calls.extend(new_calls)
+        return new_calls
+
+
 class SimpleAgent(Agent):
     """简单的对话Agent，支持可选的工具调用"""
 
@@ -29,7 +85,11 @@ class SimpleAgent(Agent):
             system_prompt: Optional[str] = None,
             config: Optional[Config] = None,
             tool_registry: Optional['ToolRegistry'] = None,
-            enable_tool_calling: bool = True
+            enable_tool_calling: bool = True,
+            speculative_tool_calls: bool = True,
+            max_tool_workers: int = 4,
+            tool_timeout: Optional[float] = 30.0,
+            function_calling: bool = False
     ):
         """
         初始化SimpleAgent
@@ -41,10 +101,23 @@ class SimpleAgent(Agent):
             config: 配置对象
             tool_registry: 工具注册表（可选，如果提供则启用工具调用）
             enable_tool_calling: 是否启用工具调用（只有在提供tool_registry时生效）
+            speculative_tool_calls: 是否在模型仍在生成时，检测到完整的工具调用标记就立即执行
+            max_tool_workers: 同时执行的工具调用数上限
+            tool_timeout: 单个工具调用的超时时间（秒，从提交开始计时，包含排队），None表示不限
+            function_calling: 是否使用原生 function calling（通过 tools= 传递工具定义），
+                              否则在系统提示词中描述工具并解析文本标记
         """
         super().__init__(name, llm, system_prompt, config)
         self.tool_registry = tool_registry
         self.enable_tool_calling = enable_tool_calling and tool_registry is not None
+        self.speculative_tool_calls = speculative_tool_calls
+        self.max_tool_workers = max_tool_workers
+        self.tool_timeout = tool_timeout
+        self.function_calling = function_calling
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
+        # asyncio.Semaphore 绑定首次使用它的事件循环，按循环分别创建，同一个Agent可在多个循环中使用
+        self._tool_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
 
     def _get_enhanced_system_prompt(self) -> str:
         """构建增强的系统提示词，包含工具信息"""
@@ -85,8 +158,7 @@ class SimpleAgent(Agent):
 
     def _parse_tool_calls(self, text: str) -> list:
         """解析文本中的工具调用"""
-        pattern = r'\[TOOL_CALL:([^:]+):([^\]]+)\]'
-        matches = re.findall(pattern, text)
+        matches = TOOL_CALL_PATTERN.findall(text)
 
         tool_calls = []
         for tool_name, parameters in matches:
@@ -98,8 +170,8 @@ class SimpleAgent(Agent):
 
         return tool_calls
 
-    def _execute_tool_call(self, tool_name: str, parameters: str) -> str:
-        """执行工具调用"""
+    def _execute_tool_call(self, tool_name: str, parameters: Union[str, dict]) -> str:
+        """执行工具调用，parameters 为文本标记中的参数字符串或 function calling 的参数字典"""
         if not self.tool_registry:
             return f"❌ 错误：未配置工具注册表"
 
@@ -107,18 +179,194 @@ class SimpleAgent(Agent):
             # 获取Tool对象
             tool = self.tool_registry.get_tool(tool_name)
             if not tool:
-                return f"❌ 错误：未找到工具 '{tool_name}'"
-
-            # 智能参数解析
-            param_dict = self._parse_tool_parameters(tool_name, parameters)
+                # 函数工具只接受一个字符串输入
+                func = self.tool_registry.get_function(tool_name)
+                if func is None:
+                    return f"❌ 错误：未找到工具 '{tool_name}'"
+                return f"🔧 工具 {tool_name} 执行结果：\n{func(self._function_input(parameters))}"
 
             # 调用工具
-            result = tool.run(param_dict)
+            result = tool.run(self._prepare_parameters(tool_name, parameters))
             return f"🔧 工具 {tool_name} 执行结果：\n{result}"
 
         except Exception as e:
             return f"❌ 工具调用失败：{str(e)}"
 
+    async def _aexecute_tool_call(self, tool_name: str, parameters: Union[str, dict]) -> str:
+        """_execute_tool_call 的异步版本"""
+        if not self.tool_registry:
+            return f"❌ 错误：未配置工具注册表"
+
+        try:
+            tool = self.tool_registry.get_tool(tool_name)
+            if not tool:
+                func = self.tool_registry.get_function(tool_name)
+                if func is None:
+                    return f"❌ 错误：未找到工具 '{tool_name}'"
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(self._function_input(parameters))
+                else:
+                    result = await asyncio.to_thread(func, self._function_input(parameters))
+                return f"🔧 工具 {tool_name} 执行结果：\n{result}"
+
+            result = await tool.arun(self._prepare_parameters(tool_name, parameters))
+            return f"🔧 工具 {tool_name} 执行结果：\n{result}"
+
+        except Exception as e:
+            return f"❌ 工具调用失败：{str(e)}"
+
+    @staticmethod
+    def _function_input(parameters: Union[str, dict]) -> str:
+        """函数工具只接受一个字符串输入"""
+        return str(parameters.get("input", "") if isinstance(parameters, dict) else parameters)
+
+    def _prepare_parameters(self, tool_name: str, parameters: Union[str, dict]) -> dict:
+        """智能参数解析：function calling 的参数已经是字典，只需类型转换"""
+        if isinstance(parameters, dict):
+            return self._convert_parameter_types(tool_name, parameters)
+        return self._parse_tool_parameters(tool_name, parameters)
+
+    def _get_tool_executor(self) -> ThreadPoolExecutor:
+        """工具执行线程池，首次使用时创建"""
+        if self._tool_executor is None:
+            self._tool_executor = ThreadPoolExecutor(max_workers=self.max_tool_workers,
+                                                     thread_name_prefix=f"{self.name}-tool")
+        return self._tool_executor
+
+    def close(self):
+        """关闭工具线程池：不再等待正在运行的调用，尚未开始的调用被取消；之后再次使用会重新创建"""
+        executor, self._tool_executor = self._tool_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __del__(self):
+        if getattr(self, "_tool_executor", None) is not None:
+            self.close()
+
+    def _submit_tool_call(self, call: dict) -> Tuple[Future, float]:
+        """提交一个工具调用到线程池，返回 (Future, 提交时间)"""
+        future = self._get_tool_executor().submit(self._execute_tool_call, call['tool_name'], call['parameters'])
+        return future, time.monotonic()
+
+    def _execute_tool_calls(self, tool_calls: List[dict],
+                            dispatched: Iterable[Tuple[dict, Tuple[Future, float]]] = ()) -> List[str]:
+        """
+        并发执行多个工具调用，按原始顺序返回结果
+
+        已经提前提交的调用直接等待其结果，其余调用一次性全部提交到有界线程池，
+        总耗时约为最慢的那个调用而不是所有调用之和。超时的调用返回错误信息，不影响其他调用。
+
+        Args:
+            tool_calls: 按出现顺序排列的工具调用
+            dispatched: 已提交的 (工具调用, (Future, 提交时间))
+
+        Returns:
+            与 tool_calls 一一对应的结果文本
+        """
+        submitted: Dict[str, List[Tuple[Future, float]]] = {}
+        for call, handle in dispatched:
+            submitted.setdefault(call['original'], []).append(handle)
+
+        handles = []
+        for call in tool_calls:
+            pending = submitted.get(call['original'])
+            handles.append(pending.pop(0) if pending else self._submit_tool_call(call))
+
+        results = []
+        for call, (future, submitted_at) in zip(tool_calls, handles):
+            timeout = None
+            if self.tool_timeout is not None:
+                timeout = max(0.0, submitted_at + self.tool_timeout - time.monotonic())
+            try:
+                results.append(future.result(timeout=timeout))
+            except FutureTimeoutError:
+                # 线程无法被强制终止，只能放弃等待；尚未开始的调用会被取消
+                future.cancel()
+                results.append(f"❌ 工具 {call['tool_name']} 执行超时（{self.tool_timeout}秒）")
+        return results
+
+    def _think_with_speculative_tools(self, messages: list, **kwargs) -> Tuple[Optional[str], list]:
+        """
+        流式调用LLM，同时增量检测工具调用
+
+        每个工具调用标记一闭合就提交到线程池执行，工具延迟被隐藏在剩余的生成时间里。
+
+        Returns:
+            (完整响应, [(工具调用, (Future, 提交时间)), ...])
+        """
+        parser = ToolCallStreamParser()
+        dispatched = []
+
+        def on_chunk(chunk: str):
+            for call in parser.feed(chunk):
+                print(f"⚡ 提前执行工具调用: {call['original']}")
+                dispatched.append((call, self._submit_tool_call(call)))
+
+        sink = TeeSink(kwargs.pop("sink", None) or self.llm.stream_sink, CallbackSink(on_chunk))
+        response = self.llm.think(messages, sink=sink, **kwargs)
+        if response is None:
+            for _, (future, _) in dispatched:
+                future.cancel()
+        return response, dispatched
+
+    def _asubmit_tool_call(self, call: dict) -> Tuple[asyncio.Task, float]:
+        """_submit_tool_call 的异步版本，通过信号量限制同时执行的工具调用数"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._tool_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._tool_semaphores[loop] = asyncio.Semaphore(self.max_tool_workers)
+
+        async def bounded() -> str:
+            async with semaphore:
+                return await self._aexecute_tool_call(call['tool_name'], call['parameters'])
+
+        return loop.create_task(bounded()), time.monotonic()
+
+    async def _aexecute_tool_calls(self, tool_calls: List[dict],
+                                   dispatched: Iterable[Tuple[dict, Tuple[asyncio.Task, float]]] = ()) -> List[str]:
+        """_execute_tool_calls 的异步版本，超时的调用会被直接取消"""
+        submitted: Dict[str, List[Tuple[asyncio.Task, float]]] = {}
+        for call, handle in dispatched:
+            submitted.setdefault(call['original'], []).append(handle)
+
+        handles = []
+        for call in tool_calls:
+            pending = submitted.get(call['original'])
+            handles.append(pending.pop(0) if pending else self._asubmit_tool_call(call))
+
+        results = []
+        for call, (task, submitted_at) in zip(tool_calls, handles):
+            timeout = None
+            if self.tool_timeout is not None:
+                timeout = max(0.0, submitted_at + self.tool_timeout - time.monotonic())
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if task in done:
+                results.append(task.result())
+            else:
+                task.cancel()
+                results.append(f"❌ 工具 {call['tool_name']} 执行超时（{self.tool_timeout}秒）")
+        return results
+
+    async def _athink_with_speculative_tools(self, messages: list, **kwargs) -> Tuple[Optional[str], list]:
+        """_think_with_speculative_tools 的异步版本"""
+        parser = ToolCallStreamParser()
+        dispatched = []
+
+        def on_chunk(chunk: str):
+            for call in parser.feed(chunk):
+                print(f"⚡ 提前执行工具调用: {call['original']}")
+                dispatched.append((call, self._asubmit_tool_call(call)))
+
+        sink = CallbackSink(on_chunk)
+        caller_sink = kwargs.pop("sink", None)
+        if caller_sink is not None:
+            sink = TeeSink(caller_sink, sink)
+        response = await self.llm.athink(messages, sink=sink, **kwargs)
+        if response is None:
+            for _, (task, _) in dispatched:
+                task.cancel()
+        return response, dispatched
+
     def _parse_tool_parameters(self, tool_name: str, parameters: str) -> dict:
         """智能解析工具参数"""
         import json
@@ -263,25 +511,18 @@ class SimpleAgent(Agent):
         Returns:
             Agent响应
         """
-        # 构建消息列表
-        messages = []
+        if self.enable_tool_calling and self.function_calling:
+            return self._run_function_calling(input_text, max_tool_iterations, **kwargs)
 
-        # 添加系统消息（可能包含工具信息）
+        # 在上下文预算内构建消息列表：系统消息（可能包含工具信息）+ 历史消息 + 当前用户消息
         enhanced_system_prompt = self._get_enhanced_system_prompt()
-        messages.append({"role": "system", "content": enhanced_system_prompt})
-
-        # 添加历史消息
-        for msg in self._history:
-            messages.append({"role": msg.role, "content": msg.content})
-
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": input_text})
+        messages = self.build_messages(input_text, enhanced_system_prompt)
 
         # 如果没有启用工具调用，使用原有逻辑
         if not self.enable_tool_calling:
             response = self.llm.think(messages, **kwargs)
-            self.add_message(Message(input_text, "user"))
-            self.add_message(Message(response, "assistant"))
+            self.add_message(FastMessage(input_text, "user"))
+            self.add_message(FastMessage(response or "", "assistant"))
             return response
 
         # 迭代处理，支持多轮工具调用
@@ -289,21 +530,22 @@ class SimpleAgent(Agent):
         final_response = ""
 
         while current_iteration < max_tool_iterations:
-            # 调用LLM
-            response = self.llm.think(messages, **kwargs)
+            # 调用LLM（推测执行模式下，工具在生成过程中就已经开始执行）
+            if self.speculative_tool_calls:
+                response, dispatched = self._think_with_speculative_tools(messages, **kwargs)
+            else:
+                response, dispatched = self.llm.think(messages, **kwargs), []
 
             # 检查是否有工具调用
-            tool_calls = self._parse_tool_calls(response)
+            tool_calls = self._parse_tool_calls(response or "")
 
             if tool_calls:
-                # 执行所有工具调用并收集结果
-                tool_results = []
-                clean_response = response
+                # 并发执行所有工具调用并按顺序收集结果，已提前执行的直接等待结果
+                tool_results = self._execute_tool_calls(tool_calls, dispatched)
 
+                # 从响应中移除工具调用标记
+                clean_response = response
                 for call in tool_calls:
-                    result = self._execute_tool_call(call['tool_name'], call['parameters'])
-                    tool_results.append(result)
-                    # 从响应中移除工具调用标记
                     clean_response = clean_response.replace(call['original'], "")
 
                 # 构建包含工具结果的消息
@@ -326,11 +568,156 @@ class SimpleAgent(Agent):
             final_response = self.llm.think(messages, **kwargs)
 
         # 保存到历史记录
-        self.add_message(Message(input_text, "user"))
-        self.add_message(Message(final_response, "assistant"))
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(final_response or "", "assistant"))
 
         return final_response
 
+    def _run_function_calling(self, input_text: str, max_tool_iterations: int = 3, **kwargs) -> str:
+        """
+        原生 function calling 模式
+
+        工具定义通过 tools= 传递，系统提示词中不再包含工具说明；模型返回结构化的 tool_calls，
+        一轮中的多个调用并发执行，结果以 tool 消息按顺序回传。
+
+        Args:
+            input_text: 用户输入
+            max_tool_iterations: 最大工具调用轮数
+            **kwargs: 其他参数（目前只使用 temperature）
+
+        Returns:
+            Agent响应
+        """
+        messages = self.build_messages(input_text, self.system_prompt or "你是一个有用的AI助手。")
+        tools = self.tool_registry.to_openai_schema()
+        temperature = kwargs.get("temperature", 0)
+        final_response = None
+
+        for _ in range(max_tool_iterations):
+            message = self.llm.invoke_with_tools(messages, tools, temperature=temperature)
+            if message is None:
+                break
+            if not message.get("tool_calls"):
+                final_response = message["content"]
+                break
+
+            messages.append(message)
+            calls = self._parse_function_calls(message)
+            for call, result in zip(calls, self._execute_tool_calls(calls)):
+                messages.append({"role": "tool", "tool_call_id": call['original'], "content": result})
+
+        # 超过最大轮数仍在调用工具时，基于已有结果直接生成回答：
+        # 历史中含有 tool_calls 和 tool 消息，仍需带上工具定义，用 tool_choice="none" 禁止继续调用
+        if final_response is None:
+            message = self.llm.invoke_with_tools(messages, tools, temperature=temperature, tool_choice="none")
+            final_response = (message or {}).get("content") or ""
+
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(final_response or "", "assistant"))
+        return final_response
+
+    @staticmethod
+    def _parse_function_calls(message: dict) -> List[dict]:
+        """将结构化的 tool_calls 转换为与文本标记相同的工具调用格式"""
+        calls = []
+        for tool_call in message["tool_calls"]:
+            arguments = tool_call["function"].get("arguments") or "{}"
+            try:
+                parameters = json.loads(arguments)
+            except json.JSONDecodeError:
+                parameters = {"input": arguments}
+            if not isinstance(parameters, dict):
+                parameters = {"input": parameters}
+            calls.append({
+                'tool_name': tool_call["function"]["name"],
+                'parameters': parameters,
+                'original': tool_call["id"]
+            })
+            print(f"🔧 调用工具: {tool_call['function']['name']}({arguments})")
+        return calls
+
+    async def arun(self, input_text: str, max_tool_iterations: int = 3, **kwargs) -> str:
+        """
+        异步运行SimpleAgent，LLM调用和工具调用都不占用线程
+
+        Args:
+            input_text: 用户输入
+            max_tool_iterations: 最大工具调用迭代次数（仅在启用工具时有效）
+            **kwargs: 其他参数
+
+        Returns:
+            Agent响应
+        """
+        if self.enable_tool_calling and self.function_calling:
+            return await self._arun_function_calling(input_text, max_tool_iterations, **kwargs)
+
+        messages = self.build_messages(input_text, self._get_enhanced_system_prompt())
+
+        if not self.enable_tool_calling:
+            response = await self.llm.athink(messages, **kwargs)
+            self.add_message(FastMessage(input_text, "user"))
+            self.add_message(FastMessage(response or "", "assistant"))
+            return response
+
+        current_iteration = 0
+        final_response = ""
+
+        while current_iteration < max_tool_iterations:
+            if self.speculative_tool_calls:
+                response, dispatched = await self._athink_with_speculative_tools(messages, **kwargs)
+            else:
+                response, dispatched = await self.llm.athink(messages, **kwargs), []
+
+            tool_calls = self._parse_tool_calls(response or "")
+            if not tool_calls:
+                final_response = response
+                break
+
+            tool_results = await self._aexecute_tool_calls(tool_calls, dispatched)
+            clean_response = response
+            for call in tool_calls:
+                clean_response = clean_response.replace(call['original'], "")
+            messages.append({"role": "assistant", "content": clean_response})
+            tool_results_text = "\n\n".join(tool_results)
+            messages.append(
+                {"role": "user", "content": f"工具执行结果：\n{tool_results_text}\n\n请基于这些结果给出完整的回答。"})
+            current_iteration += 1
+
+        if current_iteration >= max_tool_iterations and not final_response:
+            final_response = await self.llm.athink(messages, **kwargs)
+
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(final_response or "", "assistant"))
+        return final_response
+
+    async def _arun_function_calling(self, input_text: str, max_tool_iterations: int = 3, **kwargs) -> str:
+        """_run_function_calling 的异步版本"""
+        messages = self.build_messages(input_text, self.system_prompt or "你是一个有用的AI助手。")
+        tools = self.tool_registry.to_openai_schema()
+        temperature = kwargs.get("temperature", 0)
+        final_response = None
+
+        for _ in range(max_tool_iterations):
+            message = await self.llm.ainvoke_with_tools(messages, tools, temperature=temperature)
+            if message is None:
+                break
+            if not message.get("tool_calls"):
+                final_response = message["content"]
+                break
+
+            messages.append(message)
+            calls = self._parse_function_calls(message)
+            for call, result in zip(calls, await self._aexecute_tool_calls(calls)):
+                messages.append({"role": "tool", "tool_call_id": call['original'], "content": result})
+
+        if final_response is None:
+            message = await self.llm.ainvoke_with_tools(messages, tools, temperature=temperature, tool_choice="none")
+            final_response = (message or {}).get("content") or ""
+
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(final_response or "", "assistant"))
+        return final_response
+
     def add_tool(self, tool, auto_expand: bool = True) -> None:
         """
         添加工具到Agent（便利方法）
@@ -377,16 +764,8 @@ class SimpleAgent(Agent):
         Yields:
             Agent响应片段
         """
-        # 构建消息列表
-        messages = []
-
-        if self.system_prompt:
-            messages.append({"role": "system", "content": self.system_prompt})
-
-        for msg in self._history:
-            messages.append({"role": msg.role, "content": msg.content})
-
-        messages.append({"role": "user", "content": input_text})
+        # 在上下文预算内构建消息列表
+        messages = self.build_messages(input_text)
 
         # 流式调用LLM
         full_response = ""
@@ -395,5 +774,26 @@ class SimpleAgent(Agent):
             yield chunk
 
         # 保存完整对话到历史记录
-        self.add_message(Message(input_text, "user"))
-        self.add_message(Message(full_response, "assistant"))
\ No newline at end of file
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage(full_response, "assistant"))
+
+    async def astream(self, input_text: str, **kwargs) -> AsyncIterator[str]:
+        """
+        异步流式运行Agent
+
+        Args:
+            input_text: 用户输入
+            **kwargs: 其他参数（temperature、stop）
+
+        Yields:
+            Agent响应片段
+        """
+        messages = self.build_messages(input_text)
+
+        collected = []
+        async for chunk in self.llm.astream(messages, **kwargs):
+            collected.append(chunk)
+            yield chunk
+
+        self.add_message(FastMessage(input_text, "user"))
+        self.add_message(FastMessage("".join(collected), "assistant"))
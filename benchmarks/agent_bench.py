@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/30 16:20
+# @Author  : wang ke
+# @File    : agent_bench.py
+# @Software: PyCharm
+
+"""
+Agent基准测试 - 用脚本化的假LLM衡量框架自身开销
+
+假LLM继承 AgentsLLM，只替换最底层的网络请求，按延迟画像模拟首token时间和生成速度，
+因此重试、限流、指标等客户端逻辑都计入开销。每个会话的耗时被拆分为：
+模拟的模型延迟、LLM客户端开销、工具执行、工具分发开销以及Agent自身开销（提示词构建、解析、历史维护）。
+
+用法：
+    python -m benchmarks.agent_bench --profile local --sessions 32 --concurrency 8 --output bench.json
+"""
+
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import threading
+import subprocess
+import tracemalloc
+import contextvars
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Callable, Iterator, AsyncIterator, Tuple
+
+from pydantic import BaseModel
+
+from core.llm import AgentsLLM
+from core.agent import Agent
+from core.stream import NullSink
+from tools.registry import ToolRegistry
+from agents.simple_agent import SimpleAgent
+from agents.react_agent import ReActAgent
+from agents.plan_solve_agent import PlanAndSolveAgent
+from agents.reflection_agent import ReflectionAgent
+from utils.metrics import percentile
+from utils.mock_llm_server import split_tokens, apply_stop
+
+
+class LatencyProfile(BaseModel):
+    """模型与工具的延迟画像"""
+
+    ttft: float = 0.0
+    tokens_per_second: float = 0.0
+    jitter: float = 0.0
+    tool_latency: float = 0.0
+
+
+PROFILES: Dict[str, LatencyProfile] = {
+    # 不模拟任何延迟，结果即为纯框架开销
+    "instant": LatencyProfile(),
+    "local": LatencyProfile(ttft=0.3, tokens_per_second=40, jitter=0.1, tool_latency=0.05),
+    "cloud": LatencyProfile(ttft=0.8, tokens_per_second=80, jitter=0.2, tool_latency=0.05),
+}
+
+
+class SessionTrace:
+    """单个会话的耗时拆分"""
+
+    __slots__ = ("llm_calls", "llm_wall", "llm_simulated", "completion_tokens",
+                 "tool_calls", "tool_wall", "tool_body")
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.llm_wall = 0.0
+        self.llm_simulated = 0.0
+        self.completion_tokens = 0
+        self.tool_calls = 0
+        self.tool_wall = 0.0
+        self.tool_body = 0.0
+
+
+_current_trace: contextvars.ContextVar[Optional[SessionTrace]] = contextvars.ContextVar("bench_trace", default=None)
+
+
+def scripted_response(messages: List[Dict[str, str]]) -> str:
+    """
+    按提示词内容返回各Agent期望格式的固定回复
+
+    ReAct 先调用一次工具再给出答案（并附带一段模型常见的伪造Observation）；
+    PlanAndSolve 生成三步计划（前两步互不依赖）；Reflection 经过一轮改进后认为无需改进。
+    """
+    prompt = messages[-1].get("content") or ""
+    if "## 可用工具" in prompt and "Question:" in prompt:
+        if "Observation:" in prompt:
+            return "Thought: 已经获得足够的信息。\nAction: Finish[答案是42]"
+        return ("Thought: 需要先查询相关资料。\nAction: search[问题关键字]\n"
+                "Observation: 模型臆造的观察结果\nThought: 继续推理")
+    if "规划专家" in prompt:
+        return ('```python\n[{"id": 1, "step": "理解问题并提取已知条件", "depends_on": []}, '
+                '{"id": 2, "step": "查询相关背景资料", "depends_on": []}, '
+                '{"id": 3, "step": "汇总得出最终答案", "depends_on": [1, 2]}]\n```')
+    if "执行专家" in prompt:
+        return "该步骤的结果是42。"
+    if "审查以下回答" in prompt:
+        return "无需改进" if "（已改进）" in prompt else "可以补充边界情况的说明。"
+    if "根据反馈意见改进" in prompt:
+        return "这是补充了边界情况后的完整回答。（已改进）"
+    return "这是一个用于基准测试的模拟回答，包含若干个token以模拟真实的生成过程。"
+
+
+class ScriptedLLM(AgentsLLM):
+    """
+    脚本化的假LLM
+
+    只替换 _request_stream / _arequest_stream，按延迟画像逐token产出脚本回复，
+    其余调用链（缓存、重试、限流、指标）与真实调用完全一致。
+    """
+
+    def __init__(self, profile: Optional[LatencyProfile] = None,
+                 responder: Callable[[List[Dict[str, str]]], str] = scripted_response,
+                 seed: Optional[int] = None, **kwargs):
+        kwargs.setdefault("stream_sink", NullSink())
+        super().__init__(model="scripted", apiKey="bench", baseUrl="http://127.0.0.1:9/v1", **kwargs)
+        self.profile = profile or LatencyProfile()
+        self.responder = responder
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _jittered(self, seconds: float) -> float:
+        if self.profile.jitter <= 0 or seconds <= 0:
+            return seconds
+        with self._random_lock:
+            factor = 1 + self._random.uniform(-self.profile.jitter, self.profile.jitter)
+        return max(0.0, seconds * factor)
+
+    def _plan(self, messages: List[Dict[str, str]], stop: Optional[List[str]]) -> Tuple[List[str], List[float]]:
+        """生成本次回复的token序列及每个token之前的等待时间"""
+        tokens = split_tokens(apply_stop(self.responder(messages), stop))
+        interval = 1.0 / self.profile.tokens_per_second if self.profile.tokens_per_second > 0 else 0.0
+        delays = [self._jittered(self.profile.ttft)] + [self._jittered(interval) for _ in tokens[1:]]
+        return tokens, delays
+
+    def _request_stream(self, messages: List[Dict[str, str]], temperature: float,
+                        timeout: Optional[float] = None, stop: Optional[List[str]] = None) -> Iterator[str]:
+        trace = _current_trace.get()
+        tokens, delays = self._plan(messages, stop)
+        start_time = last_chunk_time = time.perf_counter()
+        ttft, gaps, emitted = None, [], []
+        try:
+            for token, delay in zip(tokens, delays):
+                if delay:
+                    time.sleep(delay)
+                now = time.perf_counter()
+                if ttft is None:
+                    ttft = now - start_time
+                else:
+                    gaps.append(now - last_chunk_time)
+                last_chunk_time = now
+                emitted.append(token)
+                yield token
+        finally:
+            # 调用方可能提前结束迭代，只统计实际产出的部分
+            if trace is not None:
+                trace.llm_simulated += sum(delays[:len(emitted)])
+                trace.completion_tokens += len(emitted)
+            self._on_request_finished(None, self.model, messages, ttft, gaps, emitted, None,
+                                      time.perf_counter() - start_time)
+
+    async def _arequest_stream(self, messages: List[Dict[str, str]], temperature: float,
+                               timeout: Optional[float] = None,
+                               stop: Optional[List[str]] = None) -> AsyncIterator[str]:
+        trace = _current_trace.get()
+        tokens, delays = self._plan(messages, stop)
+        start_time = last_chunk_time = time.perf_counter()
+        ttft, gaps, emitted = None, [], []
+        try:
+            for token, delay in zip(tokens, delays):
+                if delay:
+                    await asyncio.sleep(delay)
+                now = time.perf_counter()
+                if ttft is None:
+                    ttft = now - start_time
+                else:
+                    gaps.append(now - last_chunk_time)
+                last_chunk_time = now
+                emitted.append(token)
+                yield token
+        finally:
+            # 调用方可能提前结束迭代，只统计实际产出的部分
+            if trace is not None:
+                trace.llm_simulated += sum(delays[:len(emitted)])
+                trace.completion_tokens += len(emitted)
+            self._on_request_finished(None, self.model, messages, ttft, gaps, emitted, None,
+                                      time.perf_counter() - start_time)
+
+    def think(self, messages: List[Dict[str, str]], *args, **kwargs) -> str:
+        trace = _current_trace.get()
+        start = time.perf_counter()
+        try:
+            return super().think(messages, *args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.llm_calls += 1
+                trace.llm_wall += time.perf_counter() - start
+
+
+class TracedToolRegistry(ToolRegistry):
+    """记录工具分发耗时的工具注册表"""
+
+    def execute_tool(self, name: str, input_text: str) -> str:
+        trace = _current_trace.get()
+        start = time.perf_counter()
+        try:
+            return super().execute_tool(name, input_text)
+        finally:
+            if trace is not None:
+                trace.tool_calls += 1
+                trace.tool_wall += time.perf_counter() - start
+
+
+def _make_search_tool(profile: LatencyProfile) -> Callable[[str], str]:
+    def search(query: str) -> str:
+        trace = _current_trace.get()
+        start = time.perf_counter()
+        if profile.tool_latency:
+            time.sleep(profile.tool_latency)
+        if trace is not None:
+            trace.tool_body += time.perf_counter() - start
+        return f"关于“{query}”的检索结果：答案是42。"
+
+    return search
+
+
+def _build_simple(llm: AgentsLLM, profile: LatencyProfile) -> Agent:
+    return SimpleAgent("BenchSimple", llm)
+
+
+def _build_react(llm: AgentsLLM, profile: LatencyProfile) -> Agent:
+    registry = TracedToolRegistry()
+    with redirect_stdout(io.StringIO()):
+        registry.register_function("search", "检索资料", _make_search_tool(profile))
+    return ReActAgent("BenchReAct", llm, tool_registry=registry)
+
+
+def _build_plan_solve(llm: AgentsLLM, profile: LatencyProfile) -> Agent:
+    return PlanAndSolveAgent("BenchPlanSolve", llm)
+
+
+def _build_reflection(llm: AgentsLLM, profile: LatencyProfile) -> Agent:
+    return ReflectionAgent("BenchReflection", llm, max_iterations=2)
+
+
+AGENT_BUILDERS: Dict[str, Callable[[AgentsLLM, LatencyProfile], Agent]] = {
+    "simple": _build_simple,
+    "react": _build_react,
+    "plan_solve": _build_plan_solve,
+    "reflection": _build_reflection,
+}
+
+DEFAULT_QUESTION = "一个水果店周一卖出了15个苹果，周二是周一的两倍，周三比周二少5个，三天共卖出多少个？"
+
+
+def run_session(agent_name: str, llm: AgentsLLM, profile: LatencyProfile,
+                question: str = DEFAULT_QUESTION) -> Dict[str, float]:
+    """
+    运行一个会话并返回耗时拆分（秒）
+
+    Returns:
+        e2e / llm_simulated / llm_client / tool_body / tool_dispatch / agent / llm_calls 等字段
+    """
+    trace = SessionTrace()
+    token = _current_trace.set(trace)
+    try:
+        agent = AGENT_BUILDERS[agent_name](llm, profile)
+        start = time.perf_counter()
+        agent.run(question)
+        e2e = time.perf_counter() - start
+    finally:
+        _current_trace.reset(token)
+
+    framework = e2e - trace.llm_simulated - trace.tool_body
+    return {
+        "e2e": e2e,
+        "llm_calls": trace.llm_calls,
+        "tool_calls": trace.tool_calls,
+        "completion_tokens": trace.completion_tokens,
+        "llm_simulated": trace.llm_simulated,
+        "llm_client": trace.llm_wall - trace.llm_simulated,
+        "tool_body": trace.tool_body,
+        "tool_dispatch": trace.tool_wall - trace.tool_body,
+        "agent": e2e - trace.llm_wall - trace.tool_wall,
+        "framework": framework,
+        "framework_per_step": framework / max(trace.llm_calls, 1),
+    }
+
+
+def measure_allocations(agent_name: str, llm: AgentsLLM, profile: LatencyProfile) -> Dict[str, int]:
+    """用 tracemalloc 统计单个会话的内存分配"""
+    run_session(agent_name, llm, profile)  # 预热，排除模块级缓存的首次分配
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        run_session(agent_name, llm, profile)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    diff = after.compare_to(before, "filename")
+    return {
+        "peak_bytes": peak,
+        "retained_bytes": sum(stat.size_diff for stat in diff),
+        "retained_blocks": sum(stat.count_diff for stat in diff),
+    }
+
+
+def _summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+    }
+
+
+def benchmark_agent(agent_name: str, profile: LatencyProfile, sessions: int = 16, concurrency: int = 4,
+                    seed: Optional[int] = 0, allocations: bool = True) -> Dict[str, Any]:
+    """
+    在 concurrency 个并发会话下运行 sessions 次，汇总延迟、开销拆分与吞吐
+
+    Args:
+        agent_name: AGENT_BUILDERS 中的名称
+        profile: 延迟画像
+        sessions: 会话总数
+        concurrency: 同时运行的会话数
+        seed: 抖动的随机种子
+        allocations: 是否额外统计单会话内存分配
+    """
+    llm = ScriptedLLM(profile, seed=seed)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda _: run_session(agent_name, llm, profile), range(sessions)))
+        wall = time.perf_counter() - start
+
+    breakdown = {key: _summarize([r[key] for r in results])
+                 for key in ("e2e", "llm_simulated", "llm_client", "tool_body", "tool_dispatch",
+                             "agent", "framework", "framework_per_step")}
+    report = {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "sessions_per_second": sessions / wall if wall > 0 else None,
+        "llm_calls_per_session": results[0]["llm_calls"],
+        "tool_calls_per_session": results[0]["tool_calls"],
+        "completion_tokens_per_session": results[0]["completion_tokens"],
+        "latency": breakdown,
+    }
+    if allocations:
+        report["allocations"] = measure_allocations(agent_name, llm, profile)
+    return report
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(agent_names: List[str], profile_name: str = "instant", sessions: int = 16,
+                   concurrency: int = 4, seed: Optional[int] = 0, allocations: bool = True) -> Dict[str, Any]:
+    """运行多个Agent的基准测试，返回可直接写入JSON的结果"""
+    profile = PROFILES[profile_name]
+    results = {}
+    # Agent内部有大量 print，压测期间丢弃，避免终端输出成为瓶颈
+    with redirect_stdout(io.StringIO()):
+        for name in agent_names:
+            results[name] = benchmark_agent(name, profile, sessions, concurrency, seed, allocations)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "profile": {"name": profile_name, **profile.model_dump()},
+            "sessions": sessions,
+            "concurrency": concurrency,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent框架开销基准测试")
+    parser.add_argument("--agents", default=",".join(AGENT_BUILDERS), help="逗号分隔的Agent名称")
+    parser.add_argument("--profile", default="instant", choices=sorted(PROFILES))
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-allocations", action="store_true", help="跳过内存分配统计")
+    parser.add_argument("--output", default="agent_bench.json")
+    args = parser.parse_args()
+
+    report = run_benchmarks([name.strip() for name in args.agents.split(",") if name.strip()],
+                            args.profile, args.sessions, args.concurrency, args.seed, not args.no_allocations)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, result in report["results"].items():
+        latency = result["latency"]
+        print(f"📊 {name:<12} e2e p50={latency['e2e']['p50'] * 1000:.1f}ms "
+              f"p95={latency['e2e']['p95'] * 1000:.1f}ms "
+              f"框架开销/步={latency['framework_per_step']['mean'] * 1000:.2f}ms "
+              f"吞吐={result['sessions_per_second']:.1f}会话/秒", file=sys.stderr)
+    print(f"✅ 结果已写入 {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
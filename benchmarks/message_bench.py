@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/6 11:05
+# @Author  : wang ke
+# @File    : message_bench.py
+# @Software: PyCharm
+
+"""
+消息表示基准测试 - 对比 pydantic Message 与 FastMessage 的构造耗时、单条内存和转换开销
+
+用法：
+    python -m benchmarks.message_bench --count 100000
+"""
+
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from typing import Dict, Any, Callable, List
+
+from core.message import Message, FastMessage
+
+# FastMessage 的目标（相对 Message，与机器快慢无关）：构造耗时不超过 1/3，单条内存不超过 1/4
+TARGET_CONSTRUCT_RATIO = 1 / 3
+TARGET_MEMORY_RATIO = 1 / 4
+
+
+def _contents(count: int) -> List[str]:
+    # 预先生成内容字符串，使测量只包含消息对象本身
+    return [f"第 {i} 条消息的内容" for i in range(count)]
+
+
+def measure_construction(factory: Callable[[str], Any], contents: List[str]) -> float:
+    """平均每条消息的构造耗时（秒）"""
+    start = time.perf_counter()
+    for content in contents:
+        factory(content)
+    return (time.perf_counter() - start) / len(contents)
+
+
+def measure_memory(factory: Callable[[str], Any], contents: List[str]) -> float:
+    """平均每条消息额外占用的字节数"""
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        messages = [factory(content) for content in contents]
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # 扣除保存消息的列表本身
+    list_bytes = sys.getsizeof(messages)
+    return (after - before - list_bytes) / len(contents)
+
+
+def measure_to_dict(messages: List[Any], rounds: int = 10) -> float:
+    """模拟每轮对话都把全部历史转换为OpenAI格式，返回平均每条每次的耗时（秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        [message.to_dict() for message in messages]
+    return (time.perf_counter() - start) / (rounds * len(messages))
+
+
+def run_benchmark(count: int = 100000) -> Dict[str, Any]:
+    contents = _contents(count)
+    factories = {
+        "Message": lambda content: Message(content, "user"),
+        "FastMessage": lambda content: FastMessage(content, "user"),
+    }
+    results = {}
+    for name, factory in factories.items():
+        messages = [factory(content) for content in contents[:1000]]
+        results[name] = {
+            "construct_seconds": measure_construction(factory, contents),
+            "bytes_per_message": measure_memory(factory, contents),
+            "to_dict_seconds": measure_to_dict(messages),
+        }
+    fast, slow = results["FastMessage"], results["Message"]
+    construct_ratio = fast["construct_seconds"] / slow["construct_seconds"]
+    memory_ratio = fast["bytes_per_message"] / slow["bytes_per_message"]
+    results["targets"] = {
+        "construct_ratio": construct_ratio,
+        "memory_ratio": memory_ratio,
+        "met": construct_ratio <= TARGET_CONSTRUCT_RATIO and memory_ratio <= TARGET_MEMORY_RATIO,
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息表示基准测试")
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    results = run_benchmark(args.count)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    for name in ("Message", "FastMessage"):
+        result = results[name]
+        print(f"📊 {name:<12} 构造={result['construct_seconds'] * 1e6:.2f}µs "
+              f"内存={result['bytes_per_message']:.0f}B/条 "
+              f"to_dict={result['to_dict_seconds'] * 1e9:.0f}ns", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,151 @@
 # @File    : agents.py
 # @Software: PyCharm
 
+import asyncio
+import functools
 from abc import ABC, abstractmethod
-from typing import Optional, Any
-from core.message import Message
+from collections import deque
+from typing import Optional, Any, AsyncIterator, Callable, Deque, Dict, Iterable, List, TYPE_CHECKING
+from core.message import Message, FastMessage
 from core.llm import AgentsLLM
 from core.config import Config
+from utils.token_counter import count_tokens, count_message_tokens
+from utils.metrics import agent_label
+
+if TYPE_CHECKING:
+    from core.session_store import SessionStore
+
+
+class PromptAssembler:
+    """
+    按token预算组装提示词
+
+    系统提示词和当前输入总是保留，剩余预算从最新的历史消息开始向前填充，
+    放不下的最早的消息会被丢弃；如果提供了摘要函数，则用一条摘要消息代替它们。
+    """
+
+    def __init__(
+            self,
+            max_tokens: int,
+            reserved_tokens: int = 0,
+            summarizer: Optional[Callable[[List[Message]], str]] = None,
+            max_summary_tokens: int = 512
+    ):
+        """
+        Args:
+            max_tokens: 上下文窗口的总token数
+            reserved_tokens: 为模型输出预留的token数
+            summarizer: 将被丢弃的历史消息压缩为摘要的函数（可选）
+            max_summary_tokens: 摘要消息最多占用的token数
+        """
+        self.max_tokens = max_tokens
+        self.reserved_tokens = reserved_tokens
+        self.summarizer = summarizer
+        self.max_summary_tokens = max_summary_tokens
+        # 缓存最近一次摘要，避免每轮对话都重新摘要同一批消息
+        self._summary_key: Optional[tuple] = None
+        self._summary_text: str = ""
+
+    def assemble(
+            self,
+            system_prompt: Optional[str],
+            history: Iterable[Message],
+            input_text: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """
+        组装OpenAI格式的消息列表
+
+        Args:
+            system_prompt: 系统提示词
+            history: 历史消息（从旧到新）
+            input_text: 当前用户输入
+
+        Returns:
+            消息列表
+        """
+        budget = self.max_tokens - self.reserved_tokens
+        if system_prompt:
+            budget -= count_message_tokens(system_prompt)
+        if input_text is not None:
+            budget -= count_message_tokens(input_text)
+
+        history = list(history)
+        kept = self._select_recent(history, budget)
+        if len(kept) < len(history) and self.summarizer:
+            # 需要摘要时为摘要消息预留空间后重新选取
+            kept = self._select_recent(history, budget - self.max_summary_tokens)
+        dropped = history[:len(history) - len(kept)]
+
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        if dropped and self.summarizer:
+            summary = self._summarize(dropped)
+            if summary:
+                messages.append({"role": "system", "content": f"此前对话摘要：\n{summary}"})
+        messages.extend(msg.to_dict() for msg in kept)
+        if input_text is not None:
+            messages.append({"role": "user", "content": input_text})
+        return messages
+
+    @staticmethod
+    def _select_recent(history: List[Message], budget: int) -> List[Message]:
+        """从最新的消息向前选取，直到预算用完"""
+        kept: List[Message] = []
+        for msg in reversed(history):
+            cost = msg.token_count if isinstance(msg, FastMessage) else count_message_tokens(msg.content)
+            if cost > budget:
+                break
+            budget -= cost
+            kept.append(msg)
+        kept.reverse()
+        return kept
+
+    def _summarize(self, dropped: List[Message]) -> str:
+        """对被丢弃的消息生成摘要，并截断到摘要预算内"""
+        # 按首尾消息的内容与时间识别同一批消息：id() 在对象回收后会被复用，
+        # 重新载入的历史（例如从会话存储恢复）也会得到新的对象
+        key = (len(dropped), self._identity(dropped[0]), self._identity(dropped[-1]))
+        if key != self._summary_key:
+            summary = self.summarizer(dropped) or ""
+            while summary and count_tokens(summary) > self.max_summary_tokens:
+                summary = summary[:int(len(summary) * 0.8)]
+            self._summary_key = key
+            self._summary_text = summary
+        return self._summary_text
+
+    @staticmethod
+    def _identity(msg: Message) -> tuple:
+        created = msg.created if isinstance(msg, FastMessage) else msg.timestamp
+        return msg.role, msg.content, created
 
 
 class Agent(ABC):
     """Agent基类"""
 
+    def __init_subclass__(cls, **kwargs):
+        """子类的 run / arun 自动在 agent_label 上下文中执行，使LLM指标带上Agent名称"""
+        super().__init_subclass__(**kwargs)
+        run = cls.__dict__.get("run")
+        if run is not None and not getattr(run, "__agent_labelled__", False):
+            @functools.wraps(run)
+            def labelled_run(self, *args, **kw):
+                with agent_label(self.name):
+                    return run(self, *args, **kw)
+
+            labelled_run.__agent_labelled__ = True
+            cls.run = labelled_run
+
+        arun = cls.__dict__.get("arun")
+        if arun is not None and not getattr(arun, "__agent_labelled__", False):
+            @functools.wraps(arun)
+            async def labelled_arun(self, *args, **kw):
+                with agent_label(self.name):
+                    return await arun(self, *args, **kw)
+
+            labelled_arun.__agent_labelled__ = True
+            cls.arun = labelled_arun
+
     def __init__(
             self,
             name: str,
@@ -26,24 +161,80 @@ class Agent(ABC):
         self.llm = llm
         self.system_prompt = system_prompt
         self.config = config or Config()
-        self._history: list[Message] = []
+        # 历史记录使用有界环形缓冲区，超出 max_history_length 时自动淘汰最早的消息
+        self._history: Deque[FastMessage] = deque(maxlen=self.config.max_history_length)
+        self.prompt_assembler = PromptAssembler(
+            max_tokens=self.config.max_context_tokens,
+            reserved_tokens=self.config.reserved_output_tokens
+        )
 
     @abstractmethod     #强制所有子类必须实现此方法
     def run(self, input_text: str, **kwargs) -> str:
         """运行Agent"""
         pass
 
-    def add_message(self, message: Message):
-        """添加消息到历史记录"""
+    async def arun(self, input_text: str, **kwargs) -> str:
+        """
+        异步运行Agent
+
+        默认在线程池中执行 run；子类应使用 athink 等异步接口重写，
+        使等待LLM和工具时不占用线程，单个进程即可承载大量会话。
+        """
+        return await asyncio.to_thread(self.run, input_text, **kwargs)
+
+    async def astream(self, input_text: str, **kwargs) -> AsyncIterator[str]:
+        """
+        异步流式运行Agent，逐片段产出最终回答
+
+        默认等待 arun 完成后一次性产出；最终回答可以边生成边输出的子类应重写。
+        """
+        yield await self.arun(input_text, **kwargs)
+
+    def build_messages(self, input_text: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        在上下文预算内组装本轮请求的消息列表
+
+        Args:
+            input_text: 当前用户输入
+            system_prompt: 系统提示词，默认使用 self.system_prompt
+
+        Returns:
+            OpenAI格式的消息列表
+        """
+        return self.prompt_assembler.assemble(
+            system_prompt if system_prompt is not None else self.system_prompt,
+            self._history,
+            input_text
+        )
+
+    def attach_session(self, store: "SessionStore", session_id: str):
+        """
+        将历史记录切换为会话日志中的持久化历史
+
+        最近 max_history_length 条消息在首次访问时才从磁盘加载，之后的每条消息都会追加写入日志。
+
+        Args:
+            store: 会话存储
+            session_id: 会话ID
+        """
+        self._history = store.open(session_id, window=self.config.max_history_length)
+
+    def add_message(self, message: "Message | FastMessage"):
+        """添加消息到历史记录，pydantic Message 会被转换为 FastMessage"""
+        if isinstance(message, Message):
+            message = FastMessage.from_message(message)
         self._history.append(message)
 
     def clear_history(self):
         """清空历史记录"""
         self._history.clear()
 
+    def close(self):
+        """释放Agent持有的资源（如工具线程池），默认无需释放"""
+
     def get_history(self) -> list[Message]:
-        """获取历史记录"""
-        return self._history.copy()
+        """获取历史记录（对外接口，返回 pydantic Message）"""
+        return [message.to_message() for message in self._history]
 
     def __str__(self) -> str:
         return f"Agent(name={self.name}, provider={self.llm.provider})"
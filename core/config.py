@@ -27,6 +27,10 @@ class Config(BaseModel):
     # 其他配置
     max_history_length: int = 100
 
+    # 上下文预算配置
+    max_context_tokens: int = 8192
+    reserved_output_tokens: int = 1024
+
     @classmethod
     def from_env(cls) -> "Config":
         """从环境变量创建配置"""
@@ -35,6 +39,8 @@ class Config(BaseModel):
             log_level=os.getenv("LOG_LEVEL", "INFO"),
             temperature=float(os.getenv("TEMPERATURE", "0.7")),
             max_tokens=int(os.getenv("MAX_TOKENS")) if os.getenv("MAX_TOKENS") else None,
+            max_history_length=int(os.getenv("MAX_HISTORY_LENGTH", "100")),
+            max_context_tokens=int(os.getenv("MAX_CONTEXT_TOKENS", "8192")),
         )
 
     def to_dict(self) -> Dict[str, Any]:
@@ -1,10 +1,24 @@
 import os
-from openai import OpenAI
-from typing import List, Dict
+import time
+import asyncio
+import weakref
+from contextlib import nullcontext
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import List, Dict, AsyncIterator, Iterator, Optional, Any, Callable
 
+from core.llm_cache import LLMResponseCache
+from core.stream import StreamSink, ConsoleSink, NullSink
+from core.singleflight import SingleFlight, AsyncSingleFlight
+from core.rate_limit import RateLimiter
+from core.router import Endpoint, EndpointRouter
+from core.retry import RetryPolicy, LatencyTracker, hedge_delay, retry_stream, aretry_stream, hedged_stream, \
+    ahedged_stream
 from settings.config import OLLAMA_CLOUD_MODEL, OLLAMA_KEY, OLLAMA_CLOUD_URL
 from utils.time_decorator import timer_decorator
 from utils.log import Log
+from utils.token_counter import count_tokens, count_message_tokens
+from utils import metrics
 
 logger = Log()
 
@@ -12,48 +26,717 @@ class AgentsLLM:
     """
     为本书 "Agents" 定制的LLM客户端。
     它用于调用任何兼容OpenAI接口的服务，并默认使用流式响应。
+    同时提供 athink/astream 异步接口，底层复用共享的连接池。
     """
 
-    def __init__(self, model: str = None, apiKey: str = None, baseUrl: str = None, timeout: int = 80):
+    # 按事件循环共享的异步HTTP连接池: {loop: {连接池参数: httpx.AsyncClient}}
+    _shared_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, httpx.AsyncClient]]" = \
+        weakref.WeakKeyDictionary()
+
+    # 进程内共享的single-flight，合并不同实例之间的相同在途请求
+    _single_flight = SingleFlight()
+    _async_single_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncSingleFlight]" = \
+        weakref.WeakKeyDictionary()
+
+    def __init__(
+            self,
+            model: str = None,
+            apiKey: str = None,
+            baseUrl: str = None,
+            timeout: int = 80,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+            keepalive_expiry: float = 30.0,
+            cache: Optional[LLMResponseCache] = None,
+            stream_sink: Optional[StreamSink] = None,
+            coalesce_requests: bool = False,
+            rate_limiter: Optional[RateLimiter] = None,
+            estimated_output_tokens: int = 512,
+            retry_policy: Optional[RetryPolicy] = None,
+            router: Optional[EndpointRouter] = None
+    ):
         """
         初始化客户端。优先使用传入参数，如果未提供，则从环境变量加载。
+
+        Args:
+            model: 模型ID
+            apiKey: API密钥
+            baseUrl: 服务地址
+            timeout: 请求超时时间（秒）
+            max_connections: 异步连接池最大连接数
+            max_keepalive_connections: 异步连接池最大保活连接数
+            keepalive_expiry: 空闲保活连接的过期时间（秒）
+            cache: 响应缓存，不提供则使用默认的进程内LRU缓存（仅在调用时 use_cache=True 才生效）
+            stream_sink: think 的默认流式输出接收器，默认为带缓冲的控制台输出；
+                生产环境可传入 NullSink 以消除逐token的IO开销
+            coalesce_requests: 是否合并同时在途的相同请求（相同服务地址、模型、消息和参数），
+                后到的调用者直接订阅已有请求的流式响应
+            rate_limiter: 服务商级限流器（RPM/TPM/并发），可在多个实例间共享；超限时排队等待
+            estimated_output_tokens: 限流时预估的单次生成token数，请求结束后按实际用量修正
+            retry_policy: 重试/退避/截止时间/对冲策略，默认在首token前失败时最多尝试3次
+            router: 多端点路由器（可选），提供后每次调用按端点的滚动延迟和健康状况选择服务地址，
+                失败时依次故障转移；不提供则只使用 baseUrl
         """
         self.model = model or OLLAMA_CLOUD_MODEL
-        apiKey = apiKey or OLLAMA_KEY
-        baseUrl = baseUrl or OLLAMA_CLOUD_URL
-        timeout = timeout
+        self.api_key = apiKey or OLLAMA_KEY
+        self.base_url = baseUrl or OLLAMA_CLOUD_URL
+        self.timeout = timeout
 
-        if not all([self.model, apiKey, baseUrl]):
+        if not all([self.model, self.api_key, self.base_url]):
             raise ValueError("模型ID、API密钥和服务地址必须被提供或在.env文件中定义。")
 
-        self.client = OpenAI(api_key=apiKey, base_url=baseUrl, timeout=timeout)
+        # 重试由 retry_policy 统一负责，关闭SDK内置的重试以免叠加
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
+
+        self.http_limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        # 每个事件循环、每个端点一个AsyncOpenAI实例，底层HTTP连接池在同一循环内跨实例共享
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncOpenAI]]" = \
+            weakref.WeakKeyDictionary()
+
+        self.router = router
+        self._endpoint_clients: Dict[str, OpenAI] = {}
+
+        self.cache = cache or LLMResponseCache()
+        self.stream_sink = stream_sink or ConsoleSink()
+        self.coalesce_requests = coalesce_requests
+        self.rate_limiter = rate_limiter
+        self.estimated_output_tokens = estimated_output_tokens
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 首token时间统计，用于计算对冲延迟
+        self.ttft_tracker = LatencyTracker()
+
+    @classmethod
+    def _get_shared_http_client(cls, limits: httpx.Limits, timeout: float) -> httpx.AsyncClient:
+        """获取当前事件循环下与连接池参数对应的共享异步HTTP客户端"""
+        loop = asyncio.get_running_loop()
+        pool_key = (limits.max_connections, limits.max_keepalive_connections, limits.keepalive_expiry, timeout)
+        loop_clients = cls._shared_http_clients.setdefault(loop, {})
+
+        http_client = loop_clients.get(pool_key)
+        if http_client is None or http_client.is_closed:
+            http_client = DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+            loop_clients[pool_key] = http_client
+        return http_client
+
+    def _get_async_client(self, endpoint: Optional[Endpoint] = None) -> AsyncOpenAI:
+        """获取当前事件循环下的AsyncOpenAI客户端，endpoint为None时使用默认服务地址"""
+        loop = asyncio.get_running_loop()
+        loop_clients = self._async_clients.setdefault(loop, {})
+        client_key = endpoint.name if endpoint else ""
+        async_client = loop_clients.get(client_key)
+        if async_client is None:
+            async_client = AsyncOpenAI(
+                api_key=endpoint.api_key if endpoint else self.api_key,
+                base_url=endpoint.base_url if endpoint else self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=self._get_shared_http_client(self.http_limits, self.timeout)
+            )
+            loop_clients[client_key] = async_client
+        return async_client
+
+    def _get_client(self, endpoint: Optional[Endpoint] = None) -> OpenAI:
+        """获取同步客户端，endpoint为None时使用默认服务地址"""
+        if endpoint is None:
+            return self.client
+        client = self._endpoint_clients.get(endpoint.name)
+        if client is None:
+            client = OpenAI(api_key=endpoint.api_key, base_url=endpoint.base_url, timeout=self.timeout, max_retries=0)
+            self._endpoint_clients[endpoint.name] = client
+        return client
+
+    def _candidate_endpoints(self) -> List[Optional[Endpoint]]:
+        """本次调用依次尝试的端点，未配置路由器时只有默认服务地址（None）"""
+        return self.router.rank() if self.router else [None]
+
+    def _on_endpoint_failure(self, endpoint: Optional[Endpoint], error: Exception):
+        """向路由器反馈一次失败；只有可重试的错误才计入端点故障"""
+        if endpoint is not None and RetryPolicy.is_retryable(error):
+            self.router.record_failure(endpoint.name)
+
+    def _on_request_finished(self, endpoint: Optional[Endpoint], model: str, messages: List[Dict[str, str]],
+                             ttft: Optional[float], gaps: List[float], collected_content: List[str],
+                             usage: Any, duration: float):
+        """
+        一次请求成功结束：记录流式性能指标并向路由器反馈
+
+        token数优先使用服务端返回的usage，没有时按本地分词估算。
+        """
+        if usage is not None and getattr(usage, "completion_tokens", None) is not None:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+        else:
+            prompt_tokens = self._count_prompt_tokens(messages)
+            completion_tokens = count_tokens("".join(collected_content))
+
+        labels = {"model": model, "agent": metrics.current_agent.get()}
+        metrics.LLM_DURATION.observe(duration, **labels)
+        metrics.LLM_PROMPT_TOKENS.observe(prompt_tokens, **labels)
+        metrics.LLM_COMPLETION_TOKENS.observe(completion_tokens, **labels)
+        if ttft is not None:
+            metrics.LLM_TTFT.observe(ttft, **labels)
+            generation_time = duration - ttft
+            if completion_tokens > 1 and generation_time > 0:
+                metrics.LLM_TOKENS_PER_SECOND.observe(completion_tokens / generation_time, **labels)
+        if gaps:
+            metrics.LLM_INTER_CHUNK_GAP.observe_many(gaps, **labels)
+
+        if endpoint is not None:
+            self.router.record_success(endpoint.name, ttft, completion_tokens, duration)
+
+    @classmethod
+    async def aclose_shared_clients(cls):
+        """关闭当前事件循环下的所有共享连接池，通常在服务退出时调用"""
+        loop = asyncio.get_running_loop()
+        loop_clients = cls._shared_http_clients.pop(loop, {})
+        for http_client in loop_clients.values():
+            await http_client.aclose()
+
+    def _cache_key(self, messages: List[Dict[str, str]], temperature: float, use_cache: bool,
+                   force_cache: bool, stop: Optional[List[str]] = None) -> Optional[str]:
+        """
+        判断本次调用是否走缓存，是则返回缓存键
+
+        温度大于0时输出本身带有随机性，默认不缓存，除非显式 force_cache=True。
+        """
+        if not use_cache or (temperature > 0 and not force_cache):
+            return None
+        models = self._served_models()
+        if len(models) > 1:
+            # 路由器可能故障转移到服务其他模型的端点，调用前无法确定由哪个模型作答，不使用缓存
+            return None
+        return self.cache.make_key(models[0], messages, temperature, **({"stop": stop} if stop else {}))
+
+    def _served_models(self) -> List[str]:
+        """本次调用可能实际请求的模型：配置了路由器时为各端点的模型"""
+        if not self.router:
+            return [self.model]
+        return sorted({endpoint.model or self.model for endpoint in self.router.endpoints.values()})
+
+    def get_cache_stats(self) -> Dict[str, float]:
+        """获取响应缓存的命中统计"""
+        return self.cache.get_stats()
+
+    def _request_key(self, messages: List[Dict[str, str]], temperature: float,
+                     stop: Optional[List[str]] = None) -> str:
+        """在途请求的合并键，包含可能作答的模型和服务地址"""
+        if self.router:
+            base_url = sorted(endpoint.base_url for endpoint in self.router.endpoints.values())
+        else:
+            base_url = self.base_url
+        return LLMResponseCache.make_key(",".join(self._served_models()), messages, temperature, base_url=base_url,
+                                         **({"stop": stop} if stop else {}))
+
+    def stream_invoke(self, messages: List[Dict[str, str]], temperature: float = 0,
+                      stop: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        流式调用大语言模型，逐个产出响应片段。
+
+        调用方提前结束迭代（break / close）时会立即关闭底层连接。
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            stop: 停止序列，模型生成到任一序列时由服务端截断
+
+        Yields:
+            响应文本片段
+        """
+        if self.coalesce_requests:
+            key = self._request_key(messages, temperature, stop)
+            yield from self._single_flight.stream(key, lambda: self._resilient_stream(messages, temperature, stop))
+            return
+        yield from self._resilient_stream(messages, temperature, stop)
+
+    def _resilient_stream(self, messages: List[Dict[str, str]], temperature: float,
+                          stop: Optional[List[str]] = None) -> Iterator[str]:
+        """按重试策略发起请求：失败时退避重试，首token过慢时发起对冲请求"""
+        def attempt(timeout: Optional[float]) -> Iterator[str]:
+            delay = hedge_delay(self.retry_policy, self.ttft_tracker)
+            if delay is None:
+                return self._create_stream(messages, temperature, timeout, stop)
+            return hedged_stream(lambda: self._create_stream(messages, temperature, timeout, stop), delay)
+
+        return retry_stream(attempt, self.retry_policy)
+
+    @staticmethod
+    def _count_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+        return sum(count_message_tokens(msg.get("content") or "") for msg in messages)
+
+    def _create_stream(self, messages: List[Dict[str, str]], temperature: float,
+                       timeout: Optional[float] = None, stop: Optional[List[str]] = None) -> Iterator[str]:
+        """向上游发起一次流式请求，配置了限流器时先排队获取许可"""
+        if self.rate_limiter is None:
+            yield from self._request_stream(messages, temperature, timeout, stop)
+            return
+
+        prompt_tokens = self._count_prompt_tokens(messages)
+        # timeout 是截止时间前的剩余时间，排队也要计入
+        with self.rate_limiter.limit(prompt_tokens + self.estimated_output_tokens, timeout) as lease:
+            metrics.LLM_QUEUE_WAIT.observe(lease.wait_seconds, model=self.model, agent=metrics.current_agent.get())
+            if timeout is not None:
+                timeout -= lease.wait_seconds
+            collected_content = []
+            try:
+                for content in self._request_stream(messages, temperature, timeout, stop):
+                    collected_content.append(content)
+                    yield content
+            finally:
+                lease.record_usage(prompt_tokens + count_tokens("".join(collected_content)))
+
+    def _request_options(self, timeout: Optional[float], stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        options: Dict[str, Any] = {}
+        if timeout is not None:
+            options["timeout"] = max(timeout, 0.001)
+        if stop:
+            options["stop"] = stop
+        return options
+
+    def _request_stream(self, messages: List[Dict[str, str]], temperature: float,
+                        timeout: Optional[float] = None, stop: Optional[List[str]] = None) -> Iterator[str]:
+        """发送流式请求并产出响应片段，配置了路由器时在首token前失败会故障转移到下一个端点"""
+        candidates = self._candidate_endpoints()
+        for index, endpoint in enumerate(candidates):
+            model = (endpoint.model if endpoint else None) or self.model
+            logger.info(f"🧠 正在调用 {model} 模型{f' ({endpoint.name})' if endpoint else ''}...")
+            if endpoint is not None:
+                self.router.acquire(endpoint.name)
+            start_time = last_chunk_time = time.perf_counter()
+            ttft = None
+            usage = None
+            gaps = []
+            collected_content = []
+            try:
+                response = self._get_client(endpoint).chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **self._request_options(timeout, stop)
+                )
+                try:
+                    for chunk in response:
+                        if getattr(chunk, "usage", None) is not None:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        content = chunk.choices[0].delta.content or ""
+                        if content:
+                            now = time.perf_counter()
+                            if ttft is None:
+                                ttft = now - start_time
+                                self.ttft_tracker.record(ttft)
+                            else:
+                                gaps.append(now - last_chunk_time)
+                            last_chunk_time = now
+                            collected_content.append(content)
+                            yield content
+                finally:
+                    response.close()
+            except GeneratorExit:
+                # 调用方提前结束迭代（如已解析到完整输出），按成功的请求记录
+                self._on_request_finished(endpoint, model, messages, ttft, gaps, collected_content, usage,
+                                          time.perf_counter() - start_time)
+                raise
+            except Exception as e:
+                self._on_endpoint_failure(endpoint, e)
+                if ttft is not None or index == len(candidates) - 1 or not RetryPolicy.is_retryable(e):
+                    raise
+                logger.warning(f"⚠️ 端点 {endpoint.name} 调用失败: {e}，故障转移到 {candidates[index + 1].name}")
+                continue
+            finally:
+                if endpoint is not None:
+                    self.router.release(endpoint.name)
+
+            self._on_request_finished(endpoint, model, messages, ttft, gaps, collected_content, usage,
+                                      time.perf_counter() - start_time)
+            return
 
     @timer_decorator
-    def think(self, messages: List[Dict[str, str]], temperature: float = 0) -> str:
+    def think(self, messages: List[Dict[str, str]], temperature: float = 0,
+              use_cache: bool = False, force_cache: bool = False,
+              sink: Optional[StreamSink] = None, stop: Optional[List[str]] = None,
+              stop_when: Optional[Callable[[str], bool]] = None) -> str:
         """
         调用大语言模型进行思考，并返回其响应。
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            use_cache: 是否启用响应缓存
+            force_cache: 温度大于0时是否仍然使用缓存
+            sink: 本次调用的流式输出接收器，不提供则使用 self.stream_sink
+            stop: 停止序列，由服务端截断生成
+            stop_when: 逐片段调用的判定函数，返回True时立即断开连接、停止生成
         """
-        logger.info(f"🧠 正在调用 {self.model} 模型...")
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                stream=True,
-            )
+        sink = sink or self.stream_sink
+        cache_key = self._cache_key(messages, temperature, use_cache, force_cache, stop)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"⚡ 命中响应缓存，跳过 {self.model} 模型调用")
+                sink.on_start()
+                sink.write(cached)
+                sink.on_end()
+                return cached
 
-            # 处理流式响应
-            logger.info("✅ 大语言模型响应成功:")
+        try:
             collected_content = []
-            for chunk in response:
-                content = chunk.choices[0].delta.content or ""
-                print(content, end="", flush=True)
-                collected_content.append(content)
-            print()  # 在流式输出结束后换行
-            return "".join(collected_content)
+            stopped_early = False
+            sink.on_start()
+            try:
+                stream = self.stream_invoke(messages, temperature, stop)
+                try:
+                    for content in stream:
+                        sink.write(content)
+                        collected_content.append(content)
+                        if stop_when is not None and stop_when(content):
+                            logger.info("✂️ 已收到完整输出，提前结束生成")
+                            stopped_early = True
+                            break
+                finally:
+                    stream.close()
+            finally:
+                # 调用失败时也发出结束标记，等待 QueueSink / SSESink 的消费者不会一直阻塞
+                sink.on_end()
+            logger.info("✅ 大语言模型响应成功")
+            result = "".join(collected_content)
+
+            # stop_when 截断的输出不在缓存键中体现，不写入缓存，避免之后不带截断的调用命中半截回答
+            if cache_key is not None and not stopped_early:
+                self.cache.set(cache_key, result)
+            return result
+
+        except Exception as e:
+            logger.error(f"❌ 调用LLM API时发生错误: {e}")
+            return None
+
+    def invoke_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                          temperature: float = 0, tool_choice: Any = "auto") -> Optional[Dict[str, Any]]:
+        """
+        以原生 function calling 方式调用大语言模型（非流式）
+
+        与 think 共用重试、限流、多端点路由和指标记录。
+
+        Args:
+            messages: 消息列表，可以包含 assistant 的 tool_calls 消息和 tool 角色的结果消息
+            tools: OpenAI function calling 格式的工具定义
+            temperature: 温度参数
+            tool_choice: "auto" / "none" / "required" 或指定函数
+
+        Returns:
+            assistant 消息字典（role、content，需要调用工具时包含 tool_calls），失败时返回None
+        """
+        def attempt(timeout: Optional[float]) -> Iterator[Dict[str, Any]]:
+            yield self._request_with_tools(messages, tools, temperature, tool_choice, timeout)
 
+        try:
+            for message in retry_stream(attempt, self.retry_policy):
+                logger.info(f"✅ 大语言模型响应成功（工具调用 {len(message.get('tool_calls', []))} 个）")
+                return message
         except Exception as e:
             logger.error(f"❌ 调用LLM API时发生错误: {e}")
+        return None
+
+    def _request_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                            temperature: float, tool_choice: Any, timeout: Optional[float]) -> Dict[str, Any]:
+        """发送一次带工具定义的请求，配置了限流器时先排队获取许可，配置了路由器时失败会故障转移"""
+        prompt_tokens = self._count_prompt_tokens(messages)
+        limit = self.rate_limiter.limit(prompt_tokens + self.estimated_output_tokens, timeout) \
+            if self.rate_limiter is not None else nullcontext()
+        with limit as lease:
+            if lease is not None:
+                metrics.LLM_QUEUE_WAIT.observe(lease.wait_seconds, model=self.model,
+                                               agent=metrics.current_agent.get())
+                if timeout is not None:
+                    timeout -= lease.wait_seconds
+            candidates = self._candidate_endpoints()
+            for index, endpoint in enumerate(candidates):
+                model = (endpoint.model if endpoint else None) or self.model
+                logger.info(f"🧠 正在调用 {model} 模型（function calling）"
+                            f"{f' ({endpoint.name})' if endpoint else ''}...")
+                if endpoint is not None:
+                    self.router.acquire(endpoint.name)
+                start_time = time.perf_counter()
+                try:
+                    response = self._get_client(endpoint).chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        tools=tools,
+                        tool_choice=tool_choice,
+                        **self._request_options(timeout)
+                    )
+                except Exception as e:
+                    self._on_endpoint_failure(endpoint, e)
+                    if index == len(candidates) - 1 or not RetryPolicy.is_retryable(e):
+                        raise
+                    logger.warning(f"⚠️ 端点 {endpoint.name} 调用失败: {e}，故障转移到 {candidates[index + 1].name}")
+                    continue
+                finally:
+                    if endpoint is not None:
+                        self.router.release(endpoint.name)
+
+                result = self._tool_message(response.choices[0].message)
+                self._on_request_finished(endpoint, model, messages, None, [], [result["content"]],
+                                          response.usage, time.perf_counter() - start_time)
+                if lease is not None:
+                    lease.record_usage(prompt_tokens + self._completion_tokens(response.usage, result["content"]))
+                return result
+
+    @staticmethod
+    def _tool_message(message: Any) -> Dict[str, Any]:
+        """将SDK返回的消息转换为可以直接追加到 messages 的 assistant 消息字典"""
+        result: Dict[str, Any] = {"role": "assistant", "content": message.content or ""}
+        if message.tool_calls:
+            result["tool_calls"] = [{
+                "id": call.id,
+                "type": "function",
+                "function": {"name": call.function.name, "arguments": call.function.arguments}
+            } for call in message.tool_calls]
+        return result
+
+    @staticmethod
+    def _completion_tokens(usage: Any, content: str) -> int:
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        return completion_tokens if completion_tokens is not None else count_tokens(content)
+
+    async def astream(self, messages: List[Dict[str, str]], temperature: float = 0,
+                      stop: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """
+        异步流式调用大语言模型，逐个产出响应片段。
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            stop: 停止序列
+
+        Yields:
+            响应文本片段
+        """
+        if self.coalesce_requests:
+            loop = asyncio.get_running_loop()
+            single_flight = self._async_single_flights.get(loop)
+            if single_flight is None:
+                single_flight = self._async_single_flights[loop] = AsyncSingleFlight()
+            key = self._request_key(messages, temperature, stop)
+            async for content in single_flight.stream(
+                    key, lambda: self._aresilient_stream(messages, temperature, stop)):
+                yield content
+            return
+        async for content in self._aresilient_stream(messages, temperature, stop):
+            yield content
+
+    def _aresilient_stream(self, messages: List[Dict[str, str]], temperature: float,
+                           stop: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """_resilient_stream 的协程版本"""
+        def attempt(timeout: Optional[float]) -> AsyncIterator[str]:
+            delay = hedge_delay(self.retry_policy, self.ttft_tracker)
+            if delay is None:
+                return self._acreate_stream(messages, temperature, timeout, stop)
+            return ahedged_stream(lambda: self._acreate_stream(messages, temperature, timeout, stop), delay)
+
+        return aretry_stream(attempt, self.retry_policy)
+
+    async def _acreate_stream(self, messages: List[Dict[str, str]], temperature: float,
+                              timeout: Optional[float] = None,
+                              stop: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """向上游发起一次异步流式请求，配置了限流器时先排队获取许可"""
+        if self.rate_limiter is None:
+            async for content in self._arequest_stream(messages, temperature, timeout, stop):
+                yield content
+            return
+
+        prompt_tokens = self._count_prompt_tokens(messages)
+        async with self.rate_limiter.alimit(prompt_tokens + self.estimated_output_tokens, timeout) as lease:
+            metrics.LLM_QUEUE_WAIT.observe(lease.wait_seconds, model=self.model, agent=metrics.current_agent.get())
+            if timeout is not None:
+                timeout -= lease.wait_seconds
+            collected_content = []
+            try:
+                async for content in self._arequest_stream(messages, temperature, timeout, stop):
+                    collected_content.append(content)
+                    yield content
+            finally:
+                lease.record_usage(prompt_tokens + count_tokens("".join(collected_content)))
+
+    async def _arequest_stream(self, messages: List[Dict[str, str]], temperature: float,
+                               timeout: Optional[float] = None,
+                               stop: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """_request_stream 的协程版本"""
+        candidates = self._candidate_endpoints()
+        for index, endpoint in enumerate(candidates):
+            model = (endpoint.model if endpoint else None) or self.model
+            logger.info(f"🧠 正在异步调用 {model} 模型{f' ({endpoint.name})' if endpoint else ''}...")
+            if endpoint is not None:
+                self.router.acquire(endpoint.name)
+            start_time = last_chunk_time = time.perf_counter()
+            ttft = None
+            usage = None
+            gaps = []
+            collected_content = []
+            try:
+                response = await self._get_async_client(endpoint).chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **self._request_options(timeout, stop)
+                )
+                try:
+                    async for chunk in response:
+                        if getattr(chunk, "usage", None) is not None:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        content = chunk.choices[0].delta.content or ""
+                        if content:
+                            now = time.perf_counter()
+                            if ttft is None:
+                                ttft = now - start_time
+                                self.ttft_tracker.record(ttft)
+                            else:
+                                gaps.append(now - last_chunk_time)
+                            last_chunk_time = now
+                            collected_content.append(content)
+                            yield content
+                finally:
+                    # 提前结束迭代时及时释放连接回连接池
+                    await response.close()
+            except GeneratorExit:
+                # 调用方提前结束迭代（如已解析到完整输出），按成功的请求记录
+                self._on_request_finished(endpoint, model, messages, ttft, gaps, collected_content, usage,
+                                          time.perf_counter() - start_time)
+                raise
+            except Exception as e:
+                self._on_endpoint_failure(endpoint, e)
+                if ttft is not None or index == len(candidates) - 1 or not RetryPolicy.is_retryable(e):
+                    raise
+                logger.warning(f"⚠️ 端点 {endpoint.name} 调用失败: {e}，故障转移到 {candidates[index + 1].name}")
+                continue
+            finally:
+                if endpoint is not None:
+                    self.router.release(endpoint.name)
+
+            self._on_request_finished(endpoint, model, messages, ttft, gaps, collected_content, usage,
+                                      time.perf_counter() - start_time)
+            return
+
+    async def ainvoke_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                 temperature: float = 0, tool_choice: Any = "auto") -> Optional[Dict[str, Any]]:
+        """invoke_with_tools 的异步版本"""
+        async def attempt(timeout: Optional[float]) -> AsyncIterator[Dict[str, Any]]:
+            yield await self._arequest_with_tools(messages, tools, temperature, tool_choice, timeout)
+
+        try:
+            async for message in aretry_stream(attempt, self.retry_policy):
+                logger.info(f"✅ 大语言模型异步响应成功（工具调用 {len(message.get('tool_calls', []))} 个）")
+                return message
+        except Exception as e:
+            logger.error(f"❌ 异步调用LLM API时发生错误: {e}")
+        return None
+
+    async def _arequest_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                   temperature: float, tool_choice: Any, timeout: Optional[float]) -> Dict[str, Any]:
+        """_request_with_tools 的协程版本"""
+        prompt_tokens = self._count_prompt_tokens(messages)
+        limit = self.rate_limiter.alimit(prompt_tokens + self.estimated_output_tokens, timeout) \
+            if self.rate_limiter is not None else nullcontext()
+        async with limit as lease:
+            if lease is not None:
+                metrics.LLM_QUEUE_WAIT.observe(lease.wait_seconds, model=self.model,
+                                               agent=metrics.current_agent.get())
+                if timeout is not None:
+                    timeout -= lease.wait_seconds
+            candidates = self._candidate_endpoints()
+            for index, endpoint in enumerate(candidates):
+                model = (endpoint.model if endpoint else None) or self.model
+                logger.info(f"🧠 正在异步调用 {model} 模型（function calling）"
+                            f"{f' ({endpoint.name})' if endpoint else ''}...")
+                if endpoint is not None:
+                    self.router.acquire(endpoint.name)
+                start_time = time.perf_counter()
+                try:
+                    response = await self._get_async_client(endpoint).chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        tools=tools,
+                        tool_choice=tool_choice,
+                        **self._request_options(timeout)
+                    )
+                except Exception as e:
+                    self._on_endpoint_failure(endpoint, e)
+                    if index == len(candidates) - 1 or not RetryPolicy.is_retryable(e):
+                        raise
+                    logger.warning(f"⚠️ 端点 {endpoint.name} 调用失败: {e}，故障转移到 {candidates[index + 1].name}")
+                    continue
+                finally:
+                    if endpoint is not None:
+                        self.router.release(endpoint.name)
+
+                result = self._tool_message(response.choices[0].message)
+                self._on_request_finished(endpoint, model, messages, None, [], [result["content"]],
+                                          response.usage, time.perf_counter() - start_time)
+                if lease is not None:
+                    lease.record_usage(prompt_tokens + self._completion_tokens(response.usage, result["content"]))
+                return result
+
+    @timer_decorator
+    async def athink(self, messages: List[Dict[str, str]], temperature: float = 0,
+                     use_cache: bool = False, force_cache: bool = False,
+                     sink: Optional[StreamSink] = None, stop: Optional[List[str]] = None,
+                     stop_when: Optional[Callable[[str], bool]] = None) -> str:
+        """
+        think 的异步版本，不占用线程地等待完整响应。
+
+        与 think 不同，不提供 sink 时不输出流式片段。
+        """
+        sink = sink or NullSink()
+        cache_key = self._cache_key(messages, temperature, use_cache, force_cache, stop)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"⚡ 命中响应缓存，跳过 {self.model} 模型调用")
+                sink.on_start()
+                sink.write(cached)
+                sink.on_end()
+                return cached
+
+        try:
+            collected_content = []
+            stopped_early = False
+            sink.on_start()
+            try:
+                stream = self.astream(messages, temperature, stop)
+                try:
+                    async for content in stream:
+                        sink.write(content)
+                        collected_content.append(content)
+                        if stop_when is not None and stop_when(content):
+                            logger.info("✂️ 已收到完整输出，提前结束生成")
+                            stopped_early = True
+                            break
+                finally:
+                    await stream.aclose()
+            finally:
+                sink.on_end()
+            logger.info("✅ 大语言模型异步响应成功")
+            result = "".join(collected_content)
+
+            # stop_when 截断的输出不在缓存键中体现，不写入缓存，避免之后不带截断的调用命中半截回答
+            if cache_key is not None and not stopped_early:
+                self.cache.set(cache_key, result)
+            return result
+
+        except Exception as e:
+            logger.error(f"❌ 异步调用LLM API时发生错误: {e}")
             return None
 
 
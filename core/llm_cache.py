@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/20 14:02
+# @Author  : wang ke
+# @File    : llm_cache.py
+# @Software: PyCharm
+
+"""LLM响应缓存 - 进程内LRU + 可选SQLite磁盘层"""
+
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+
+
+class LLMResponseCache:
+    """
+    两级LLM响应缓存
+
+    1. 进程内LRU：按容量和TTL淘汰，命中时无需任何IO
+    2. SQLite磁盘层（可选）：进程重启或多进程之间共享已有响应
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600, sqlite_path: Optional[str] = None):
+        """
+        初始化缓存
+
+        Args:
+            max_size: 内存中最多保留的条目数
+            ttl: 条目有效期（秒），None表示永不过期
+            sqlite_path: SQLite数据库路径，不提供则只使用内存缓存
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._conn = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], temperature: float, **params: Any) -> str:
+        """
+        根据模型、归一化后的消息和调用参数生成缓存键
+
+        归一化只去除首尾空白并统一换行符，不改变消息的实际语义。
+        """
+        normalized_messages = [
+            {
+                "role": msg.get("role"),
+                "content": (msg.get("content") or "").replace("\r\n", "\n").strip()
+            }
+            for msg in messages
+        ]
+        payload = {
+            "model": model,
+            "messages": normalized_messages,
+            "temperature": round(float(temperature), 4),
+            "params": params,
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，未命中或已过期返回None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._is_expired(created_at):
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._is_expired(created_at):
+                        # 回填到内存层
+                        self._put_memory(key, value, created_at)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """写入缓存"""
+        created_at = time.time()
+        with self._lock:
+            self._put_memory(key, value, created_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, created_at)
+                )
+                self._conn.commit()
+
+    def _put_memory(self, key: str, value: str, created_at: float):
+        """写入内存层并按LRU淘汰（调用方需持有锁）"""
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._memory)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+    def close(self):
+        """关闭磁盘连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
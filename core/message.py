@@ -6,10 +6,13 @@
 # @Software: PyCharm
 
 
+import time
 from typing import Optional, Dict, Any, Literal
 from datetime import datetime
 from pydantic import BaseModel
 
+from utils.token_counter import count_message_tokens
+
 # 定义消息角色的类型，限制其取值
 MessageRole = Literal["user", "assistant", "system", "tool"]
 
@@ -39,3 +42,93 @@ class Message(BaseModel):
 
     def __str__(self) -> str:
         return f"[{self.role}] {self.content}"
+
+    @classmethod
+    def from_fast(cls, message: "FastMessage") -> "Message":
+        """由 FastMessage 转换，用于对外接口"""
+        return cls(message.content, message.role, timestamp=message.timestamp, metadata=dict(message.metadata or {}))
+
+
+class FastMessage:
+    """
+    热路径使用的轻量消息
+
+    不可变、使用 __slots__，除把非字符串内容转成字符串（None 视为空串）外不做校验；创建时间保存为 time.time() 的浮点数，
+    没有元数据时不分配字典。OpenAI格式的字典和token数在首次使用后缓存，
+    每轮组装提示词时不再重复构造和计数。pydantic 的 Message 只在对外接口处使用。
+
+    目标是构造耗时不超过 Message 的 1/3、单条内存不超过 Message 的 1/4（不含内容字符串），
+    用 benchmarks/message_bench.py 测量。
+    """
+
+    __slots__ = ("content", "role", "created", "metadata", "_dict", "_tokens")
+
+    def __init__(self, content: str, role: MessageRole, created: Optional[float] = None,
+                 metadata: Optional[Dict[str, Any]] = None):
+        # 直接调用槽描述符赋值，绕过禁止修改的 __setattr__，比 object.__setattr__ 更快；
+        # _dict / _tokens 在首次使用时才赋值
+        _set_content(self, content if content.__class__ is str else ("" if content is None else str(content)))
+        _set_role(self, role)
+        _set_created(self, time.time() if created is None else created)
+        _set_metadata(self, metadata)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("FastMessage 是不可变对象")
+
+    def __delattr__(self, name: str):
+        raise AttributeError("FastMessage 是不可变对象")
+
+    @classmethod
+    def from_message(cls, message: "Message") -> "FastMessage":
+        """由 pydantic Message 转换"""
+        created = message.timestamp.timestamp() if message.timestamp else None
+        return cls(message.content, message.role, created, message.metadata or None)
+
+    def to_message(self) -> Message:
+        return Message.from_fast(self)
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.created)
+
+    @property
+    def token_count(self) -> int:
+        """消息占用的token数（含格式开销），首次访问时计算"""
+        try:
+            return self._tokens
+        except AttributeError:
+            tokens = count_message_tokens(self.content)
+            _set_tokens(self, tokens)
+            return tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为OpenAI格式的字典，返回的是缓存的同一个对象，调用方不应修改"""
+        try:
+            return self._dict
+        except AttributeError:
+            result = {"role": self.role, "content": self.content}
+            _set_dict(self, result)
+            return result
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, FastMessage):
+            return NotImplemented
+        return (self.role, self.content, self.created, self.metadata) == \
+            (other.role, other.content, other.created, other.metadata)
+
+    def __hash__(self) -> int:
+        return hash((self.role, self.content, self.created))
+
+    def __repr__(self) -> str:
+        return f"FastMessage(role={self.role!r}, content={self.content!r})"
+
+    def __str__(self) -> str:
+        return f"[{self.role}] {self.content}"
+
+
+_set_content = FastMessage.content.__set__
+_set_role = FastMessage.role.__set__
+_set_created = FastMessage.created.__set__
+_set_metadata = FastMessage.metadata.__set__
+_set_dict = FastMessage._dict.__set__
+_set_tokens = FastMessage._tokens.__set__
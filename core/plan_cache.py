@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/12 10:05
+# @Author  : wang ke
+# @File    : plan_cache.py
+# @Software: PyCharm
+
+"""计划缓存 - 按归一化问题与字符n-gram相似度复用已有的执行计划"""
+
+import re
+import json
+import math
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+# 数字（含小数）在归一化时被替换为占位符，只有数字不同的模板化问题视为同一个问题
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+# 归一化时去掉的标点与空白
+_PUNCTUATION_PATTERN = re.compile(r"[\s\W_]+")
+# 小写化之后文本中不会出现大写字母，用作数字占位符不会与原文冲突
+_NUMBER_PLACEHOLDER = "N"
+# 步骤编号的上下文："步骤1"、"Step 1"、"第1步"、行首的"1." / "1、" / "1)"
+_STEP_PREFIX_PATTERN = re.compile(r"(?:步骤|step)\s*$", re.IGNORECASE)
+_LIST_MARKERS = ".、)）:："
+
+
+def normalize_question(question: str) -> str:
+    """
+    归一化问题文本：全半角统一、小写、数字替换为占位符、去掉标点与空白
+
+    Args:
+        question: 原始问题
+
+    Returns:
+        归一化后的文本
+    """
+    text = _NUMBER_PATTERN.sub(_NUMBER_PLACEHOLDER, unicodedata.normalize("NFKC", question).lower())
+    return _PUNCTUATION_PATTERN.sub("", text)
+
+
+def ngrams(text: str, sizes: Tuple[int, ...] = (2, 3)) -> Set[str]:
+    """字符n-gram集合，对中文无需分词"""
+    grams = set()
+    for size in sizes:
+        grams.update(text[i:i + size] for i in range(len(text) - size + 1))
+    return grams or {text}
+
+
+class PlanCacheEntry:
+    """一条缓存的计划"""
+
+    __slots__ = ("key", "namespace", "question", "normalized", "grams", "plan", "created_at", "reuses")
+
+    def __init__(self, key: str, namespace: str, question: str, plan: List[Dict[str, Any]], created_at: float):
+        self.key = key
+        self.namespace = namespace
+        self.question = question
+        self.normalized = normalize_question(question)
+        self.grams = ngrams(self.normalized)
+        self.plan = plan
+        self.created_at = created_at
+        self.reuses = 0
+
+
+class PlanCache:
+    """
+    执行计划缓存
+
+    查询时先按归一化问题精确匹配，再通过n-gram倒排索引找出共享片段的候选，
+    按n-gram集合的余弦相似度取最相似的一条，低于 min_similarity 视为未命中。
+    命中的计划会做轻量改写：两个问题中的数字一一对应时，把步骤描述里来自问题的旧数字替换为新数字；
+    数字无法一一对应、或无法确定某个数字是否来自问题时视为未命中（见 adapt_plan）。
+
+    过期控制：超过 ttl 或已被复用 max_reuses 次的条目视为过期并删除，下一次查询会重新规划。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 86400, min_similarity: float = 0.85,
+                 max_reuses: Optional[int] = None, sqlite_path: Optional[str] = None):
+        """
+        初始化计划缓存
+
+        Args:
+            max_size: 最多保留的计划数，超出时按LRU淘汰
+            ttl: 计划有效期（秒），None表示永不过期
+            min_similarity: 复用计划所需的最低相似度（0~1）
+            max_reuses: 单个计划最多被复用的次数，达到后重新规划以刷新，None表示不限
+            sqlite_path: SQLite数据库路径，提供时计划会持久化并在启动时载入
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self.max_reuses = max_reuses
+        self.sqlite_path = sqlite_path
+
+        self._entries: "OrderedDict[str, PlanCacheEntry]" = OrderedDict()
+        self._index: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "exact_hits": 0, "similar_hits": 0, "stale": 0, "evictions": 0}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._conn = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plan_cache (key TEXT PRIMARY KEY, namespace TEXT NOT NULL, "
+                "question TEXT NOT NULL, plan TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self._load()
+
+    @staticmethod
+    def make_key(question: str, namespace: str = "") -> str:
+        raw = f"{namespace}\n{normalize_question(question)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        """启动时载入最近的 max_size 条计划"""
+        rows = self._conn.execute(
+            "SELECT key, namespace, question, plan, created_at FROM plan_cache ORDER BY created_at DESC LIMIT ?",
+            (self.max_size,)
+        ).fetchall()
+        for key, namespace, question, plan, created_at in reversed(rows):
+            if not self._is_expired(created_at):
+                self._put(PlanCacheEntry(key, namespace, question, json.loads(plan), created_at))
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _is_stale(self, entry: PlanCacheEntry) -> bool:
+        return self._is_expired(entry.created_at) or (
+            self.max_reuses is not None and entry.reuses >= self.max_reuses)
+
+    def get(self, question: str, namespace: str = "") -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """
+        查询可复用的计划
+
+        Args:
+            question: 问题
+            namespace: 命名空间，不同的规划提示词或模型使用不同的命名空间，互不复用
+
+        Returns:
+            (改写后的计划, 相似度)，未命中返回None
+        """
+        normalized = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(self.make_key(question, namespace))
+            similarity = 1.0
+            if entry is None or self._is_stale(entry):
+                entry, similarity = self._most_similar(normalized, namespace)
+            plan = adapt_plan(entry.plan, entry.question, question) if entry is not None else None
+            if plan is None:
+                self._stats["misses"] += 1
+                return None
+
+            entry.reuses += 1
+            self._entries.move_to_end(entry.key)
+            self._stats["hits"] += 1
+            self._stats["exact_hits" if entry.normalized == normalized else "similar_hits"] += 1
+            return plan, similarity
+
+    def _most_similar(self, normalized: str, namespace: str) -> Tuple[Optional[PlanCacheEntry], float]:
+        """通过倒排索引找出最相似的未过期条目（调用方需持有锁）"""
+        grams = ngrams(normalized)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for key in self._index.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+
+        best, best_similarity = None, 0.0
+        for key, count in shared.items():
+            entry = self._entries[key]
+            similarity = count / math.sqrt(len(grams) * len(entry.grams))
+            if entry.namespace != namespace or similarity < self.min_similarity or similarity <= best_similarity:
+                continue
+            if self._is_stale(entry):
+                self._remove(entry)
+                self._stats["stale"] += 1
+                if self._conn is not None:
+                    self._conn.execute("DELETE FROM plan_cache WHERE key = ?", (entry.key,))
+                    self._conn.commit()
+                continue
+            best, best_similarity = entry, similarity
+        return best, best_similarity
+
+    def set(self, question: str, plan: List[Dict[str, Any]], namespace: str = ""):
+        """
+        写入计划
+
+        Args:
+            question: 问题
+            plan: 可JSON序列化的计划
+            namespace: 命名空间
+        """
+        key = self.make_key(question, namespace)
+        created_at = time.time()
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._remove(old)
+            self._put(PlanCacheEntry(key, namespace, question, plan, created_at))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO plan_cache (key, namespace, question, plan, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, namespace, question, json.dumps(plan, ensure_ascii=False), created_at)
+                )
+                self._conn.commit()
+
+    def invalidate(self, question: str, namespace: str = "") -> bool:
+        """删除某个问题的计划（例如按该计划执行的结果被判定为错误）"""
+        key = self.make_key(question, namespace)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._remove(entry)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM plan_cache WHERE key = ?", (key,))
+                self._conn.commit()
+            return entry is not None
+
+    def _put(self, entry: PlanCacheEntry):
+        """写入内存并按LRU淘汰（调用方需持有锁）"""
+        self._entries[entry.key] = entry
+        for gram in entry.grams:
+            self._index.setdefault(gram, set()).add(entry.key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries.values())))
+            self._stats["evictions"] += 1
+
+    def _remove(self, entry: PlanCacheEntry):
+        """从内存和倒排索引中删除（调用方需持有锁）"""
+        self._entries.pop(entry.key, None)
+        for gram in entry.grams:
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._index[gram]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM plan_cache")
+                self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def adapt_plan(plan: List[Dict[str, Any]], cached_question: str,
+               question: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    把缓存计划中的数字改写为新问题中的数字
+
+    两个问题的数字完全相同时原样返回；数字个数不同、或同一个旧数字对应了不同的新数字时无法改写，返回None。
+    计划里与旧数字相等的位置并不都来自问题：步骤编号（"步骤1"、"第1步"、行首的"1."）保持不变；
+    紧跟单位的数字只有单位与问题中一致时才改写，单位不一致说明它是计划自己的数字（年份、其他单位的量），
+    无法确定该如何改写，此时返回None，由调用方重新规划。
+
+    Args:
+        plan: 缓存的计划
+        cached_question: 生成该计划时的问题
+        question: 当前问题
+
+    Returns:
+        改写后的计划（不修改缓存中的原计划），无法安全改写时返回None
+    """
+    old_numbers = _NUMBER_PATTERN.findall(cached_question)
+    new_numbers = _NUMBER_PATTERN.findall(question)
+    if old_numbers == new_numbers:
+        return [dict(step) if isinstance(step, dict) else step for step in plan]
+    if len(old_numbers) != len(new_numbers):
+        # 数字个数不同，无法确定对应关系，原计划里的数字必然有错
+        return None
+    mapping: Dict[str, str] = {}
+    for old, new in zip(old_numbers, new_numbers):
+        if mapping.setdefault(old, new) != new:
+            # 同一个旧数字对应了不同的新数字（如"3个苹果，每个3元" → "3个苹果，每个5元"），无法改写
+            return None
+    mapping = {old: new for old, new in mapping.items() if old != new}
+
+    # 问题中每个数字后面紧跟的单位
+    units: Dict[str, Set[str]] = {}
+    for match in _NUMBER_PATTERN.finditer(cached_question):
+        units.setdefault(match.group(0), set()).add(_unit_after(cached_question, match.end()))
+
+    ambiguous = False
+
+    def replace(text: str) -> str:
+        def substitute(match) -> str:
+            nonlocal ambiguous
+            number = match.group(0)
+            if number not in mapping or _is_step_index(text, match.start(), match.end()):
+                return number
+            unit = _unit_after(text, match.end())
+            if unit and unit not in units[number]:
+                ambiguous = True
+                return number
+            return mapping[number]
+
+        return _NUMBER_PATTERN.sub(substitute, text)
+
+    adapted = []
+    for step in plan:
+        if isinstance(step, dict):
+            step = {name: replace(value) if isinstance(value, str) else value for name, value in step.items()}
+        elif isinstance(step, str):
+            step = replace(step)
+        adapted.append(step)
+    return None if ambiguous else adapted
+
+
+def _unit_after(text: str, end: int) -> str:
+    """数字后面紧跟的单位字符（字母、汉字或百分号），没有单位返回空串"""
+    if end < len(text):
+        char = text[end].lower()
+        if char.isalpha() or char in "%％‰":
+            return char
+    return ""
+
+
+def _is_step_index(text: str, start: int, end: int) -> bool:
+    """判断数字是否是计划自身的步骤编号"""
+    before = text[:start]
+    if _STEP_PREFIX_PATTERN.search(before):
+        return True
+    if before.endswith("第") and text[end:end + 1] == "步":
+        return True
+    marker = text[end:end + 1]
+    if marker and marker in _LIST_MARKERS:
+        return not before[before.rfind("\n") + 1:].strip()
+    return False
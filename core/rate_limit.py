@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/26 9:31
+# @Author  : wang ke
+# @File    : rate_limit.py
+# @Software: PyCharm
+
+"""服务商级限流 - 每分钟请求数/Token数的令牌桶 + 最大并发控制"""
+
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any, Deque, Union
+
+
+class TokenBucket:
+    """
+    进程内令牌桶
+
+    采用预约方式：每次预约立即扣减令牌（余额可以为负），并返回需要等待的时间。
+    先预约的调用者等待时间更短，因此天然按到达顺序公平排队，不会因为抢不到令牌而失败。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: 每分钟补充的令牌数
+            capacity: 桶容量（允许的突发量），默认等于每分钟令牌数
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """预约令牌，返回需要等待的秒数"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate_per_second)
+
+    def adjust(self, delta: float):
+        """按实际用量修正余额：delta>0 追加扣减，delta<0 返还"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+
+class SQLiteTokenBucket:
+    """
+    基于SQLite的跨进程令牌桶，语义与 TokenBucket 相同
+
+    同一台机器上的多个工作进程指向同一个数据库文件即可共享限额。
+    """
+
+    def __init__(self, path: str, name: str, rate_per_minute: float, capacity: Optional[float] = None):
+        self.path = path
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (name, self.capacity, time.time())
+            )
+
+    def _apply(self, delta: float) -> float:
+        """在一个写事务中补充令牌并扣减 delta，返回扣减后的余额"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, updated_at = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate_per_second)
+                tokens = min(self.capacity, tokens - delta)
+                self._conn.execute(
+                    "UPDATE rate_buckets SET tokens = ?, updated_at = ? WHERE name = ?", (tokens, now, self.name)
+                )
+                self._conn.execute("COMMIT")
+                return tokens
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def reserve(self, amount: float) -> float:
+        """预约令牌，返回需要等待的秒数"""
+        tokens = self._apply(amount)
+        return max(0.0, -tokens / self.rate_per_second)
+
+    def adjust(self, delta: float):
+        """按实际用量修正余额"""
+        self._apply(delta)
+
+
+class ConcurrencyGovernor:
+    """
+    进程内最大并发控制（FIFO公平）
+
+    释放时直接把名额移交给队首的等待者，线程和协程可以混合排队。
+    等待超时的调用者抛出 TimeoutError。
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self._waiters: Deque[Union[threading.Event, "asyncio.Future"]] = deque()
+        # 已移交名额、但协程尚未被唤醒的等待者
+        self._granted: set = set()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        获取并发名额
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+        """
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        if not event.wait(None if timeout is None else max(timeout, 0.0)):
+            with self._lock:
+                if event in self._waiters:
+                    self._waiters.remove(event)
+                    raise TimeoutError(f"等待并发名额超过 {timeout:.2f} 秒")
+            # 超时的同时名额已经移交过来，照常持有
+
+    async def acquire_async(self, timeout: Optional[float] = None):
+        """acquire 的协程版本"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return
+            future = loop.create_future()
+            self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, None if timeout is None else max(timeout, 0.0))
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            with self._lock:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+                    granted = False
+                else:
+                    granted = future in self._granted
+                    self._granted.discard(future)
+            if granted:
+                # 名额已经移交给了被取消或超时的协程，需要继续传递
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise TimeoutError(f"等待并发名额超过 {timeout:.2f} 秒") from None
+            raise
+        with self._lock:
+            self._granted.discard(future)
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                if not waiter.done():
+                    # 名额直接移交，_active 保持不变
+                    self._granted.add(waiter)
+                    waiter.get_loop().call_soon_threadsafe(_resolve_future, waiter)
+                    return
+            self._active -= 1
+
+
+def _resolve_future(future: "asyncio.Future"):
+    if not future.done():
+        future.set_result(None)
+
+
+class SQLiteConcurrencyGovernor:
+    """
+    基于SQLite的跨进程最大并发控制
+
+    每个等待者和持有者在表中占一行，按自增ID先到先得；
+    行带有租约过期时间，进程崩溃后遗留的名额会在租约到期后自动回收。
+    """
+
+    def __init__(self, path: str, name: str, max_concurrency: int, lease_seconds: float = 600,
+                 poll_interval: float = 0.02):
+        self.path = path
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_slots (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+                "holding INTEGER NOT NULL DEFAULT 0, expires_at REAL NOT NULL)"
+            )
+
+    @property
+    def active(self) -> int:
+        return self._count(holding=1)
+
+    @property
+    def waiting(self) -> int:
+        return self._count(holding=0)
+
+    def _count(self, holding: int) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM rate_slots WHERE name = ? AND holding = ? AND expires_at >= ?",
+                (self.name, holding, time.time())
+            ).fetchone()[0]
+
+    def _enqueue(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO rate_slots (name, holding, expires_at) VALUES (?, 0, ?)",
+                (self.name, time.time() + self.lease_seconds)
+            )
+            return cursor.lastrowid
+
+    def _try_acquire(self, slot_id: int) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._conn.execute("DELETE FROM rate_slots WHERE name = ? AND expires_at < ?", (self.name, now))
+                holding = self._conn.execute(
+                    "SELECT COUNT(*) FROM rate_slots WHERE name = ? AND holding = 1", (self.name,)
+                ).fetchone()[0]
+                head = self._conn.execute(
+                    "SELECT MIN(id) FROM rate_slots WHERE name = ? AND holding = 0", (self.name,)
+                ).fetchone()[0]
+                granted = holding < self.max_concurrency and head == slot_id
+                # 获得名额或继续等待都刷新租约
+                self._conn.execute(
+                    "UPDATE rate_slots SET holding = ?, expires_at = ? WHERE id = ?",
+                    (1 if granted else 0, now + self.lease_seconds, slot_id)
+                )
+                self._conn.execute("COMMIT")
+                return granted
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _remove(self, slot_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_slots WHERE id = ?", (slot_id,))
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        slot_id = self._enqueue()
+        try:
+            while not self._try_acquire(slot_id):
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待并发名额超过 {timeout:.2f} 秒")
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self._remove(slot_id)
+            raise
+        return slot_id
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> int:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        slot_id = self._enqueue()
+        try:
+            while not self._try_acquire(slot_id):
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待并发名额超过 {timeout:.2f} 秒")
+                await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            self._remove(slot_id)
+            raise
+        return slot_id
+
+    def release(self, slot_id: int):
+        self._remove(slot_id)
+
+
+class RateLimitLease:
+    """一次获得的限流许可，用于在请求结束后按实际用量修正Token桶"""
+
+    def __init__(self, limiter: "RateLimiter", estimated_tokens: int, wait_seconds: float):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.wait_seconds = wait_seconds
+
+    def record_usage(self, actual_tokens: int):
+        """
+        记录实际消耗的token数
+
+        Args:
+            actual_tokens: 提示词与生成内容的实际token总数
+        """
+        if self.limiter.token_bucket is not None:
+            self.limiter.token_bucket.adjust(actual_tokens - self.estimated_tokens)
+
+
+class RateLimiter:
+    """
+    服务商级限流器
+
+    组合了三种限制，超限的调用者排队等待而不是失败：
+    1. 每分钟请求数（RPM）令牌桶
+    2. 每分钟Token数（TPM）令牌桶
+    3. 最大并发数
+
+    提供 sqlite_path 时，三者都通过本地SQLite文件在多个工作进程之间共享。
+    同一个 RateLimiter 实例可以被多个 AgentsLLM 共享。
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: Optional[float] = None,
+            tokens_per_minute: Optional[float] = None,
+            max_concurrency: Optional[int] = None,
+            sqlite_path: Optional[str] = None,
+            name: str = "default"
+    ):
+        """
+        Args:
+            requests_per_minute: 每分钟最大请求数
+            tokens_per_minute: 每分钟最大token数
+            max_concurrency: 最大并发请求数
+            sqlite_path: 跨进程共享计数的SQLite文件路径（可选）
+            name: 限额名称，同一文件中不同名称的限额互相独立
+        """
+        self.name = name
+        self.request_bucket = None
+        self.token_bucket = None
+        self.governor = None
+
+        if requests_per_minute:
+            self.request_bucket = SQLiteTokenBucket(sqlite_path, f"{name}:rpm", requests_per_minute) \
+                if sqlite_path else TokenBucket(requests_per_minute)
+        if tokens_per_minute:
+            self.token_bucket = SQLiteTokenBucket(sqlite_path, f"{name}:tpm", tokens_per_minute) \
+                if sqlite_path else TokenBucket(tokens_per_minute)
+        if max_concurrency:
+            self.governor = SQLiteConcurrencyGovernor(sqlite_path, name, max_concurrency) \
+                if sqlite_path else ConcurrencyGovernor(max_concurrency)
+
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._stats = {"acquired": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        """预约RPM和TPM令牌，返回需要等待的秒数"""
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            delay = max(delay, self.token_bucket.reserve(estimated_tokens))
+        return delay
+
+    def _refund(self, estimated_tokens: int):
+        """放弃排队时返还已预约但未使用的令牌"""
+        if self.request_bucket is not None:
+            self.request_bucket.adjust(-1)
+        if self.token_bucket is not None:
+            self.token_bucket.adjust(-estimated_tokens)
+
+    def _enter_queue(self):
+        with self._stats_lock:
+            self._queued += 1
+
+    def _leave_queue(self, wait_seconds: float):
+        with self._stats_lock:
+            self._queued -= 1
+            self._stats["acquired"] += 1
+            self._stats["total_wait_seconds"] += wait_seconds
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], wait_seconds)
+
+    @staticmethod
+    def _check_delay(delay: float, timeout: Optional[float]):
+        """令牌等待时间超过剩余时间时直接放弃，而不是睡到截止时间之后"""
+        if timeout is not None and delay > timeout:
+            raise TimeoutError(f"限流需要等待 {delay:.2f} 秒，超过剩余时间 {max(timeout, 0.0):.2f} 秒")
+
+    @staticmethod
+    def _remaining(start: float, timeout: Optional[float]) -> Optional[float]:
+        return None if timeout is None else timeout - (time.monotonic() - start)
+
+    @contextmanager
+    def limit(self, estimated_tokens: int = 0, timeout: Optional[float] = None):
+        """
+        阻塞直到获得许可，退出上下文时释放并发名额
+
+        Args:
+            estimated_tokens: 本次请求预计消耗的token数
+            timeout: 最长排队时间（秒），超过时抛出 TimeoutError，None表示一直等待
+
+        Yields:
+            RateLimitLease
+        """
+        start = time.monotonic()
+        self._enter_queue()
+        slot = None
+        acquired = False
+        try:
+            # 先等令牌再占并发名额，等待TPM令牌的请求不会占着名额挡住其他请求
+            delay = self._reserve(estimated_tokens)
+            self._check_delay(delay, timeout)
+            if delay > 0:
+                time.sleep(delay)
+            if self.governor is not None:
+                slot = self.governor.acquire(self._remaining(start, timeout))
+                acquired = True
+        except BaseException:
+            self._leave_queue(time.monotonic() - start)
+            if acquired:
+                self._release(slot)
+            else:
+                self._refund(estimated_tokens)
+            raise
+        wait_seconds = time.monotonic() - start
+        self._leave_queue(wait_seconds)
+
+        try:
+            yield RateLimitLease(self, estimated_tokens, wait_seconds)
+        finally:
+            if self.governor is not None:
+                self._release(slot)
+
+    @asynccontextmanager
+    async def alimit(self, estimated_tokens: int = 0, timeout: Optional[float] = None):
+        """limit 的协程版本，排队期间不占用线程"""
+        start = time.monotonic()
+        self._enter_queue()
+        slot = None
+        acquired = False
+        try:
+            delay = self._reserve(estimated_tokens)
+            self._check_delay(delay, timeout)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.governor is not None:
+                slot = await self.governor.acquire_async(self._remaining(start, timeout))
+                acquired = True
+        except BaseException:
+            self._leave_queue(time.monotonic() - start)
+            if acquired:
+                self._release(slot)
+            else:
+                self._refund(estimated_tokens)
+            raise
+        wait_seconds = time.monotonic() - start
+        self._leave_queue(wait_seconds)
+
+        try:
+            yield RateLimitLease(self, estimated_tokens, wait_seconds)
+        finally:
+            if self.governor is not None:
+                self._release(slot)
+
+    def _release(self, slot: Optional[int]):
+        if isinstance(self.governor, SQLiteConcurrencyGovernor):
+            if slot is not None:
+                self.governor.release(slot)
+        else:
+            self.governor.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取限流统计
+
+        Returns:
+            queue_depth: 当前排队的调用者数量
+            in_flight: 当前持有并发名额的请求数
+            acquired / total_wait_seconds / max_wait_seconds / avg_wait_seconds: 累计等待统计
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._queued
+        stats["in_flight"] = self.governor.active if self.governor is not None else None
+        stats["avg_wait_seconds"] = stats["total_wait_seconds"] / stats["acquired"] if stats["acquired"] else 0.0
+        return stats
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/27 10:20
+# @Author  : wang ke
+# @File    : retry.py
+# @Software: PyCharm
+
+"""LLM调用的重试、指数退避与对冲请求"""
+
+import time
+import queue
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from typing import Optional, Callable, Iterator, AsyncIterator, Deque
+
+import openai
+from pydantic import BaseModel
+
+from utils.log import Log
+
+logger = Log()
+
+
+class DeadlineExceeded(TimeoutError):
+    """超过了单次调用的总截止时间"""
+
+
+class RetryPolicy(BaseModel):
+    """重试与对冲策略"""
+
+    # 重试配置
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    jitter: bool = True
+
+    # 单次调用的总截止时间（秒），包含限流排队、重试和生成；
+    # 剩余时间同时作为排队上限和单次请求的超时，流式生成中途超过截止时间也会中断
+    deadline: Optional[float] = None
+
+    # 对冲配置：首个请求在 p{hedge_quantile} 的首token时间内没有返回首token时，发起第二个请求
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 0.5
+    hedge_min_samples: int = 20
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """
+        计算第 attempt 次失败后的等待时间
+
+        服务端返回 Retry-After 时优先遵守，否则使用带全抖动的指数退避。
+        """
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        """判断错误是否值得重试：网络错误、超时、限流和服务端错误"""
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in (408, 409, 429) or error.status_code >= 500
+        return False
+
+
+def _retry_after_seconds(error: Optional[BaseException]) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LatencyTracker:
+    """滚动窗口内的延迟分位数统计"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+def hedge_delay(policy: RetryPolicy, tracker: LatencyTracker) -> Optional[float]:
+    """根据历史首token时间计算对冲延迟，样本不足或未启用对冲时返回None"""
+    if not policy.hedge or len(tracker) < max(1, policy.hedge_min_samples):
+        return None
+    return max(policy.hedge_min_delay, tracker.quantile(policy.hedge_quantile))
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _check_deadline(deadline: Optional[float], policy: RetryPolicy):
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded(f"调用超过截止时间 {policy.deadline} 秒")
+
+
+def retry_stream(
+        factory: Callable[[Optional[float]], Iterator[str]],
+        policy: RetryPolicy
+) -> Iterator[str]:
+    """
+    带重试的流式调用
+
+    只有在产出首个片段之前失败才会重试，已经输出的内容不会被重复发送。
+
+    Args:
+        factory: 发起一次请求的函数，参数为剩余超时时间（秒，可能为None）
+        policy: 重试策略
+    """
+    deadline = time.monotonic() + policy.deadline if policy.deadline else None
+    attempt = 0
+    while True:
+        attempt += 1
+        emitted = False
+        stream = factory(_remaining(deadline))
+        try:
+            # 单次请求的超时只约束每次读操作，持续输出的流需要在这里检查总截止时间
+            for content in stream:
+                _check_deadline(deadline, policy)
+                emitted = True
+                yield content
+            return
+        except Exception as e:
+            if emitted or attempt >= policy.max_attempts or not policy.is_retryable(e):
+                raise
+            delay = policy.backoff(attempt, e)
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= delay:
+                raise
+            logger.warning(f"⚠️ 第 {attempt} 次调用失败: {e}，{delay:.2f}秒后重试")
+            time.sleep(delay)
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+
+
+async def aretry_stream(
+        factory: Callable[[Optional[float]], AsyncIterator[str]],
+        policy: RetryPolicy
+) -> AsyncIterator[str]:
+    """retry_stream 的协程版本"""
+    deadline = time.monotonic() + policy.deadline if policy.deadline else None
+    attempt = 0
+    while True:
+        attempt += 1
+        emitted = False
+        stream = factory(_remaining(deadline))
+        try:
+            async for content in stream:
+                _check_deadline(deadline, policy)
+                emitted = True
+                yield content
+            return
+        except Exception as e:
+            if emitted or attempt >= policy.max_attempts or not policy.is_retryable(e):
+                raise
+            delay = policy.backoff(attempt, e)
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= delay:
+                raise
+            logger.warning(f"⚠️ 第 {attempt} 次调用失败: {e}，{delay:.2f}秒后重试")
+            await asyncio.sleep(delay)
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+
+
+def hedged_stream(factory: Callable[[], Iterator[str]], delay: float) -> Iterator[str]:
+    """
+    对冲流式调用
+
+    先发起一个请求，若 delay 秒内没有收到首个片段，再发起第二个相同请求，
+    采用先返回首个片段的那个，另一个在收到下一个片段时被关闭。
+    """
+    results: "queue.Queue[tuple]" = queue.Queue()
+    cancel_events = []
+
+    def launch():
+        attempt_id = len(cancel_events)
+        cancel_event = threading.Event()
+        cancel_events.append(cancel_event)
+
+        def run():
+            stream = None
+            try:
+                stream = factory()
+                for content in stream:
+                    if cancel_event.is_set():
+                        break
+                    results.put((attempt_id, "chunk", content))
+                results.put((attempt_id, "done", None))
+            except Exception as e:
+                results.put((attempt_id, "error", e))
+            finally:
+                if stream is not None and hasattr(stream, "close"):
+                    stream.close()
+
+        # 每个请求线程使用调用方上下文的独立副本，保留 metrics.current_agent 等上下文变量
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+
+    launch()
+    winner = None
+    failed = set()
+    try:
+        while True:
+            try:
+                wait = delay if winner is None and len(cancel_events) == 1 else None
+                attempt_id, kind, payload = results.get(timeout=wait)
+            except queue.Empty:
+                logger.info(f"⏱️ {delay:.2f}秒内未收到首token，发起对冲请求")
+                launch()
+                continue
+
+            if winner is None:
+                if kind == "error":
+                    failed.add(attempt_id)
+                    if len(failed) == len(cancel_events):
+                        raise payload
+                    continue
+                winner = attempt_id
+                for i, cancel_event in enumerate(cancel_events):
+                    if i != winner:
+                        cancel_event.set()
+
+            if attempt_id != winner:
+                continue
+            if kind == "chunk":
+                yield payload
+            elif kind == "done":
+                return
+            else:
+                raise payload
+    finally:
+        for cancel_event in cancel_events:
+            cancel_event.set()
+
+
+async def ahedged_stream(factory: Callable[[], AsyncIterator[str]], delay: float) -> AsyncIterator[str]:
+    """hedged_stream 的协程版本，落选的请求会被直接取消"""
+    results: "asyncio.Queue[tuple]" = asyncio.Queue()
+    tasks = []
+
+    def launch():
+        attempt_id = len(tasks)
+
+        async def run():
+            try:
+                async for content in factory():
+                    await results.put((attempt_id, "chunk", content))
+                await results.put((attempt_id, "done", None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await results.put((attempt_id, "error", e))
+
+        tasks.append(asyncio.get_running_loop().create_task(run()))
+
+    launch()
+    winner = None
+    failed = set()
+    try:
+        while True:
+            try:
+                if winner is None and len(tasks) == 1:
+                    attempt_id, kind, payload = await asyncio.wait_for(results.get(), delay)
+                else:
+                    attempt_id, kind, payload = await results.get()
+            except asyncio.TimeoutError:
+                logger.info(f"⏱️ {delay:.2f}秒内未收到首token，发起对冲请求")
+                launch()
+                continue
+
+            if winner is None:
+                if kind == "error":
+                    failed.add(attempt_id)
+                    if len(failed) == len(tasks):
+                        raise payload
+                    continue
+                winner = attempt_id
+                for i, task in enumerate(tasks):
+                    if i != winner:
+                        task.cancel()
+
+            if attempt_id != winner:
+                continue
+            if kind == "chunk":
+                yield payload
+            elif kind == "done":
+                return
+            else:
+                raise payload
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/28 10:05
+# @Author  : wang ke
+# @File    : router.py
+# @Software: PyCharm
+
+"""多端点路由 - 按滚动延迟、吞吐和错误率在本地/云端Ollama之间选择"""
+
+import time
+import random
+import threading
+from typing import Optional, List, Dict, Any
+
+from pydantic import BaseModel
+
+from utils.log import Log
+
+logger = Log()
+
+
+class Endpoint(BaseModel):
+    """一个兼容OpenAI接口的服务端点"""
+
+    name: str
+    base_url: str
+    api_key: str = "ollama"
+    model: Optional[str] = None
+    # 权重越大越优先，用于显式偏好（如优先使用本地算力）
+    weight: float = 1.0
+    # 同时在途请求上限，超过后溢出到其他端点；None表示不限
+    max_in_flight: Optional[int] = None
+
+
+class EndpointStats:
+    """端点的滚动统计（指数加权移动平均）"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.ttft: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def _ewma(self, old: Optional[float], new: float) -> float:
+        return new if old is None else old + self.alpha * (new - old)
+
+    def record_success(self, ttft: Optional[float], tokens: int, duration: float):
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+        if ttft is not None:
+            self.ttft = self._ewma(self.ttft, ttft)
+            generation_time = duration - ttft
+            if tokens > 1 and generation_time > 0:
+                self.tokens_per_second = self._ewma(self.tokens_per_second, tokens / generation_time)
+
+    def record_failure(self):
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ttft": self.ttft,
+            "tokens_per_second": self.tokens_per_second,
+            "error_rate": self.error_rate,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.open_until <= time.monotonic(),
+        }
+
+
+class EndpointRouter:
+    """
+    延迟感知的多端点路由器
+
+    每次调用按预估耗时（首token时间 + 生成时间，按错误率惩罚、按权重折算）对健康端点排序；
+    连续失败的端点会被熔断一段时间，熔断期间只作为最后的故障转移候选。
+    """
+
+    def __init__(
+            self,
+            endpoints: List[Endpoint],
+            expected_output_tokens: int = 256,
+            failure_threshold: int = 3,
+            cooldown: float = 30.0,
+            alpha: float = 0.2,
+            explore_ratio: float = 0.05
+    ):
+        """
+        Args:
+            endpoints: 端点列表
+            expected_output_tokens: 估算生成时间时假设的输出token数
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 熔断持续时间（秒）
+            alpha: 滚动统计的平滑系数
+            explore_ratio: 随机探索非最优端点的概率，保持各端点统计新鲜
+        """
+        if not endpoints:
+            raise ValueError("至少需要提供一个端点")
+        self.endpoints = {endpoint.name: endpoint for endpoint in endpoints}
+        self.expected_output_tokens = expected_output_tokens
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.explore_ratio = explore_ratio
+        self._stats = {endpoint.name: EndpointStats(alpha) for endpoint in endpoints}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, local_weight: float = 2.0, local_max_in_flight: Optional[int] = 4, **kwargs) -> "EndpointRouter":
+        """
+        根据 settings.config 中的本地与云端Ollama配置创建路由器
+
+        本地端点默认权重更高并限制并发，满载后溢出到云端。
+        本地服务与云端提供的模型不同，未配置本地模型时不注册本地端点，只使用云端。
+        """
+        from settings.config import OLLAMA_LOCAL_URL, OLLAMA_LOCAL_MODEL, OLLAMA_CLOUD_URL, OLLAMA_KEY, \
+            OLLAMA_CLOUD_MODEL
+
+        endpoints = []
+        if OLLAMA_LOCAL_URL and not OLLAMA_LOCAL_MODEL:
+            logger.warning("⚠️ 配置了本地Ollama地址但未配置本地模型（ollama.local.model），跳过本地端点")
+        elif OLLAMA_LOCAL_URL:
+            endpoints.append(Endpoint(
+                name="local",
+                base_url=OLLAMA_LOCAL_URL,
+                model=OLLAMA_LOCAL_MODEL,
+                weight=local_weight,
+                max_in_flight=local_max_in_flight
+            ))
+        endpoints.append(Endpoint(name="cloud", base_url=OLLAMA_CLOUD_URL, api_key=OLLAMA_KEY, model=OLLAMA_CLOUD_MODEL))
+        return cls(endpoints, **kwargs)
+
+    def _score(self, endpoint: Endpoint, stats: EndpointStats) -> float:
+        """预估耗时，越小越好；没有统计数据的端点得分为0以便尽快被采样"""
+        if stats.ttft is None:
+            return 0.0
+        generation = self.expected_output_tokens / stats.tokens_per_second if stats.tokens_per_second else 0.0
+        return (stats.ttft + generation) * (1 + 4 * stats.error_rate) / max(endpoint.weight, 1e-6)
+
+    def rank(self) -> List[Endpoint]:
+        """
+        返回本次调用的候选端点，按优先级排序
+
+        顺序为：健康且未满载的端点（按得分） -> 满载的端点 -> 熔断中的端点，
+        调用方应依次尝试以实现故障转移。
+        """
+        now = time.monotonic()
+        with self._lock:
+            available, saturated, broken = [], [], []
+            for name, endpoint in self.endpoints.items():
+                stats = self._stats[name]
+                if stats.open_until > now:
+                    broken.append(endpoint)
+                elif endpoint.max_in_flight is not None and stats.in_flight >= endpoint.max_in_flight:
+                    saturated.append(endpoint)
+                else:
+                    available.append(endpoint)
+            available.sort(key=lambda e: self._score(e, self._stats[e.name]))
+            saturated.sort(key=lambda e: self._stats[e.name].in_flight / max(e.max_in_flight or 1, 1))
+            broken.sort(key=lambda e: self._stats[e.name].open_until)
+
+        if len(available) > 1 and random.random() < self.explore_ratio:
+            explored = available.pop(random.randrange(1, len(available)))
+            available.insert(0, explored)
+        return available + saturated + broken
+
+    def acquire(self, name: str):
+        """标记一个请求开始使用该端点"""
+        with self._lock:
+            self._stats[name].in_flight += 1
+
+    def release(self, name: str):
+        with self._lock:
+            self._stats[name].in_flight -= 1
+
+    def record_success(self, name: str, ttft: Optional[float], tokens: int, duration: float):
+        """记录一次成功调用"""
+        with self._lock:
+            stats = self._stats[name]
+            stats.record_success(ttft, tokens, duration)
+            stats.open_until = 0.0
+
+    def record_failure(self, name: str):
+        """记录一次失败调用，连续失败达到阈值时熔断"""
+        with self._lock:
+            stats = self._stats[name]
+            stats.record_failure()
+            if stats.consecutive_failures >= self.failure_threshold:
+                stats.open_until = time.monotonic() + self.cooldown
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各端点的滚动统计"""
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
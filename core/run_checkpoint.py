@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/10 10:30
+# @Author  : wang ke
+# @File    : run_checkpoint.py
+# @Software: PyCharm
+
+"""运行检查点 - 按 run id 保存多步Agent的步骤级进度，进程重启后从最后完成的步骤继续"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List
+
+from utils.log import Log
+
+logger = Log()
+
+
+class RunCheckpointStore:
+    """
+    本地目录中的运行检查点
+
+    每个run一个JSON文件，每完成一步整体重写一次：先写临时文件并 fsync，再原子替换，
+    任何时刻崩溃都只会留下上一步或这一步的完整状态。
+    """
+
+    def __init__(self, root: str, sync: bool = True):
+        """
+        Args:
+            root: 存储目录
+            sync: 保存时是否 fsync，关闭后更快但掉电可能丢失最近一步
+        """
+        self.root = root
+        self.sync = sync
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, run_id: str) -> str:
+        digest = hashlib.sha1(run_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, f"{digest}.json")
+
+    def load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """读取检查点，不存在或已损坏时返回None"""
+        try:
+            with open(self.path(run_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ 检查点读取失败，将重新开始: {run_id}: {e}")
+            return None
+
+    def save(self, run_id: str, state: Dict[str, Any]):
+        """
+        保存检查点
+
+        Args:
+            run_id: 运行ID
+            state: 可JSON序列化的状态
+        """
+        path = self.path(run_id)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        data = json.dumps({**state, "run_id": run_id, "updated_at": time.time()}, ensure_ascii=False)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            if self.sync:
+                f.flush()
+                os.fsync(f.fileno())
+        with self._lock:
+            os.replace(temp_path, path)
+
+    def delete(self, run_id: str) -> bool:
+        try:
+            os.remove(self.path(run_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list_runs(self) -> List[str]:
+        """列出所有未完成的run id"""
+        runs = []
+        for name in os.listdir(self.root):
+            if name.endswith(".json"):
+                state = self.load_file(os.path.join(self.root, name))
+                if state and "run_id" in state:
+                    runs.append(state["run_id"])
+        return runs
+
+    @staticmethod
+    def load_file(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+
+def restore_state(store: Optional[RunCheckpointStore], run_id: Optional[str], agent: str,
+                  input_text: str) -> Optional[Dict[str, Any]]:
+    """
+    读取可用于续跑的检查点
+
+    只有同一类Agent、同一个问题的检查点才会被采用，run id 被复用于其他问题时从头开始。
+
+    Args:
+        store: 检查点存储，为None时不续跑
+        run_id: 运行ID，为None时不续跑
+        agent: Agent类型标识
+        input_text: 本次的问题
+
+    Returns:
+        检查点状态，无可用检查点时返回None
+    """
+    if store is None or run_id is None:
+        return None
+    state = store.load(run_id)
+    if state is None:
+        return None
+    if state.get("agent") != agent or state.get("input") != input_text:
+        logger.warning(f"⚠️ 检查点 {run_id} 与本次任务不匹配，忽略并重新开始")
+        return None
+    return state
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/5 10:20
+# @Author  : wang ke
+# @File    : session_store.py
+# @Software: PyCharm
+
+"""
+会话持久化 - 每个会话一个追加写的二进制日志
+
+记录格式（大端）：
+    | 载荷长度 u32 | crc32 u32 | 载荷 | 载荷长度 u32 |
+    载荷 = | 角色 u8 | 时间戳 f64 | 内容长度 u32 | 内容(UTF-8) | 元数据(JSON，可为空) |
+
+尾部重复的长度使日志可以从文件末尾向前读取，加载最近窗口时不需要扫描整个文件；
+角色为 0 的记录表示清空历史。崩溃导致的不完整尾部记录会在下次打开时被截掉。
+"""
+
+import os
+import json
+import zlib
+import struct
+import hashlib
+import threading
+from collections import deque
+from typing import Optional, List, Iterator, Iterable, Deque, Tuple
+
+from core.message import Message, FastMessage
+from utils.log import Log
+
+logger = Log()
+
+_HEADER = struct.Struct(">II")
+_TRAILER = struct.Struct(">I")
+_FIELDS = struct.Struct(">BdI")
+_FRAME_OVERHEAD = _HEADER.size + _TRAILER.size
+
+_ROLE_CODES = {"user": 1, "assistant": 2, "system": 3, "tool": 4}
+_CODE_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+_CLEAR = 0
+
+
+def encode_record(message: Optional[FastMessage]) -> bytes:
+    """将一条消息编码为日志记录，message 为None时编码为清空标记"""
+    if message is None:
+        payload = _FIELDS.pack(_CLEAR, 0.0, 0)
+    else:
+        content = message.content.encode("utf-8")
+        metadata = json.dumps(message.metadata, ensure_ascii=False, default=str).encode("utf-8") \
+            if message.metadata else b""
+        payload = _FIELDS.pack(_ROLE_CODES[message.role], message.created, len(content)) + content + metadata
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload + _TRAILER.pack(len(payload))
+
+
+def decode_payload(payload: bytes) -> Optional[FastMessage]:
+    """解码记录载荷，清空标记返回None"""
+    code, timestamp, content_length = _FIELDS.unpack_from(payload)
+    if code == _CLEAR:
+        return None
+    start = _FIELDS.size
+    content = payload[start:start + content_length].decode("utf-8")
+    metadata_bytes = payload[start + content_length:]
+    return FastMessage(content, _CODE_ROLES[code], timestamp, json.loads(metadata_bytes) if metadata_bytes else None)
+
+
+class SessionLog:
+    """
+    单个会话的追加日志
+
+    只在内存中记录最近 window 条消息的起始偏移；窗口之前的字节都是已淘汰的数据，
+    其大小超过窗口内数据且不少于 compact_min_bytes 时，直接复制窗口内的原始字节重写文件完成压缩。
+    """
+
+    def __init__(self, path: str, window: int = 100, compact_min_bytes: int = 64 * 1024, sync: bool = False):
+        """
+        Args:
+            path: 日志文件路径
+            window: 保留的最近消息条数，与 Config.max_history_length 一致
+            compact_min_bytes: 可回收的字节数至少达到该值才压缩，避免频繁重写小文件
+            sync: 每次追加后是否 fsync
+        """
+        self.path = path
+        self.window = window
+        self.compact_min_bytes = compact_min_bytes
+        self.sync = sync
+        self._offsets: Deque[int] = deque(maxlen=window)
+        # 最近一次清空标记之后的位置，窗口未满时它就是有效数据的起点
+        self._clear_end = 0
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _live_start(self) -> int:
+        if self._offsets and len(self._offsets) == self.window:
+            return self._offsets[0]
+        return self._clear_end
+
+    # ---------- 读取 ----------
+
+    def load_recent(self) -> List[FastMessage]:
+        """
+        从文件末尾向前读取最近窗口内的消息，遇到清空标记即停止
+
+        Returns:
+            消息列表（从旧到新）
+        """
+        with self._lock:
+            self._loaded = True
+            if not os.path.exists(self.path):
+                self._offsets.clear()
+                self._clear_end = self._size = 0
+                return []
+            with open(self.path, "rb") as f:
+                records = self._read_backward(f)
+            messages: List[FastMessage] = []
+            self._offsets.clear()
+            self._clear_end = 0
+            for offset, end, message in records:
+                if message is None:
+                    self._clear_end = end
+                    break
+                messages.append(message)
+                self._offsets.appendleft(offset)
+            messages.reverse()
+            return messages
+
+    def _read_backward(self, f) -> List[Tuple[int, int, Optional[FastMessage]]]:
+        """向前读取最多 window 条消息记录（外加遇到的清空标记），尾部损坏时先修复"""
+        f.seek(0, os.SEEK_END)
+        self._size = f.tell()
+        records = []
+        position = self._size
+        while position > 0 and len(records) < self.window:
+            record = self._read_before(f, position)
+            if record is None:
+                if position == self._size:
+                    # 尾部记录不完整（如写入时崩溃），截掉后重新读取
+                    self._repair(f)
+                    return self._read_backward(f)
+                raise ValueError(f"会话日志已损坏: {self.path} @ {position}")
+            offset, message = record
+            records.append((offset, position, message))
+            if message is None:
+                break
+            position = offset
+        return records
+
+    @staticmethod
+    def _read_before(f, end: int) -> Optional[Tuple[int, Optional[FastMessage]]]:
+        """读取结束于 end 的那条记录，校验失败返回None"""
+        if end < _FRAME_OVERHEAD:
+            return None
+        f.seek(end - _TRAILER.size)
+        (length,) = _TRAILER.unpack(f.read(_TRAILER.size))
+        offset = end - _FRAME_OVERHEAD - length
+        if offset < 0:
+            return None
+        f.seek(offset)
+        frame = f.read(_FRAME_OVERHEAD + length)
+        header_length, crc = _HEADER.unpack_from(frame)
+        payload = frame[_HEADER.size:_HEADER.size + length]
+        if header_length != length or zlib.crc32(payload) != crc:
+            return None
+        return offset, decode_payload(payload)
+
+    def _repair(self, f):
+        """从头扫描找到最后一条完整记录，截掉之后的字节"""
+        valid_end = 0
+        for _, end, _ in self._scan(f):
+            valid_end = end
+        logger.warning(f"⚠️ 会话日志尾部不完整，截断 {self._size - valid_end} 字节: {self.path}")
+        with open(self.path, "r+b") as writable:
+            writable.truncate(valid_end)
+        f.seek(0, os.SEEK_END)
+        self._size = f.tell()
+
+    @staticmethod
+    def _scan(f) -> Iterator[Tuple[int, int, Optional[FastMessage]]]:
+        """从头顺序读取完整记录，遇到不完整或校验失败的记录即停止"""
+        f.seek(0)
+        offset = 0
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            length, crc = _HEADER.unpack(header)
+            rest = f.read(length + _TRAILER.size)
+            if len(rest) < length + _TRAILER.size:
+                return
+            payload = rest[:length]
+            if zlib.crc32(payload) != crc or _TRAILER.unpack_from(rest, length)[0] != length:
+                return
+            end = offset + _FRAME_OVERHEAD + length
+            yield offset, end, decode_payload(payload)
+            offset = end
+
+    def iter_all(self) -> Iterator[Optional[FastMessage]]:
+        """从头读取全部记录（清空标记为None），用于导出或审计"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            for _, _, message in self._scan(f):
+                yield message
+
+    # ---------- 写入 ----------
+
+    def append(self, messages: Iterable[Optional[FastMessage]]):
+        """
+        追加消息，None表示清空标记；需要时自动压缩
+
+        Args:
+            messages: 要追加的消息
+        """
+        data = bytearray()
+        with self._lock:
+            if not self._loaded:
+                # 未加载过时不知道窗口位置，只追加不压缩
+                self._size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            records = []
+            for message in messages:
+                offset = self._size + len(data)
+                data += encode_record(message)
+                records.append((offset, self._size + len(data), message is None))
+            if not data:
+                return
+            with open(self.path, "ab") as f:
+                f.write(data)
+                if self.sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            for offset, end, is_clear in records:
+                if is_clear:
+                    self._offsets.clear()
+                    self._clear_end = end
+                else:
+                    self._offsets.append(offset)
+            self._size += len(data)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        live_start = self._live_start()
+        if live_start >= self.compact_min_bytes and live_start > self._size - live_start:
+            self._compact(live_start)
+
+    def compact(self):
+        """立即压缩，只保留窗口内的记录"""
+        with self._lock:
+            self._compact(self._live_start())
+
+    def _compact(self, live_start: int):
+        if live_start <= 0:
+            return
+        temp_path = f"{self.path}.compact"
+        with open(self.path, "rb") as source, open(temp_path, "wb") as target:
+            source.seek(live_start)
+            while True:
+                block = source.read(1024 * 1024)
+                if not block:
+                    break
+                target.write(block)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temp_path, self.path)
+        self._offsets = deque((offset - live_start for offset in self._offsets), maxlen=self.window)
+        self._clear_end = max(0, self._clear_end - live_start)
+        self._size -= live_start
+        logger.info(f"🗜️ 会话日志已压缩，回收 {live_start} 字节: {self.path}")
+
+
+class PersistentHistory:
+    """
+    持久化的历史记录，可以替换 Agent._history
+
+    行为与有界 deque 一致（append / clear / 迭代 / len），每次 append 同步追加到会话日志；
+    首次访问时才从磁盘加载最近窗口，休眠的会话不占用内存。
+    """
+
+    def __init__(self, log: SessionLog):
+        self.log = log
+        self._messages: Optional[Deque[FastMessage]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._messages is not None
+
+    def _ensure_loaded(self) -> Deque[FastMessage]:
+        if self._messages is None:
+            self._messages = deque(self.log.load_recent(), maxlen=self.log.window)
+        return self._messages
+
+    def append(self, message: "Message | FastMessage"):
+        if isinstance(message, Message):
+            message = FastMessage.from_message(message)
+        messages = self._ensure_loaded()
+        self.log.append((message,))
+        messages.append(message)
+
+    def extend(self, messages: Iterable["Message | FastMessage"]):
+        messages = [FastMessage.from_message(m) if isinstance(m, Message) else m for m in messages]
+        self._ensure_loaded()
+        self.log.append(messages)
+        self._messages.extend(messages)
+
+    def clear(self):
+        self._ensure_loaded()
+        self.log.append((None,))
+        self._messages.clear()
+
+    def unload(self):
+        """释放内存中的消息，下次访问时重新从磁盘加载"""
+        self._messages = None
+
+    def __iter__(self) -> Iterator[FastMessage]:
+        return iter(self._ensure_loaded())
+
+    def __reversed__(self) -> Iterator[FastMessage]:
+        return reversed(self._ensure_loaded())
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+    def __getitem__(self, index: int) -> FastMessage:
+        return self._ensure_loaded()[index]
+
+
+class SessionStore:
+    """
+    会话日志目录
+
+    会话文件按会话ID的哈希分散到两级子目录，单个目录下的文件数保持可控，
+    可以在磁盘上保存海量休眠会话。
+    """
+
+    def __init__(self, root: str, window: int = 100, compact_min_bytes: int = 64 * 1024, sync: bool = False):
+        """
+        Args:
+            root: 存储目录
+            window: 每个会话加载的最近消息条数
+            compact_min_bytes: 触发压缩的最小可回收字节数
+            sync: 每次追加后是否 fsync
+        """
+        self.root = root
+        self.window = window
+        self.compact_min_bytes = compact_min_bytes
+        self.sync = sync
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, session_id: str) -> str:
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.log")
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self.path(session_id))
+
+    def open(self, session_id: str, window: Optional[int] = None) -> PersistentHistory:
+        """
+        打开会话的持久化历史，不存在时在首次写入时创建
+
+        Args:
+            session_id: 会话ID
+            window: 本次加载的最近消息条数，默认为 self.window
+
+        Returns:
+            PersistentHistory
+        """
+        path = self.path(session_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return PersistentHistory(SessionLog(path, window or self.window, self.compact_min_bytes, self.sync))
+
+    def delete(self, session_id: str) -> bool:
+        try:
+            os.remove(self.path(session_id))
+            return True
+        except FileNotFoundError:
+            return False
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/22 9:48
+# @Author  : wang ke
+# @File    : singleflight.py
+# @Software: PyCharm
+
+"""Single-flight - 合并同时在途的相同LLM请求"""
+
+import asyncio
+import threading
+import contextvars
+from typing import Callable, Dict, Iterator, AsyncIterator, Any, List, Optional
+
+
+class _Flight:
+    """一次在途请求：记录已产生的片段，供所有订阅者重放和继续读取"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cond: Optional[asyncio.Condition] = None
+        # 事件循环只弱引用任务，由在途记录持有上游读取任务，避免读取中途被回收
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    线程版 single-flight
+
+    第一个调用者发起上游流式请求，由后台线程将片段写入共享缓冲区；
+    在请求结束前到达的相同请求直接订阅该缓冲区，先重放已有片段再继续接收新片段。
+    所有订阅者都放弃读取时，上游请求会被提前关闭。
+    请求结束后即从在途表中移除，之后的相同请求会重新发起（这不是缓存）。
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def stream(self, key: str, factory: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        以single-flight方式获取流式响应
+
+        请求在首次迭代时才登记并发起，计数与 finally 中的释放成对出现：
+        从未被迭代的迭代器不会占用订阅名额，也就不会阻止上游被提前关闭。
+
+        Args:
+            key: 请求的唯一键（模型、消息、参数）
+            factory: 真正发起上游请求的函数，返回片段迭代器
+
+        Returns:
+            片段迭代器
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats["leaders"] += 1
+                leader = True
+            else:
+                self._stats["followers"] += 1
+                leader = False
+            flight.subscribers += 1
+
+        try:
+            if leader:
+                # 在调用方上下文的副本中运行，保留 metrics.current_agent 等上下文变量
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(self._pump, key, flight, factory), daemon=True).start()
+            index = 0
+            while True:
+                with self._cond:
+                    while index >= len(flight.chunks) and not flight.done:
+                        self._cond.wait()
+                    pending = flight.chunks[index:]
+                    finished = flight.done
+                index += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished and index >= len(flight.chunks):
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            with self._cond:
+                flight.subscribers -= 1
+
+    def _pump(self, key: str, flight: _Flight, factory: Callable[[], Iterator[str]]):
+        """后台线程：读取上游响应并广播给订阅者"""
+        upstream = None
+        try:
+            upstream = factory()
+            for chunk in upstream:
+                with self._cond:
+                    flight.chunks.append(chunk)
+                    self._cond.notify_all()
+                    if flight.subscribers == 0:
+                        # 已无人读取：先摘除在途记录，避免新请求订阅到被截断的响应
+                        self._flights.pop(key, None)
+                        break
+        except BaseException as e:
+            flight.error = e
+        finally:
+            if upstream is not None and hasattr(upstream, "close"):
+                upstream.close()
+            with self._cond:
+                flight.done = True
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self._cond.notify_all()
+
+    def in_flight(self) -> int:
+        """当前在途的请求数"""
+        with self._lock:
+            return len(self._flights)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计：leaders为实际发起的请求数，followers为被合并的请求数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        return stats
+
+
+class AsyncSingleFlight:
+    """
+    协程版 single-flight，语义与 SingleFlight 相同
+
+    上游请求在独立的Task中读取，必须在同一个事件循环内使用。
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """以single-flight方式获取异步流式响应"""
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            flight.cond = asyncio.Condition()
+            self._flights[key] = flight
+            self._stats["leaders"] += 1
+        else:
+            self._stats["followers"] += 1
+
+        cond = flight.cond
+        index = 0
+        flight.subscribers += 1
+        try:
+            if leader:
+                flight.task = asyncio.get_running_loop().create_task(self._pump(key, flight, factory))
+            while True:
+                async with cond:
+                    await cond.wait_for(lambda: index < len(flight.chunks) or flight.done)
+                    pending = flight.chunks[index:]
+                    finished = flight.done
+                index += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished and index >= len(flight.chunks):
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+
+    async def _pump(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[str]]):
+        cond = flight.cond
+        upstream = factory()
+        try:
+            async for chunk in upstream:
+                async with cond:
+                    flight.chunks.append(chunk)
+                    cond.notify_all()
+                if flight.subscribers == 0:
+                    self._flights.pop(key, None)
+                    break
+        except BaseException as e:
+            # 包括任务被取消：先把异常交给订阅者，避免它们等待一个不会再到来的结束标记
+            flight.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            if hasattr(upstream, "aclose"):
+                await upstream.aclose()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with cond:
+                flight.done = True
+                cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._flights)
+        return stats
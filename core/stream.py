@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/21 10:36
+# @Author  : wang ke
+# @File    : stream.py
+# @Software: PyCharm
+
+"""流式输出接收器 - 决定LLM流式片段写到哪里"""
+
+import sys
+import json
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Callable, Any, TextIO
+
+
+class StreamSink(ABC):
+    """流式输出接收器基类"""
+
+    def on_start(self):
+        """一次流式响应开始"""
+        pass
+
+    @abstractmethod
+    def write(self, chunk: str):
+        """接收一个响应片段"""
+        pass
+
+    def on_end(self):
+        """一次流式响应结束"""
+        pass
+
+
+class NullSink(StreamSink):
+    """丢弃所有片段，生产环境中不产生任何逐token的IO开销"""
+
+    def write(self, chunk: str):
+        pass
+
+
+class ConsoleSink(StreamSink):
+    """
+    带缓冲的控制台输出
+
+    片段先写入内存缓冲区，遇到换行或缓冲区满时才整体写出并flush，
+    多个会话并发时按行输出，避免逐token系统调用和字符交错。
+    缓冲区按线程隔离，同一个实例可以被多个线程共享。
+    """
+
+    # 所有控制台输出共享一把锁，保证单次写出的完整性
+    _output_lock = threading.Lock()
+
+    def __init__(self, buffer_size: int = 256, stream: Optional[TextIO] = None):
+        """
+        Args:
+            buffer_size: 缓冲区达到该字符数时写出
+            stream: 输出流，默认为 sys.stdout
+        """
+        self.buffer_size = buffer_size
+        self.stream = stream
+        self._local = threading.local()
+
+    def _get_buffer(self) -> list:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = []
+            self._local.size = 0
+        return buffer
+
+    def write(self, chunk: str):
+        if not chunk:
+            return
+        buffer = self._get_buffer()
+        buffer.append(chunk)
+        self._local.size += len(chunk)
+        if "\n" in chunk or self._local.size >= self.buffer_size:
+            self._flush()
+
+    def on_end(self):
+        self._get_buffer().append("\n")
+        self._flush()
+
+    def _flush(self):
+        buffer = self._get_buffer()
+        if not buffer:
+            return
+        text = "".join(buffer)
+        buffer.clear()
+        self._local.size = 0
+        stream = self.stream or sys.stdout
+        with self._output_lock:
+            stream.write(text)
+            stream.flush()
+
+
+class QueueSink(StreamSink):
+    """
+    将片段放入队列，供其他线程消费
+
+    响应结束时放入 end_marker（默认None）作为结束标记。
+    """
+
+    def __init__(self, target_queue: Optional[queue.Queue] = None, end_marker: Any = None):
+        self.queue = target_queue if target_queue is not None else queue.Queue()
+        self.end_marker = end_marker
+
+    def write(self, chunk: str):
+        self.queue.put(chunk)
+
+    def on_end(self):
+        self.queue.put(self.end_marker)
+
+
+class CallbackSink(StreamSink):
+    """对每个片段调用回调函数"""
+
+    def __init__(self, on_chunk: Callable[[str], Any], on_end: Optional[Callable[[], Any]] = None):
+        self._on_chunk = on_chunk
+        self._on_end = on_end
+
+    def write(self, chunk: str):
+        self._on_chunk(chunk)
+
+    def on_end(self):
+        if self._on_end:
+            self._on_end()
+
+
+class TeeSink(StreamSink):
+    """将片段同时转发给多个接收器，如一边输出到终端一边做增量解析"""
+
+    def __init__(self, *sinks: StreamSink):
+        self.sinks = sinks
+
+    def on_start(self):
+        for sink in self.sinks:
+            sink.on_start()
+
+    def write(self, chunk: str):
+        for sink in self.sinks:
+            sink.write(chunk)
+
+    def on_end(self):
+        for sink in self.sinks:
+            sink.on_end()
+
+
+class SSESink(StreamSink):
+    """
+    按 Server-Sent Events 格式输出片段
+
+    每个片段编码为 `data: {"content": ...}`，结束时发送 `event: end`。
+    """
+
+    def __init__(self, writer: Callable[[bytes], Any], event: str = "message"):
+        """
+        Args:
+            writer: 接收已编码字节的写函数，如 socket.sendall / StreamWriter.write
+            event: 片段事件名
+        """
+        self.writer = writer
+        self.event = event
+
+    @staticmethod
+    def format_event(data: Any, event: Optional[str] = None) -> bytes:
+        """将数据编码为一条SSE事件"""
+        lines = []
+        if event:
+            lines.append(f"event: {event}")
+        lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+        return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+    def write(self, chunk: str):
+        self.writer(self.format_event({"content": chunk}, self.event))
+
+    def on_end(self):
+        self.writer(self.format_event({"done": True}, "end"))
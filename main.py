@@ -1,4 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/4 15:10
+# @Author  : wang ke
+# @File    : main.py
+# @Software: PyCharm
+
+"""
+启动多会话Agent服务
+
+用法：
+    python main.py --port 8000 --agents agents.json --max-concurrency 32
+"""
+
+import asyncio
+import argparse
+
+from core.llm import AgentsLLM
+from core.stream import NullSink
+from server.agent_server import AgentServer, ServerConfig, load_specs
+from utils.log import Log
+
+logger = Log()
+
 
 def main():
-    pass
+    parser = argparse.ArgumentParser(description="多会话Agent服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--agents", help="具名Agent配置的JSON文件，默认只提供一个 assistant")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="同时执行的对话轮数上限")
+    parser.add_argument("--max-queue", type=int, default=64, help="排队等待的请求数上限")
+    parser.add_argument("--queue-timeout", type=float, default=10.0, help="最长排队时间（秒）")
+    parser.add_argument("--session-ttl", type=float, default=1800.0, help="会话空闲过期时间（秒）")
+    parser.add_argument("--session-dir", help="会话日志目录，不提供时历史记录只保存在内存中")
+    args = parser.parse_args()
+
+    config = ServerConfig(
+        host=args.host,
+        port=args.port,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        session_ttl=args.session_ttl,
+        session_dir=args.session_dir
+    )
+    # 所有会话共享一个LLM客户端（连接池、限流、缓存），服务端不需要逐token打印到控制台
+    llm = AgentsLLM(stream_sink=NullSink())
+    server = AgentServer.from_specs(load_specs(args.agents), llm, config=config)
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("👋 Agent服务已停止")
+
 
+if __name__ == "__main__":
+    main()
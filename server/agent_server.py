@@ -0,0 +1,530 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/4 10:30
+# @Author  : wang ke
+# @File    : agent_server.py
+# @Software: PyCharm
+
+"""
+多会话Agent服务 - 基于asyncio的HTTP服务，托管具名Agent配置，按会话隔离历史记录
+
+接口：
+    GET    /healthz                      健康检查与负载情况
+    GET    /metrics                      Prometheus文本格式指标
+    GET    /v1/agents                    可用的Agent名称
+    POST   /v1/agents/{name}/chat        对话，body: {"input": "...", "session_id": "...", "stream": true}
+    GET    /v1/sessions/{session_id}     会话历史
+    DELETE /v1/sessions/{session_id}     删除会话
+
+流式响应使用SSE：先发送 `event: session`，随后是 `event: message` 片段，最后是 `event: end`。
+并发达到上限且排队已满（或排队超时）时返回 503 和 Retry-After。
+"""
+
+import re
+import json
+import math
+import time
+import uuid
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Callable, Deque, Type
+
+from pydantic import BaseModel
+
+from core.agent import Agent
+from core.llm import AgentsLLM
+from core.stream import SSESink
+from core.session_store import SessionStore
+from agents.simple_agent import SimpleAgent
+from agents.react_agent import ReActAgent
+from agents.plan_solve_agent import PlanAndSolveAgent
+from agents.reflection_agent import ReflectionAgent
+from tools.registry import ToolRegistry
+from utils.log import Log
+from utils.metrics import REGISTRY, LATENCY_BUCKETS, percentile
+
+logger = Log()
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+_CHAT_PATH = re.compile(r"^/v1/agents/([^/]+)/chat$")
+_SESSION_PATH = re.compile(r"^/v1/sessions/([^/]+)$")
+
+AGENT_TURN_DURATION = REGISTRY.histogram(
+    "agent_turn_duration_seconds", "服务端单轮对话的总耗时（不含排队）", LATENCY_BUCKETS, ("agent",))
+AGENT_QUEUE_WAIT = REGISTRY.histogram(
+    "agent_admission_wait_seconds", "请求在准入控制中的排队时间", LATENCY_BUCKETS, ("agent",))
+
+AGENT_TYPES: Dict[str, Type[Agent]] = {
+    "simple": SimpleAgent,
+    "react": ReActAgent,
+    "plan_solve": PlanAndSolveAgent,
+    "reflection": ReflectionAgent,
+}
+
+
+class AgentSpec(BaseModel):
+    """一个具名Agent的配置"""
+
+    # AGENT_TYPES 中的类型名
+    type: str = "simple"
+    system_prompt: Optional[str] = None
+    # 传给Agent构造函数的其他参数，如 {"max_steps": 8}
+    options: Dict[str, Any] = {}
+
+    def build(self, name: str, llm: AgentsLLM, tool_registry: Optional[ToolRegistry] = None) -> Agent:
+        """创建一个新的Agent实例"""
+        if self.type not in AGENT_TYPES:
+            raise ValueError(f"未知的Agent类型: {self.type}，可选: {', '.join(AGENT_TYPES)}")
+        agent_cls = AGENT_TYPES[self.type]
+        kwargs = dict(self.options)
+        if tool_registry is not None and agent_cls in (SimpleAgent, ReActAgent):
+            kwargs.setdefault("tool_registry", tool_registry)
+        return agent_cls(name=name, llm=llm, system_prompt=self.system_prompt, **kwargs)
+
+
+class ServerConfig(BaseModel):
+    """服务配置"""
+
+    host: str = "127.0.0.1"
+    port: int = 8000
+
+    # 准入控制：同时执行的对话轮数上限、排队上限与最长排队时间（秒）
+    max_concurrency: int = 32
+    max_queue: int = 64
+    queue_timeout: float = 10.0
+
+    # 会话：空闲超过 session_ttl 秒或数量超过 max_sessions 时淘汰最久未使用的会话
+    session_ttl: float = 1800.0
+    max_sessions: int = 10000
+    # 会话日志目录，为None时历史记录只保存在内存中
+    session_dir: Optional[str] = None
+
+    max_body_bytes: int = 1024 * 1024
+
+
+class ServerOverloaded(Exception):
+    """服务已满载，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"服务繁忙，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    准入控制
+
+    最多 max_concurrency 个请求同时执行，其余最多 max_queue 个排队等待；
+    排队已满或等待超过 queue_timeout 时立即拒绝，而不是让请求无限堆积、拖慢所有会话。
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._durations: Deque[float] = deque(maxlen=200)
+
+    def retry_after(self) -> int:
+        """按最近请求的中位耗时估算排到的等待时间（秒，至少1秒）"""
+        typical = percentile(self._durations, 0.5) or 1.0
+        return max(1, math.ceil(typical * (self.waiting + 1) / self.max_concurrency))
+
+    @asynccontextmanager
+    async def admit(self):
+        """
+        获取一个执行名额，满载时抛出 ServerOverloaded
+
+        Yields:
+            排队等待的秒数
+        """
+        queued_at = time.monotonic()
+        if not self._semaphore.locked():
+            # 有空闲名额时 acquire 立即返回，不会让出事件循环
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ServerOverloaded(self.retry_after())
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise ServerOverloaded(self.retry_after()) from None
+            finally:
+                self.waiting -= 1
+
+        started = time.monotonic()
+        self.active += 1
+        try:
+            yield started - queued_at
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            self._durations.append(time.monotonic() - started)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"active": self.active, "waiting": self.waiting, "rejected": self.rejected,
+                "max_concurrency": self.max_concurrency, "max_queue": self.max_queue}
+
+
+class Session:
+    """一个会话：独占一个Agent实例，因此历史记录互不影响"""
+
+    __slots__ = ("id", "agent_name", "agent", "busy", "last_used")
+
+    def __init__(self, session_id: str, agent_name: str, agent: Agent):
+        self.id = session_id
+        self.agent_name = agent_name
+        self.agent = agent
+        self.busy = False
+        self.last_used = time.monotonic()
+
+
+class SessionCache:
+    """按最近使用顺序在内存中保存会话，空闲过期或超出数量上限时淘汰"""
+
+    def __init__(self, ttl: float, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+        return session
+
+    def create(self, agent_name: str, agent: Agent, session_id: str) -> Session:
+        session = Session(session_id, agent_name, agent)
+        self._sessions[session.id] = session
+        self.evict()
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.agent.close()
+        return True
+
+    def evict(self):
+        """淘汰过期会话及超出上限的最久未使用会话，正在处理请求的会话不会被淘汰"""
+        expire_before = time.monotonic() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            over_capacity = len(self._sessions) > self.max_sessions
+            if not over_capacity and session.last_used >= expire_before:
+                break
+            if not session.busy:
+                del self._sessions[session_id]
+                session.agent.close()
+
+
+class HTTPError(Exception):
+    """以指定状态码返回给客户端的错误"""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+class AgentServer:
+    """
+    多会话Agent HTTP服务
+
+    每个具名配置对应一个无参工厂函数，每个新会话调用一次工厂得到独立的Agent实例；
+    各实例可以共享同一个 AgentsLLM，从而共享连接池、限流和缓存。
+    对话通过 Agent.arun / Agent.astream 在事件循环上执行，等待模型时不占用线程。
+    """
+
+    def __init__(self, agents: Dict[str, Callable[[], Agent]], config: Optional[ServerConfig] = None):
+        """
+        Args:
+            agents: Agent名称 -> 创建Agent实例的工厂函数
+            config: 服务配置
+        """
+        if not agents:
+            raise ValueError("至少需要配置一个Agent")
+        self.agents = agents
+        self.config = config or ServerConfig()
+        self.host = self.config.host
+        self.port = self.config.port
+        self.admission = AdmissionController(self.config.max_concurrency, self.config.max_queue,
+                                             self.config.queue_timeout)
+        self.sessions = SessionCache(self.config.session_ttl, self.config.max_sessions)
+        # 配置了 session_dir 时历史记录持久化到磁盘，被淘汰出内存的会话之后可以按ID恢复
+        self.session_store = SessionStore(self.config.session_dir) if self.config.session_dir else None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+
+    @classmethod
+    def from_specs(cls, specs: Dict[str, AgentSpec], llm: AgentsLLM, tool_registry: Optional[ToolRegistry] = None,
+                   config: Optional[ServerConfig] = None) -> "AgentServer":
+        """根据具名 AgentSpec 配置创建服务，所有会话共享同一个 llm"""
+        factories = {
+            name: (lambda name=name, spec=spec: spec.build(name, llm, tool_registry))
+            for name, spec in specs.items()
+        }
+        return cls(factories, config)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # ---------- 生命周期 ----------
+
+    async def serve(self):
+        """在当前事件循环中启动服务"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"🚀 Agent服务已启动: {self.url}，可用Agent: {', '.join(self.agents)}")
+
+    async def serve_forever(self):
+        await self.serve()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    # ---------- HTTP ----------
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    # 请求头无法解析时无法确定下一个请求的起点，回复后关闭连接
+                    await self._send_json(writer, e.status, {"error": str(e)}, {"Connection": "close"})
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if body is None:
+                    await self._send_json(writer, 413, {"error": "请求体过大"}, {"Connection": "close"})
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    await self._dispatch(writer, method, path, body)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)}, e.headers)
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    logger.error(f"❌ 处理请求 {method} {path} 时发生错误: {type(e).__name__}: {e}")
+                    await self._send_json(writer, 500, {"error": f"服务器内部错误: {type(e).__name__}"},
+                                          {"Connection": "close"})
+                    break
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ", 2)
+        if len(parts) != 3:
+            raise HTTPError(400, "无效的请求行")
+        method, path, _ = parts
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(400, "无效的 Content-Length")
+        if length > self.config.max_body_bytes:
+            return method, path, headers, None
+        body = await reader.readexactly(length) if length else b""
+        return method, path.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes):
+        """路由一个请求"""
+        path = path.rstrip("/") or "/"
+        if path == "/healthz" and method == "GET":
+            await self._send_json(writer, 200, {"status": "ok", "sessions": len(self.sessions),
+                                                **self.admission.to_dict()})
+        elif path == "/metrics" and method == "GET":
+            await self._send(writer, 200, REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4")
+        elif path == "/v1/agents" and method == "GET":
+            await self._send_json(writer, 200, {"agents": list(self.agents)})
+        elif (match := _CHAT_PATH.match(path)) and method == "POST":
+            await self._handle_chat(writer, match.group(1), self._parse_body(body))
+        elif match := _SESSION_PATH.match(path):
+            await self._handle_session(writer, method, match.group(1))
+        else:
+            raise HTTPError(404, f"未知路径: {method} {path}")
+
+    @staticmethod
+    def _parse_body(body: bytes) -> Dict[str, Any]:
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "请求体不是合法的JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "请求体必须是JSON对象")
+        return payload
+
+    async def _handle_session(self, writer: asyncio.StreamWriter, method: str, session_id: str):
+        if method == "DELETE":
+            deleted = self.sessions.delete(session_id)
+            if self.session_store is not None:
+                deleted = self.session_store.delete(session_id) or deleted
+            if not deleted:
+                raise HTTPError(404, f"会话不存在: {session_id}")
+            await self._send_json(writer, 200, {"session_id": session_id, "deleted": True})
+        elif method == "GET":
+            session = self.sessions.get(session_id)
+            if session is not None:
+                agent_name, history = session.agent_name, session.agent.get_history()
+            elif self.session_store is not None and self.session_store.exists(session_id):
+                # 休眠会话直接从日志读取最近窗口，不创建Agent
+                agent_name, history = None, list(self.session_store.open(session_id))
+            else:
+                raise HTTPError(404, f"会话不存在: {session_id}")
+            await self._send_json(writer, 200, {
+                "session_id": session_id,
+                "agent": agent_name,
+                "history": [message.to_dict() for message in history]
+            })
+        else:
+            raise HTTPError(405, f"不支持的方法: {method}")
+
+    def _get_session(self, agent_name: str, session_id: Optional[str]) -> Session:
+        """获取或创建会话；同一会话同时只能处理一轮对话"""
+        if agent_name not in self.agents:
+            raise HTTPError(404, f"未知的Agent: {agent_name}")
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            session_id = session_id or uuid.uuid4().hex
+            agent = self.agents[agent_name]()
+            if self.session_store is not None:
+                agent.attach_session(self.session_store, session_id)
+            session = self.sessions.create(agent_name, agent, session_id)
+        elif session.agent_name != agent_name:
+            raise HTTPError(409, f"会话 {session_id} 属于Agent {session.agent_name}")
+        if session.busy:
+            raise HTTPError(409, f"会话 {session.id} 正在处理上一轮对话")
+        return session
+
+    async def _handle_chat(self, writer: asyncio.StreamWriter, agent_name: str, payload: Dict[str, Any]):
+        input_text = payload.get("input")
+        if not isinstance(input_text, str) or not input_text:
+            raise HTTPError(400, "缺少 input 字段")
+        session = self._get_session(agent_name, payload.get("session_id"))
+
+        session.busy = True
+        try:
+            async with self.admission.admit() as queue_wait:
+                AGENT_QUEUE_WAIT.observe(queue_wait, agent=agent_name)
+                started = time.monotonic()
+                if payload.get("stream"):
+                    await self._stream_chat(writer, session, input_text)
+                else:
+                    try:
+                        output = await session.agent.arun(input_text)
+                    except Exception as e:
+                        logger.error(f"❌ 会话 {session.id} 对话失败: {e}")
+                        raise HTTPError(500, f"对话失败: {e}")
+                    await self._send_json(writer, 200, {"session_id": session.id, "agent": agent_name,
+                                                        "output": output})
+                AGENT_TURN_DURATION.observe(time.monotonic() - started, agent=agent_name)
+        except ServerOverloaded as e:
+            logger.warning(f"⚠️ {e}")
+            raise HTTPError(503, str(e), {"Retry-After": str(e.retry_after)})
+        finally:
+            session.busy = False
+            session.last_used = time.monotonic()
+
+    async def _stream_chat(self, writer: asyncio.StreamWriter, session: Session, input_text: str):
+        """以SSE流式返回一轮对话，生成失败时发送 error 事件"""
+        writer.write(self._head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                      "Transfer-Encoding": "chunked"}))
+        await self._write_chunk(writer, SSESink.format_event({"session_id": session.id}, "session"))
+
+        stream = session.agent.astream(input_text)
+        try:
+            async for chunk in stream:
+                await self._write_chunk(writer, SSESink.format_event({"content": chunk}, "message"))
+        except (ConnectionError, asyncio.CancelledError):
+            # 客户端断开后停止生成，不再为无人接收的回复消耗模型
+            logger.info(f"🔌 会话 {session.id} 的客户端已断开，停止生成")
+            raise
+        except Exception as e:
+            logger.error(f"❌ 会话 {session.id} 对话失败: {e}")
+            await self._write_chunk(writer, SSESink.format_event({"error": str(e)}, "error"))
+        else:
+            await self._write_chunk(writer, SSESink.format_event({"done": True}, "end"))
+        finally:
+            await stream.aclose()
+        await self._write_chunk(writer, b"")
+
+    @staticmethod
+    def _head(status: int, headers: Dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+                    extra_headers: Optional[Dict[str, str]] = None):
+        headers = {"Content-Type": content_type, "Content-Length": str(len(body))}
+        headers.update(extra_headers or {})
+        writer.write(self._head(status, headers) + body)
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                         extra_headers: Optional[Dict[str, str]] = None):
+        await self._send(writer, status, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                         "application/json", extra_headers)
+
+    @staticmethod
+    async def _write_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+
+def load_specs(path: Optional[str]) -> Dict[str, AgentSpec]:
+    """
+    从JSON文件加载具名Agent配置
+
+    文件格式为 {"名称": {"type": "react", "system_prompt": "...", "options": {...}}}，
+    未提供时只配置一个名为 assistant 的 SimpleAgent。
+    """
+    if not path:
+        return {"assistant": AgentSpec()}
+    with open(path, "r", encoding="utf-8") as f:
+        return {name: AgentSpec(**spec) for name, spec in json.load(f).items()}
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/9 10:10
+# @Author  : wang ke
+# @File    : batch_runner.py
+# @Software: PyCharm
+
+"""
+批量运行 - 以有界并发将JSONL问题集逐行交给Agent，结果增量写入JSONL，支持断点续跑
+
+用法：
+    python -m server.batch_runner questions.jsonl --output results.jsonl --agent assistant --concurrency 16
+    python -m server.batch_runner requests.jsonl --output out.jsonl --id-field request_id \\
+        --input-template "{title}\\n\\n{body}"
+
+输入文件逐行读取，不会整体载入内存。每道题使用一个新的Agent实例，题目之间不共享历史。
+每完成 checkpoint_every 道题写一次检查点：记录之前所有行都已完成的“水位线”、
+水位线之后已完成的行号以及当时输出文件的长度。续跑时水位线之前的行直接跳过，
+只需扫描检查点之后追加的输出即可恢复进度。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from contextlib import redirect_stdout
+from typing import Optional, Dict, Any, Callable, Iterator, List, Set, Tuple
+
+from pydantic import BaseModel
+
+from core.agent import Agent
+from core.llm import AgentsLLM
+from core.stream import NullSink
+from server.agent_server import load_specs
+from utils.log import Log
+from utils.metrics import percentile
+
+logger = Log()
+
+
+class BatchConfig(BaseModel):
+    """批量运行配置"""
+
+    input_path: str
+    output_path: str
+    concurrency: int = 8
+
+    # 题目ID字段，缺失时使用行号
+    id_field: str = "id"
+    # 问题文本字段；提供 input_template 时改为用记录的字段格式化，如 "{title}\n{body}"
+    input_field: str = "input"
+    input_template: Optional[str] = None
+
+    # 单题超时（秒），None表示不限
+    timeout: Optional[float] = None
+    checkpoint_every: int = 50
+    # 续跑时重新运行之前失败（出错或超时）的题目；新结果追加到输出，同一行以最后一条记录为准
+    retry_failed: bool = False
+
+    @property
+    def checkpoint_path(self) -> str:
+        return f"{self.output_path}.checkpoint"
+
+
+class BatchCheckpoint(BaseModel):
+    """续跑进度"""
+
+    # 行号小于 watermark 的输入都已完成
+    watermark: int = 0
+    # 水位线之后已完成的行号
+    completed_ahead: List[int] = []
+    # 保存检查点时输出文件的字节数
+    output_offset: int = 0
+    succeeded: int = 0
+    failed: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> "BatchCheckpoint":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str):
+        """先写临时文件再替换，保存过程中崩溃不会损坏已有检查点"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.model_dump(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+
+class BatchRunner:
+    """
+    JSONL批量运行器
+
+    同时最多运行 concurrency 道题，一道题完成才从输入读取下一道，内存占用与文件大小无关。
+    """
+
+    def __init__(self, agent_factory: Callable[[], Agent], config: BatchConfig):
+        """
+        Args:
+            agent_factory: 创建Agent实例的无参函数，每道题调用一次
+            config: 批量运行配置
+        """
+        self.agent_factory = agent_factory
+        self.config = config
+        self.checkpoint = BatchCheckpoint()
+        self._done: Set[int] = set()
+        self._retry: Set[int] = set()
+        self._latencies: List[float] = []
+        self._since_checkpoint = 0
+        self._output = None
+
+    # ---------- 续跑 ----------
+
+    def _resume(self):
+        """读取检查点并扫描之后追加的输出，恢复已完成的行号"""
+        self.checkpoint = BatchCheckpoint.load(self.config.checkpoint_path)
+        self._done = set(self.checkpoint.completed_ahead)
+        if not os.path.exists(self.config.output_path):
+            return
+        with open(self.config.output_path, "rb+") as f:
+            f.seek(self.checkpoint.output_offset)
+            valid_end = self.checkpoint.output_offset
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(raw)
+                except json.JSONDecodeError:
+                    break
+                self._record_done(record["line"], record.get("error") is None)
+                valid_end += len(raw)
+            # 丢弃崩溃时写了一半的最后一行
+            f.truncate(valid_end)
+        if self.config.retry_failed:
+            self._collect_failed()
+        if self._done or self.checkpoint.watermark:
+            logger.info(f"♻️ 从检查点续跑：已完成 {self.checkpoint.watermark + len(self._done)} 行"
+                        f"（水位线 {self.checkpoint.watermark}）")
+
+    def _collect_failed(self):
+        """扫描全部输出，找出最后一条记录仍是失败的行，本次运行重新处理"""
+        latest: Dict[int, bool] = {}
+        with open(self.config.output_path, "rb") as f:
+            for raw in f:
+                record = json.loads(raw)
+                latest[record["line"]] = record.get("error") is None
+        self._retry = {line for line, succeeded in latest.items() if not succeeded}
+        self._done -= self._retry
+        # 重跑的结果会重新计数
+        self.checkpoint.failed -= len(self._retry)
+        if self._retry:
+            logger.info(f"🔁 重新运行 {len(self._retry)} 道失败的题目")
+
+    def _record_done(self, line: int, succeeded: bool):
+        if succeeded:
+            self.checkpoint.succeeded += 1
+        else:
+            self.checkpoint.failed += 1
+        self._mark_done(line)
+
+    def _mark_done(self, line: int):
+        """标记一行已完成，并推进水位线"""
+        if line < self.checkpoint.watermark:
+            # 水位线之前失败后重跑的行
+            return
+        self._done.add(line)
+        while self.checkpoint.watermark in self._done:
+            self._done.discard(self.checkpoint.watermark)
+            self.checkpoint.watermark += 1
+
+    def _save_checkpoint(self):
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        self.checkpoint.output_offset = self._output.tell()
+        self.checkpoint.completed_ahead = sorted(self._done)
+        self.checkpoint.save(self.config.checkpoint_path)
+        self._since_checkpoint = 0
+
+    # ---------- 输入 ----------
+
+    def _iter_items(self) -> Iterator[Tuple[int, Any, str]]:
+        """逐行读取尚未完成的题目，返回 (行号, ID, 问题文本)"""
+        with open(self.config.input_path, "r", encoding="utf-8") as f:
+            for line, raw in enumerate(f):
+                if (line < self.checkpoint.watermark or line in self._done) and line not in self._retry:
+                    continue
+                if not raw.strip():
+                    # 空行直接视为已完成，使水位线可以越过
+                    self._mark_done(line)
+                    continue
+                try:
+                    record = json.loads(raw)
+                    if not isinstance(record, dict):
+                        raise ValueError(f"应为JSON对象，实际为 {type(record).__name__}")
+                    item_id = record.get(self.config.id_field, line)
+                    input_text = self._format_input(record)
+                except (ValueError, KeyError, IndexError) as e:
+                    # 单行输入无效只记录为失败，不中断整个批次
+                    self._write_result({"line": line, "id": line, "error": f"输入无效 {type(e).__name__}: {e}",
+                                        "latency": 0.0})
+                    continue
+                yield line, item_id, input_text
+
+    def _format_input(self, record: Dict[str, Any]) -> str:
+        if self.config.input_template:
+            return self.config.input_template.format(**record)
+        return str(record[self.config.input_field])
+
+    # ---------- 执行 ----------
+
+    async def _process(self, line: int, item_id: Any, input_text: str):
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"line": line, "id": item_id}
+        try:
+            agent = self.agent_factory()
+            result["output"] = await asyncio.wait_for(agent.arun(input_text), self.config.timeout)
+            result["error"] = None
+        except asyncio.TimeoutError:
+            result["error"] = f"超时（{self.config.timeout}秒）"
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        latency = time.perf_counter() - started
+        result["latency"] = round(latency, 4)
+        self._latencies.append(latency)
+        self._write_result(result)
+
+    def _write_result(self, result: Dict[str, Any]):
+        """追加一条结果并推进进度，按 checkpoint_every 保存检查点"""
+        self._output.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._record_done(result["line"], result["error"] is None)
+        if result["error"] is not None:
+            logger.warning(f"⚠️ 第 {result['line']} 行（{result['id']}）失败: {result['error']}")
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.config.checkpoint_every:
+            self._save_checkpoint()
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        运行整个批次
+
+        Returns:
+            本次运行的统计报告（吞吐、延迟分位数与累计成功/失败数）
+        """
+        self._resume()
+        semaphore = asyncio.Semaphore(self.config.concurrency)
+        tasks = set()
+
+        def on_done(task: asyncio.Task):
+            tasks.discard(task)
+            semaphore.release()
+
+        started = time.perf_counter()
+        # 二进制追加模式，tell() 返回的就是字节偏移
+        self._output = open(self.config.output_path, "ab")
+        try:
+            for line, item_id, input_text in self._iter_items():
+                await semaphore.acquire()
+                task = asyncio.create_task(self._process(line, item_id, input_text))
+                tasks.add(task)
+                task.add_done_callback(on_done)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._save_checkpoint()
+            self._output.close()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, wall: float) -> Dict[str, Any]:
+        processed = len(self._latencies)
+        return {
+            "processed": processed,
+            "wall_seconds": wall,
+            "items_per_second": processed / wall if wall > 0 else None,
+            "latency": {
+                "mean": sum(self._latencies) / processed if processed else None,
+                "p50": percentile(self._latencies, 0.5),
+                "p90": percentile(self._latencies, 0.9),
+                "p95": percentile(self._latencies, 0.95),
+                "p99": percentile(self._latencies, 0.99),
+            },
+            "succeeded_total": self.checkpoint.succeeded,
+            "failed_total": self.checkpoint.failed,
+        }
+
+
+_ESCAPES = {"\\n": "\n", "\\t": "\t", "\\\\": "\\"}
+_ESCAPE_PATTERN = re.compile(r"\\[nt\\]")
+
+
+def _unescape(template: str) -> str:
+    """只展开命令行模板中的 \\n、\\t 与 \\\\，其余字符（包括中文）原样保留"""
+    return _ESCAPE_PATTERN.sub(lambda match: _ESCAPES[match.group(0)], template)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以有界并发批量运行JSONL问题集")
+    parser.add_argument("input", help="输入JSONL文件")
+    parser.add_argument("--output", required=True, help="结果JSONL文件（追加写入，可续跑）")
+    parser.add_argument("--agents", help="具名Agent配置的JSON文件，格式同 main.py")
+    parser.add_argument("--agent", default="assistant", help="使用的Agent名称")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--input-field", default="input")
+    parser.add_argument("--input-template", help="用记录字段格式化问题文本，如 \"{title}\\n{body}\"")
+    parser.add_argument("--timeout", type=float, help="单题超时（秒）")
+    parser.add_argument("--checkpoint-every", type=int, default=50)
+    parser.add_argument("--retry-failed", action="store_true", help="重新运行之前失败或超时的题目")
+    parser.add_argument("--report", help="将统计报告写入该JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="保留Agent的控制台输出")
+    args = parser.parse_args()
+
+    specs = load_specs(args.agents)
+    if args.agent not in specs:
+        parser.error(f"未知的Agent: {args.agent}，可选: {', '.join(specs)}")
+    llm = AgentsLLM(stream_sink=NullSink())
+    spec = specs[args.agent]
+    config = BatchConfig(
+        input_path=args.input,
+        output_path=args.output,
+        concurrency=args.concurrency,
+        id_field=args.id_field,
+        input_field=args.input_field,
+        input_template=_unescape(args.input_template) if args.input_template else None,
+        timeout=args.timeout,
+        checkpoint_every=args.checkpoint_every,
+        retry_failed=args.retry_failed
+    )
+    runner = BatchRunner(lambda: spec.build(args.agent, llm), config)
+
+    # Agent内部有大量 print，批量运行时默认丢弃
+    with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+        report = asyncio.run(runner.run())
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    latency = report["latency"]
+    if report["processed"]:
+        print(f"📊 本次处理 {report['processed']} 道题，吞吐 {report['items_per_second']:.2f} 题/秒，"
+              f"延迟 p50={latency['p50']:.2f}s p95={latency['p95']:.2f}s p99={latency['p99']:.2f}s", file=sys.stderr)
+    print(f"✅ 累计成功 {report['succeeded_total']}，失败 {report['failed_total']}，结果见 {args.output}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,4 +36,5 @@ OLLAMA_LOCAL_URL = local_ollama_dict["url"]
 cloud_ollama_dict = ollama_dict["cloud"]
 OLLAMA_KEY = cloud_ollama_dict["key"]
 OLLAMA_CLOUD_URL = cloud_ollama_dict["url"]
-OLLAMA_CLOUD_MODEL = cloud_ollama_dict["model"]
\ No newline at end of file
+OLLAMA_CLOUD_MODEL = cloud_ollama_dict["model"]
+OLLAMA_LOCAL_MODEL = local_ollama_dict.get("model")
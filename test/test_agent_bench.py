@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/30 18:05
+# @Author  : wang ke
+# @File    : test_agent_bench.py
+# @Software: PyCharm
+
+import json
+
+from benchmarks.agent_bench import LatencyProfile, ScriptedLLM, run_session, run_benchmarks
+
+
+def test_run_benchmarks_reports_every_agent():
+    report = run_benchmarks(["simple", "react", "plan_solve", "reflection"], "instant",
+                            sessions=4, concurrency=2, allocations=False)
+
+    results = report["results"]
+    assert results["simple"]["llm_calls_per_session"] == 1
+    assert results["react"]["llm_calls_per_session"] == 2
+    assert results["react"]["tool_calls_per_session"] == 1
+    assert results["plan_solve"]["llm_calls_per_session"] == 4
+    assert results["reflection"]["llm_calls_per_session"] == 4
+    assert results["react"]["latency"]["e2e"]["p95"] >= results["react"]["latency"]["e2e"]["p50"]
+    # 结果可以直接写入JSON
+    json.dumps(report, ensure_ascii=False)
+
+
+def test_latency_profile_is_separated_from_overhead():
+    profile = LatencyProfile(ttft=0.02, tokens_per_second=1000)
+    llm = ScriptedLLM(profile)
+    session = run_session("simple", llm, profile)
+
+    assert session["llm_simulated"] >= 0.02
+    assert session["e2e"] >= session["llm_simulated"]
+    assert abs(session["framework"] - (session["e2e"] - session["llm_simulated"])) < 1e-9
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/4 16:20
+# @Author  : wang ke
+# @File    : test_agent_server.py
+# @Software: PyCharm
+
+import json
+import asyncio
+
+import httpx
+
+from benchmarks.agent_bench import LatencyProfile, ScriptedLLM
+from server.agent_server import AgentServer, AgentSpec, ServerConfig
+
+
+def _run(profile: LatencyProfile, config: ServerConfig, scenario):
+    async def main():
+        server = AgentServer.from_specs({"assistant": AgentSpec(type="simple")}, ScriptedLLM(profile), config=config)
+        await server.serve()
+        try:
+            async with httpx.AsyncClient(base_url=server.url, timeout=10) as client:
+                return await scenario(client)
+        finally:
+            await server.aclose()
+
+    return asyncio.run(main())
+
+
+def _events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_sessions_keep_isolated_histories():
+    async def scenario(client):
+        first = (await client.post("/v1/agents/assistant/chat", json={"input": "你好"})).json()
+        session_id = first["session_id"]
+        await client.post("/v1/agents/assistant/chat", json={"input": "继续", "session_id": session_id})
+        other = (await client.post("/v1/agents/assistant/chat", json={"input": "另一个会话"})).json()
+
+        history = (await client.get(f"/v1/sessions/{session_id}")).json()["history"]
+        other_history = (await client.get(f"/v1/sessions/{other['session_id']}")).json()["history"]
+        deleted = await client.delete(f"/v1/sessions/{session_id}")
+        missing = await client.get(f"/v1/sessions/{session_id}")
+        return first, history, other_history, deleted.status_code, missing.status_code
+
+    first, history, other_history, deleted, missing = _run(LatencyProfile(), ServerConfig(port=0), scenario)
+    assert first["output"]
+    assert [m["content"] for m in history if m["role"] == "user"] == ["你好", "继续"]
+    assert [m["content"] for m in other_history if m["role"] == "user"] == ["另一个会话"]
+    assert (deleted, missing) == (200, 404)
+
+
+def test_chat_streams_sse_events():
+    async def scenario(client):
+        response = await client.post("/v1/agents/assistant/chat", json={"input": "你好", "stream": True})
+        return response, (await client.get("/v1/sessions/" + _events(response.text)[0][1]["session_id"])).json()
+
+    response, session = _run(LatencyProfile(), ServerConfig(port=0), scenario)
+    assert response.headers["content-type"] == "text/event-stream"
+    events = _events(response.text)
+    assert events[0][0] == "session"
+    assert events[-1] == ("end", {"done": True})
+    content = "".join(data["content"] for name, data in events if name == "message")
+    assert content and content == session["history"][-1]["content"]
+
+
+def test_saturated_server_returns_503_with_retry_after():
+    async def scenario(client):
+        requests = [client.post("/v1/agents/assistant/chat", json={"input": f"问题 {i}"}) for i in range(3)]
+        return await asyncio.gather(*requests)
+
+    config = ServerConfig(port=0, max_concurrency=1, max_queue=1, queue_timeout=5)
+    responses = _run(LatencyProfile(ttft=0.2), config, scenario)
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200, 200, 503]
+    rejected = next(response for response in responses if response.status_code == 503)
+    assert int(rejected.headers["retry-after"]) >= 1
+
+
+def test_unknown_agent_and_bad_request():
+    async def scenario(client):
+        unknown = await client.post("/v1/agents/nobody/chat", json={"input": "你好"})
+        missing_input = await client.post("/v1/agents/assistant/chat", json={})
+        agents = (await client.get("/v1/agents")).json()
+        return unknown.status_code, missing_input.status_code, agents
+
+    assert _run(LatencyProfile(), ServerConfig(port=0), scenario) == (404, 400, {"agents": ["assistant"]})
+
+
+def test_malformed_requests_and_internal_errors_get_responses():
+    async def main():
+        server = AgentServer.from_specs({"assistant": AgentSpec(type="simple")}, ScriptedLLM(),
+                                        config=ServerConfig(port=0))
+
+        def broken_factory():
+            raise RuntimeError("无法创建Agent")
+
+        server.agents["broken"] = broken_factory
+        await server.serve()
+        try:
+            statuses = []
+            for length in ("abc", "-5"):
+                reader, writer = await asyncio.open_connection(server.host, server.port)
+                writer.write(f"POST /v1/agents/assistant/chat HTTP/1.1\r\nContent-Length: {length}\r\n\r\n"
+                             .encode("latin-1"))
+                await writer.drain()
+                statuses.append((await reader.readline()).split()[1])
+                writer.close()
+            async with httpx.AsyncClient(base_url=server.url, timeout=10) as client:
+                broken = await client.post("/v1/agents/broken/chat", json={"input": "你好"})
+                healthy = await client.get("/healthz")
+            return statuses, broken.status_code, healthy.status_code
+        finally:
+            await server.aclose()
+
+    assert asyncio.run(main()) == ([b"400", b"400"], 500, 200)
+
+
+def test_evicted_session_is_restored_from_disk(tmp_path):
+    async def scenario(client):
+        await client.post("/v1/agents/assistant/chat", json={"input": "第一轮", "session_id": "s1"})
+        # 内存中只保留一个会话，s1 被淘汰
+        await client.post("/v1/agents/assistant/chat", json={"input": "别的会话", "session_id": "s2"})
+        dormant = (await client.get("/v1/sessions/s1")).json()
+        await client.post("/v1/agents/assistant/chat", json={"input": "第二轮", "session_id": "s1"})
+        return dormant, (await client.get("/v1/sessions/s1")).json()
+
+    config = ServerConfig(port=0, max_sessions=1, session_dir=str(tmp_path))
+    dormant, restored = _run(LatencyProfile(), config, scenario)
+    assert dormant["agent"] is None
+    assert [m["content"] for m in dormant["history"] if m["role"] == "user"] == ["第一轮"]
+    assert [m["content"] for m in restored["history"] if m["role"] == "user"] == ["第一轮", "第二轮"]
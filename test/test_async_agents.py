@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/3 15:20
+# @Author  : wang ke
+# @File    : test_async_agents.py
+# @Software: PyCharm
+
+import time
+import asyncio
+
+from benchmarks.agent_bench import LatencyProfile, ScriptedLLM, AGENT_BUILDERS, PROFILES
+
+
+def test_arun_matches_run_for_every_agent():
+    profile = PROFILES["instant"]
+    for name, build in AGENT_BUILDERS.items():
+        expected = build(ScriptedLLM(profile), profile).run("比较两个方案")
+        agent = build(ScriptedLLM(profile), profile)
+        assert asyncio.run(agent.arun("比较两个方案")) == expected, name
+        assert len(agent.get_history()) == 2
+
+
+def test_astream_yields_final_answer():
+    profile = PROFILES["instant"]
+
+    async def collect(agent):
+        return "".join([chunk async for chunk in agent.astream("比较两个方案")])
+
+    for name in ("simple", "plan_solve"):
+        agent = AGENT_BUILDERS[name](ScriptedLLM(profile), profile)
+        expected = AGENT_BUILDERS[name](ScriptedLLM(profile), profile).run("比较两个方案")
+        assert asyncio.run(collect(agent)) == expected, name
+
+
+def test_sessions_share_one_event_loop():
+    profile = LatencyProfile(ttft=0.1, tokens_per_second=10000)
+    sessions = 20
+
+    agents = [AGENT_BUILDERS["simple"](ScriptedLLM(profile), profile) for _ in range(sessions)]
+
+    async def main():
+        return await asyncio.gather(*(agent.arun(f"问题 {i}") for i, agent in enumerate(agents)))
+
+    started = time.perf_counter()
+    answers = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+
+    assert len(answers) == sessions and all(answers)
+    # 各会话的等待在同一事件循环上重叠，而不是串行累加
+    assert elapsed < profile.ttft * sessions / 4
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/9 16:00
+# @Author  : wang ke
+# @File    : test_batch_runner.py
+# @Software: PyCharm
+
+import json
+import asyncio
+
+from benchmarks.agent_bench import LatencyProfile, ScriptedLLM, AGENT_BUILDERS
+from server.batch_runner import BatchRunner, BatchConfig, BatchCheckpoint, _unescape
+
+
+def _write_questions(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"request_id": f"q-{i}", "title": f"问题 {i}", "body": "请回答"},
+                               ensure_ascii=False) + "\n")
+
+
+def _runner(tmp_path, profile=LatencyProfile(), **kwargs):
+    config = BatchConfig(input_path=str(tmp_path / "questions.jsonl"), output_path=str(tmp_path / "results.jsonl"),
+                         id_field="request_id", input_template="{title}\n{body}", **kwargs)
+    llm = ScriptedLLM(profile)
+    return BatchRunner(lambda: AGENT_BUILDERS["simple"](llm, profile), config)
+
+
+def _results(tmp_path):
+    with open(tmp_path / "results.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_runs_all_items_concurrently_and_reports_percentiles(tmp_path):
+    _write_questions(tmp_path / "questions.jsonl", 20)
+    runner = _runner(tmp_path, LatencyProfile(ttft=0.05, tokens_per_second=10000), concurrency=10)
+    report = asyncio.run(runner.run())
+
+    results = _results(tmp_path)
+    assert sorted(r["id"] for r in results) == sorted(f"q-{i}" for i in range(20))
+    assert all(r["error"] is None and r["output"] for r in results)
+    assert report["processed"] == 20 and report["succeeded_total"] == 20
+    assert report["latency"]["p50"] <= report["latency"]["p99"]
+    # 20 道题、并发 10，约两轮模型延迟
+    assert report["wall_seconds"] < 0.05 * 20 / 2
+
+
+def test_resume_skips_completed_items(tmp_path):
+    _write_questions(tmp_path / "questions.jsonl", 10)
+    runner = _runner(tmp_path, checkpoint_every=3, concurrency=1)
+    asyncio.run(runner.run())
+
+    # 模拟中途崩溃：检查点回退到第 3 行，输出里还残留写了一半的一行
+    BatchCheckpoint(watermark=3, output_offset=len("".join(
+        json.dumps(r, ensure_ascii=False) + "\n" for r in _results(tmp_path)[:3]).encode("utf-8")),
+        succeeded=3).save(str(tmp_path / "results.jsonl.checkpoint"))
+    with open(tmp_path / "results.jsonl", "ab") as f:
+        f.write(b'{"line": 9, "id"')
+
+    resumed = _runner(tmp_path)
+    report = asyncio.run(resumed.run())
+    assert report["processed"] == 0
+    assert report["succeeded_total"] == 10
+    assert len(_results(tmp_path)) == 10
+
+    # 新增的题目会在下次运行时被处理
+    with open(tmp_path / "questions.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"request_id": "q-new", "title": "新问题", "body": ""}, ensure_ascii=False) + "\n")
+    report = asyncio.run(_runner(tmp_path).run())
+    assert report["processed"] == 1
+    assert _results(tmp_path)[-1]["id"] == "q-new"
+
+
+def test_failures_are_recorded(tmp_path):
+    _write_questions(tmp_path / "questions.jsonl", 3)
+    config = BatchConfig(input_path=str(tmp_path / "questions.jsonl"), output_path=str(tmp_path / "results.jsonl"),
+                         input_field="missing_field_is_not_used", input_template="{title}", timeout=0.01)
+    llm = ScriptedLLM(LatencyProfile(ttft=0.5))
+    report = asyncio.run(BatchRunner(lambda: AGENT_BUILDERS["simple"](llm, LatencyProfile()), config).run())
+
+    assert report["failed_total"] == 3
+    assert all("超时" in r["error"] for r in _results(tmp_path))
+
+    # 普通续跑不重复处理失败的题目，--retry-failed 时重新运行
+    assert asyncio.run(BatchRunner(lambda: AGENT_BUILDERS["simple"](llm, LatencyProfile()), config).run())[
+        "processed"] == 0
+    retry = config.model_copy(update={"timeout": None, "retry_failed": True})
+    fast = ScriptedLLM(LatencyProfile())
+    report = asyncio.run(BatchRunner(lambda: AGENT_BUILDERS["simple"](fast, LatencyProfile()), retry).run())
+    assert report["processed"] == 3
+    assert report["failed_total"] == 0 and report["succeeded_total"] == 3
+    latest = {r["line"]: r for r in _results(tmp_path)}
+    assert all(r["error"] is None for r in latest.values())
+    assert asyncio.run(BatchRunner(lambda: AGENT_BUILDERS["simple"](fast, LatencyProfile()), retry).run())[
+        "processed"] == 0
+
+
+def test_template_unescape_keeps_chinese():
+    assert _unescape("问题：{title}\\n{body}\\t\\\\") == "问题：{title}\n{body}\t\\"
+
+
+def test_invalid_lines_are_recorded_without_aborting(tmp_path):
+    _write_questions(tmp_path / "questions.jsonl", 2)
+    with open(tmp_path / "questions.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"request_id": "broken", "title": \n')
+        f.write('{"request_id": "no-title", "body": "缺少标题"}\n')
+        f.write(json.dumps({"request_id": "q-last", "title": "最后一题", "body": ""}, ensure_ascii=False) + "\n")
+
+    report = asyncio.run(_runner(tmp_path).run())
+    results = {r["line"]: r for r in _results(tmp_path)}
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert "JSONDecodeError" in results[2]["error"] and "KeyError" in results[3]["error"]
+    assert results[4]["id"] == "q-last" and results[4]["error"] is None
+    assert report["succeeded_total"] == 3 and report["failed_total"] == 2
+
+    # 无效行已记录为完成，续跑时不再重复处理
+    assert asyncio.run(_runner(tmp_path).run())["processed"] == 0
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/20 15:10
+# @Author  : wang ke
+# @File    : test_llm_cache.py
+# @Software: PyCharm
+
+import os
+import time
+import asyncio
+import tempfile
+
+from core.llm_cache import LLMResponseCache
+from benchmarks.agent_bench import ScriptedLLM
+
+
+def test_key_normalization():
+    """首尾空白和换行符差异不影响缓存键"""
+    messages_a = [{"role": "user", "content": "  你好\r\n"}]
+    messages_b = [{"role": "user", "content": "你好"}]
+    assert LLMResponseCache.make_key("m", messages_a, 0) == LLMResponseCache.make_key("m", messages_b, 0)
+    assert LLMResponseCache.make_key("m", messages_a, 0) != LLMResponseCache.make_key("m", messages_b, 0.5)
+
+
+def test_lru_and_ttl_eviction():
+    """容量和TTL淘汰"""
+    cache = LLMResponseCache(max_size=2, ttl=0.05)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")  # 淘汰最久未使用的 b
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+    time.sleep(0.06)
+    assert cache.get("c") is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_sqlite_tier():
+    """磁盘层在新实例中仍然可以命中"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cache.db")
+        cache = LLMResponseCache(sqlite_path=path)
+        cache.set("k", "答案")
+        cache.close()
+
+        reopened = LLMResponseCache(sqlite_path=path)
+        assert reopened.get("k") == "答案"
+        assert reopened.get_stats()["disk_hits"] == 1
+        assert reopened.get("k") == "答案"
+        assert reopened.get_stats()["memory_hits"] == 1
+        reopened.close()
+
+
+def test_truncated_response_is_not_cached():
+    """stop_when 提前结束的半截回答不写入缓存"""
+    llm = ScriptedLLM(responder=lambda messages: "第一段。第二段。", cache=LLMResponseCache())
+    messages = [{"role": "user", "content": "你好"}]
+
+    truncated = llm.think(messages, use_cache=True, stop_when=lambda chunk: "。" in chunk)
+    assert truncated != "第一段。第二段。"
+    assert llm.think(messages, use_cache=True) == "第一段。第二段。"
+
+    async_llm = ScriptedLLM(responder=lambda messages: "第一段。第二段。", cache=LLMResponseCache())
+    asyncio.run(async_llm.athink(messages, use_cache=True, stop_when=lambda chunk: "。" in chunk))
+    assert asyncio.run(async_llm.athink(messages, use_cache=True)) == "第一段。第二段。"
+
+
+if __name__ == "__main__":
+    test_key_normalization()
+    test_lru_and_ttl_eviction()
+    test_sqlite_tier()
+    test_truncated_response_is_not_cached()
+    print("✅ 所有缓存测试通过")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/6 15:30
+# @Author  : wang ke
+# @File    : test_message.py
+# @Software: PyCharm
+
+import pytest
+
+from core.message import Message, FastMessage
+from benchmarks.message_bench import run_benchmark, TARGET_MEMORY_RATIO
+from utils.token_counter import count_message_tokens
+
+
+def test_fast_message_is_immutable_and_caches_dict():
+    message = FastMessage("你好", "user")
+    with pytest.raises(AttributeError):
+        message.content = "改写"
+    assert message.to_dict() == {"role": "user", "content": "你好"}
+    assert message.to_dict() is message.to_dict()
+    assert message.token_count == count_message_tokens("你好")
+    assert message.metadata is None
+
+
+def test_conversion_at_boundaries():
+    original = Message("内容", "assistant", metadata={"source": "test"})
+    fast = FastMessage.from_message(original)
+    assert (fast.content, fast.role, fast.metadata) == ("内容", "assistant", {"source": "test"})
+    assert fast.timestamp == original.timestamp
+
+    back = fast.to_message()
+    assert isinstance(back, Message)
+    assert back.to_dict() == original.to_dict() and back.metadata == original.metadata
+
+
+def test_benchmark_meets_targets():
+    results = run_benchmark(20000)
+    assert results["targets"]["memory_ratio"] <= TARGET_MEMORY_RATIO
+    # 构造耗时受机器负载影响，这里只要求明显快于 Message
+    assert results["targets"]["construct_ratio"] < 0.5
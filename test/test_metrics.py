@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/29 15:20
+# @Author  : wang ke
+# @File    : test_metrics.py
+# @Software: PyCharm
+
+from utils.metrics import Histogram, MetricsRegistry, current_agent, agent_label
+
+
+def test_histogram_quantile_by_label():
+    histogram = Histogram("ttft", "首token时间", buckets=(0.1, 0.5, 1.0, 2.0))
+    histogram.observe_many([0.05] * 90, model="m", agent="a")
+    histogram.observe_many([1.5] * 10, model="m", agent="a")
+
+    assert histogram.quantile(0.5, model="m", agent="a") <= 0.1
+    assert 1.0 < histogram.quantile(0.99, model="m", agent="a") <= 2.0
+    # 不同标签互不影响
+    assert histogram.quantile(0.5, model="m", agent="b") is None
+
+
+def test_render_prometheus_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("llm_tokens", "token数", buckets=(10, 100))
+    histogram.observe(5, model="qwen", agent="react")
+    histogram.observe(500, model="qwen", agent="react")
+
+    text = registry.render()
+    assert "# TYPE llm_tokens histogram" in text
+    assert 'llm_tokens_bucket{model="qwen",agent="react",le="10"} 1' in text
+    assert 'llm_tokens_bucket{model="qwen",agent="react",le="+Inf"} 2' in text
+    assert 'llm_tokens_count{model="qwen",agent="react"} 2' in text
+
+
+def test_agent_label_is_scoped():
+    assert current_agent.get() == ""
+    with agent_label("planner"):
+        assert current_agent.get() == "planner"
+    assert current_agent.get() == ""
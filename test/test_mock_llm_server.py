@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/30 15:10
+# @Author  : wang ke
+# @File    : test_mock_llm_server.py
+# @Software: PyCharm
+
+import time
+
+import openai
+import pytest
+
+from utils.mock_llm_server import MockLLMServer, MockLLMConfig
+
+
+def test_streams_scripted_response_with_latency():
+    config = MockLLMConfig(responses=["Thought: 思考\nAction: Finish[42]"], ttft=0.05, tokens_per_second=200)
+    with MockLLMServer(config) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        start = time.perf_counter()
+        stream = client.chat.completions.create(
+            model="mock", messages=[{"role": "user", "content": "hi"}], stream=True,
+            stream_options={"include_usage": True}
+        )
+        contents, usage = [], None
+        for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                contents.append(chunk.choices[0].delta.content)
+        elapsed = time.perf_counter() - start
+
+    assert "".join(contents) == "Thought: 思考\nAction: Finish[42]"
+    assert usage.completion_tokens == len(contents)
+    assert elapsed >= 0.05
+
+
+def test_stop_sequence_and_rules():
+    config = MockLLMConfig(rules=[("天气", "Action: search[天气]\nObservation: 晴")], ttft=0, tokens_per_second=0)
+    with MockLLMServer(config) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        response = client.chat.completions.create(
+            model="mock", messages=[{"role": "user", "content": "北京天气"}], stop=["Observation:"]
+        )
+    assert response.choices[0].message.content == "Action: search[天气]\n"
+
+
+def test_error_injection():
+    config = MockLLMConfig(error_rate=1.0, error_status=503, retry_after=1, ttft=0)
+    with MockLLMServer(config) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        with pytest.raises(openai.APIStatusError) as exc_info:
+            client.chat.completions.create(model="mock", messages=[{"role": "user", "content": "hi"}])
+        assert server.stats["errors_injected"] == 1
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.response.headers["retry-after"] == "1"
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/12 15:30
+# @Author  : wang ke
+# @File    : test_plan_cache.py
+# @Software: PyCharm
+
+import time
+
+from agents.plan_solve_agent import PlanAndSolveAgent
+from benchmarks.agent_bench import ScriptedLLM, scripted_response
+from core.plan_cache import PlanCache, normalize_question
+
+QUESTION = "水果店周一卖出了15个苹果，周二卖出的数量是周一的两倍，请问两天总共卖出多少个？"
+PLAN = [{"id": 1, "step": "计算周二销量：15 × 2", "depends_on": []},
+        {"id": 2, "step": "汇总两天销量", "depends_on": [1]}]
+
+
+def test_templated_question_reuses_plan_with_new_numbers():
+    cache = PlanCache()
+    cache.set(QUESTION, PLAN)
+    assert normalize_question(QUESTION) == normalize_question(QUESTION.replace("15", "28"))
+
+    plan, similarity = cache.get(QUESTION.replace("15", "28"))
+    assert similarity == 1.0 and plan[0]["step"] == "计算周二销量：28 × 2"
+    # 改写不影响缓存中的原计划
+    assert cache.get(QUESTION)[0][0]["step"] == "计算周二销量：15 × 2"
+
+
+def test_adaptation_leaves_the_plans_own_numbers():
+    question = "2024年水果店卖出了3个苹果，每个5元，总共收入多少？"
+    plan = ["1. 计算3个苹果的总价：3 × 5", "步骤3：汇总"]
+    cache = PlanCache()
+    cache.set(question, plan)
+
+    adapted, _ = cache.get(question.replace("3个", "7个"))
+    # 步骤编号不随问题中的数字改写
+    assert adapted == ["1. 计算7个苹果的总价：7 × 5", "步骤3：汇总"]
+
+    # 单位与问题中不一致的数字无法判断来源，不复用而是重新规划
+    cache.set(question, ["检查3kg库存", "计算3个苹果的总价"])
+    assert cache.get(question.replace("3个", "7个")) is None
+    assert cache.get(question)[0] == ["检查3kg库存", "计算3个苹果的总价"]
+
+
+def test_numbers_without_one_to_one_mapping_miss():
+    question = "水果店卖出了3个苹果，每个3元，总共收入多少？"
+    cache = PlanCache(min_similarity=0.8)
+    cache.set(question, ["计算 3 × 3 元"])
+    # 同一个旧数字对应两个不同的新数字
+    assert cache.get(question.replace("每个3元", "每个5元")) is None
+    assert cache.get(question)[0] == ["计算 3 × 3 元"]
+
+    cache.set(QUESTION, PLAN)
+    # 多出一个数字，相似度足够但数字个数不同
+    assert cache.get(QUESTION.replace("请问", "周三卖了7个，请问")) is None
+    assert cache.get_stats()["misses"] == 2
+
+
+def test_similar_question_hits_and_unrelated_misses():
+    cache = PlanCache(min_similarity=0.8)
+    cache.set(QUESTION, PLAN)
+    assert cache.get("水果店周一卖出了15个苹果，周二卖出的数量是周一的两倍，两天一共卖出多少个？") is not None
+    assert cache.get("明天上海会下雨吗？") is None
+    # 不同命名空间（规划提示词或模型不同）互不复用
+    assert cache.get(QUESTION, namespace="other") is None
+
+    stats = cache.get_stats()
+    assert stats["similar_hits"] == 1 and stats["misses"] == 2 and stats["hit_rate"] == 1 / 3
+
+
+def test_stale_entries_are_replanned():
+    cache = PlanCache(ttl=0.05)
+    cache.set(QUESTION, PLAN)
+    time.sleep(0.1)
+    assert cache.get(QUESTION) is None and cache.get_stats()["stale"] == 1
+
+    cache = PlanCache(max_reuses=2)
+    cache.set(QUESTION, PLAN)
+    assert cache.get(QUESTION) is not None and cache.get(QUESTION) is not None
+    assert cache.get(QUESTION) is None and cache.get_stats()["size"] == 0
+
+
+def test_sqlite_persistence(tmp_path):
+    path = str(tmp_path / "plans.db")
+    cache = PlanCache(sqlite_path=path)
+    cache.set(QUESTION, PLAN)
+    cache.close()
+
+    reopened = PlanCache(sqlite_path=path)
+    assert reopened.get(QUESTION.replace("15", "9"))[0][0]["step"] == "计算周二销量：9 × 2"
+    assert reopened.invalidate(QUESTION) and reopened.get(QUESTION) is None
+
+
+def test_agents_sharing_cache_skip_planning():
+    cache = PlanCache()
+    calls = []
+
+    def responder(messages):
+        calls.append(messages[-1]["content"])
+        return scripted_response(messages)
+
+    llm = ScriptedLLM(responder=responder)
+    PlanAndSolveAgent("ps", llm, plan_cache=cache).run(QUESTION)
+    assert len(calls) == 4
+    PlanAndSolveAgent("ps", llm, plan_cache=cache).run(QUESTION.replace("15", "30"))
+    # 第二次只执行三个步骤，没有规划调用
+    assert len(calls) == 7 and not any("规划专家" in prompt for prompt in calls[4:])
+    assert cache.get_stats()["exact_hits"] == 1
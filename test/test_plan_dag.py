@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/11 10:20
+# @Author  : wang ke
+# @File    : test_plan_dag.py
+# @Software: PyCharm
+
+import time
+import asyncio
+
+from agents.plan_solve_agent import PlanAndSolveAgent, StepContext, normalize_plan
+from benchmarks.agent_bench import ScriptedLLM, LatencyProfile
+from utils.token_counter import count_tokens
+
+# 四个互不依赖的步骤 + 一个汇总步骤
+FAN_IN_PLAN = ('```python\n[{"id": 1, "step": "A", "depends_on": []}, {"id": 2, "step": "B", "depends_on": []}, '
+               '{"id": 3, "step": "C", "depends_on": [1]}, {"id": 4, "step": "D", "depends_on": []}, '
+               '{"id": 5, "step": "汇总", "depends_on": [2, 3, 4]}]\n```')
+
+
+class RecordingResponder:
+    """规划时返回固定计划，执行时返回“<步骤>的结果”，并记录每个步骤收到的提示词"""
+
+    def __init__(self):
+        self.prompts = {}
+
+    def __call__(self, messages):
+        prompt = messages[-1]["content"]
+        if "规划专家" in prompt:
+            return FAN_IN_PLAN
+        step = prompt.split("# 当前步骤:")[1].split("请仅输出")[0].strip()
+        self.prompts[step] = prompt
+        return f"{step}的结果"
+
+
+def test_normalize_plan_drops_invalid_dependencies():
+    plan = normalize_plan([
+        {"id": "a", "step": "第一步", "depends_on": ["b"]},
+        {"id": "b", "step": "第二步", "depends_on": ["a", "b", "x"]},
+    ])
+    assert [(step.id, step.depends_on) for step in plan] == [(1, []), (2, [1])]
+    # 旧的纯字符串格式按顺序依赖之前的所有步骤
+    assert [step.depends_on for step in normalize_plan(["a", "b", "c"])] == [[], [1], [1, 2]]
+
+
+def test_step_prompt_only_contains_dependency_outputs():
+    responder = RecordingResponder()
+    answer = PlanAndSolveAgent("ps", ScriptedLLM(responder=responder)).run("问题")
+    assert answer == "汇总的结果"
+    history = lambda step: responder.prompts[step].split("# 依赖步骤与结果:")[1].split("# 当前步骤:")[0]
+    assert "A的结果" in history("C") and "B的结果" not in history("C")
+    assert "无" in history("A")
+    final = history("汇总")
+    assert all(f"{step}的结果" in final for step in "BCD") and "A的结果" not in final
+
+
+def test_wall_time_follows_critical_path():
+    profile = LatencyProfile(ttft=0.2)
+    # 计划 + 关键路径 A→C→汇总 共4次调用，逐步执行则需要6次
+    agent = PlanAndSolveAgent("ps", ScriptedLLM(profile=profile, responder=RecordingResponder()))
+    started = time.perf_counter()
+    assert agent.run("问题") == "汇总的结果"
+    assert time.perf_counter() - started < 1.0
+
+    agent = PlanAndSolveAgent("ps", ScriptedLLM(profile=profile, responder=RecordingResponder()))
+    started = time.perf_counter()
+    assert asyncio.run(agent.arun("问题")) == "汇总的结果"
+    assert time.perf_counter() - started < 1.0
+
+
+def test_step_context_keeps_recent_steps_and_summarizes_older():
+    summarized = []
+    context = StepContext(max_tokens=600, recent_steps=2, summary_tokens=20,
+                          summarizer=lambda description, result: summarized.append(description) or result[:30])
+    plan = normalize_plan([f"步骤{i}" for i in range(1, 21)])
+    outputs = {i: f"第{i}步的详细结果。" * 30 for i in range(1, 20)}
+
+    for _ in range(2):
+        rendered = context.render(plan, outputs)
+        assert count_tokens(rendered) <= 600
+        assert outputs[19] in rendered and outputs[18] in rendered and outputs[17] not in rendered
+        assert "结果摘要: 第17步" in rendered and "已省略" in rendered
+    # 摘要按步骤缓存，重复渲染不会再次摘要
+    assert len(summarized) == len(set(summarized))
+
+
+def test_long_sequential_plan_prompt_stays_bounded():
+    long_plan = "```python\n" + repr([f"子任务{i}" for i in range(1, 19)]) + "\n```"
+    histories = []
+
+    def responder(messages):
+        prompt = messages[-1]["content"]
+        if "规划专家" in prompt:
+            return long_plan
+        histories.append(prompt.split("# 依赖步骤与结果:")[1].split("# 当前步骤:")[0])
+        return "这一步得到了很长的中间结果，" * 40
+
+    agent = PlanAndSolveAgent("ps", ScriptedLLM(responder=responder), step_context=StepContext(max_tokens=1024))
+    agent.run("问题")
+    assert len(histories) == 18
+    # 旧格式的每一步都依赖之前所有步骤，有界上下文使后面步骤的提示词不再增长
+    assert max(count_tokens(history) for history in histories) <= 1024
+    assert count_tokens(histories[-1]) <= count_tokens(histories[8]) * 1.2
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/23 14:30
+# @Author  : wang ke
+# @File    : test_prompt_assembler.py
+# @Software: PyCharm
+
+from core.agent import PromptAssembler
+from core.message import Message
+from utils.token_counter import count_message_tokens
+
+
+def _history(turns: int) -> list:
+    history = []
+    for i in range(turns):
+        history.append(Message(f"问题{i}" * 20, "user"))
+        history.append(Message(f"回答{i}" * 20, "assistant"))
+    return history
+
+
+def test_keeps_newest_messages_within_budget():
+    """超出预算时丢弃最早的消息，系统提示词和当前输入始终保留"""
+    history = _history(50)
+    assembler = PromptAssembler(max_tokens=600, reserved_tokens=100)
+    messages = assembler.assemble("你是一个助手", history, "新的问题")
+
+    assert messages[0] == {"role": "system", "content": "你是一个助手"}
+    assert messages[-1] == {"role": "user", "content": "新的问题"}
+    assert messages[-2]["content"] == history[-1].content
+    assert len(messages) < len(history) + 2
+    assert sum(count_message_tokens(m["content"]) for m in messages) <= 500
+
+
+def test_summarizer_replaces_dropped_messages():
+    calls = []
+
+    def summarizer(dropped):
+        calls.append(len(dropped))
+        return f"共{len(dropped)}条早期消息"
+
+    history = _history(50)
+    assembler = PromptAssembler(max_tokens=800, summarizer=summarizer, max_summary_tokens=50)
+    first = assembler.assemble(None, history, "问题")
+    second = assembler.assemble(None, history, "问题")
+
+    assert first[0]["role"] == "system"
+    assert first[0]["content"].startswith("此前对话摘要")
+    assert first == second
+    assert len(calls) == 1  # 相同的被丢弃消息只摘要一次
+
+
+def test_summary_cache_follows_message_contents():
+    calls = []
+
+    def summarizer(dropped):
+        calls.append(dropped[0].content)
+        return dropped[0].content[:10]
+
+    assembler = PromptAssembler(max_tokens=800, summarizer=summarizer, max_summary_tokens=50)
+    history = _history(50)
+    assembler.assemble(None, history, "问题")
+    # 内容相同的新对象（例如重新载入的历史）复用摘要
+    assembler.assemble(None, [Message(m.content, m.role, timestamp=m.timestamp) for m in history], "问题")
+    assert len(calls) == 1
+
+    # 条数相同但内容不同的历史重新摘要
+    history = [Message(m.content.replace("问题", "提问"), m.role, timestamp=m.timestamp) for m in history]
+    messages = assembler.assemble(None, history, "问题")
+    assert len(calls) == 2 and "提问0" in messages[0]["content"]
+
+
+if __name__ == "__main__":
+    test_keeps_newest_messages_within_budget()
+    test_summarizer_replaces_dropped_messages()
+    test_summary_cache_follows_message_contents()
+    print("✅ 提示词组装测试通过")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/26 15:02
+# @Author  : wang ke
+# @File    : test_rate_limit.py
+# @Software: PyCharm
+
+import os
+import time
+import asyncio
+import tempfile
+import threading
+
+from core.rate_limit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_reservation():
+    """超出容量的预约返回需要等待的时间，而不是失败"""
+    bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 每秒10个
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    wait = bucket.reserve(1)
+    assert 0.05 < wait <= 0.1
+
+
+def test_max_concurrency_queues_fairly():
+    limiter = RateLimiter(max_concurrency=2)
+    peak = []
+    active = [0]
+    order = []
+    lock = threading.Lock()
+
+    def worker(i):
+        with limiter.limit():
+            with lock:
+                active[0] += 1
+                peak.append(active[0])
+                order.append(i)
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = []
+    for i in range(6):
+        t = threading.Thread(target=worker, args=(i,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.002)
+    for t in threads:
+        t.join()
+
+    assert max(peak) == 2
+    assert order == sorted(order)
+    stats = limiter.get_stats()
+    assert stats["acquired"] == 6
+    assert stats["queue_depth"] == 0
+    assert stats["max_wait_seconds"] > 0
+
+
+def test_async_concurrency():
+    limiter = RateLimiter(max_concurrency=1)
+    active = [0]
+    peak = [0]
+
+    async def call():
+        async with limiter.alimit():
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(5)))
+
+    asyncio.run(main())
+    assert peak[0] == 1
+    assert limiter.get_stats()["in_flight"] == 0
+
+
+def test_sqlite_backed_limits_are_shared():
+    """两个指向同一文件的限流器共享RPM和并发名额"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "limits.db")
+        first = RateLimiter(requests_per_minute=120, max_concurrency=1, sqlite_path=path)
+        second = RateLimiter(requests_per_minute=120, max_concurrency=1, sqlite_path=path)
+
+        with first.limit():
+            assert second.governor.active == 1
+
+        # 容量为120，第121个请求需要等待约0.5秒
+        for _ in range(60):
+            first.request_bucket.reserve(1)
+        for _ in range(60):
+            second.request_bucket.reserve(1)
+        assert second.request_bucket.reserve(1) > 0.4
+
+
+if __name__ == "__main__":
+    test_token_bucket_reservation()
+    test_max_concurrency_queues_fairly()
+    test_async_concurrency()
+    test_sqlite_backed_limits_are_shared()
+    print("✅ 限流测试通过")
+
+
+def test_waiting_for_tokens_does_not_hold_concurrency_slot():
+    """等待TPM令牌期间不占用并发名额"""
+    limiter = RateLimiter(tokens_per_minute=600, max_concurrency=1)  # 每秒10个token
+    limiter.token_bucket.reserve(600)
+    started = threading.Event()
+
+    def starved():
+        started.set()
+        with limiter.limit(estimated_tokens=3):
+            pass
+
+    thread = threading.Thread(target=starved)
+    thread.start()
+    started.wait()
+    time.sleep(0.05)
+    assert limiter.get_stats()["queue_depth"] == 1 and limiter.governor.active == 0
+    thread.join()
+    assert limiter.governor.active == 0
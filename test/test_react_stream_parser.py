@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/31 11:20
+# @Author  : wang ke
+# @File    : test_react_stream_parser.py
+# @Software: PyCharm
+
+from agents.react_agent import ReActStreamParser, ReActAgent
+from benchmarks.agent_bench import LatencyProfile, ScriptedLLM
+from tools.registry import ToolRegistry
+
+
+def _feed_all(parser: ReActStreamParser, chunks):
+    for index, chunk in enumerate(chunks):
+        if parser.feed(chunk):
+            return index
+    return None
+
+
+def test_cuts_after_complete_action():
+    parser = ReActStreamParser()
+    chunks = ["Thought: 需要搜索\nAc", "tion: sear", "ch[北京", "天气]\nObserv", "ation: 晴\nThought: ..."]
+
+    assert _feed_all(parser, chunks) == 3
+    assert parser.result == "Thought: 需要搜索\nAction: search[北京天气]"
+
+
+def test_nested_brackets_and_finish():
+    parser = ReActStreamParser()
+    assert not parser.feed("Thought: 完成\nAction: Finish[列表是 [1, 2")
+    assert parser.feed(", 3]。]后续内容")
+    assert parser.result.endswith("Finish[列表是 [1, 2, 3]。]")
+
+
+def test_incomplete_output_is_kept():
+    parser = ReActStreamParser()
+    assert _feed_all(parser, ["Thought: 想一想", "\nAction: search[未闭合"]) is None
+    assert not parser.complete
+    assert parser.result == "Thought: 想一想\nAction: search[未闭合"
+
+
+def test_react_agent_stops_generation_early():
+    responses = iter([
+        "Thought: 查一下\nAction: search[问题]\nObservation: 编造的结果\nThought: 编造的下一步\nAction: Finish[错]",
+        "Thought: 够了\nAction: Finish[42]\n多余的解释" * 3,
+    ])
+    llm = ScriptedLLM(LatencyProfile(), responder=lambda messages: next(responses))
+    registry = ToolRegistry()
+    registry.register_function("search", "检索", lambda query: "真实结果")
+    agent = ReActAgent("react", llm, tool_registry=registry)
+
+    assert agent.run("问题") == "42"
+    # 第一步在 stop 序列处被截断，编造的 Observation 不会进入历史
+    assert agent.current_history == ["Action: search[问题]", "Observation: 真实结果"]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/13 11:00
+# @Author  : wang ke
+# @File    : test_replan.py
+# @Software: PyCharm
+
+import asyncio
+
+from agents.plan_solve_agent import PlanAndSolveAgent, Planner
+from benchmarks.agent_bench import ScriptedLLM
+from core.run_checkpoint import RunCheckpointStore
+
+PLAN = ('```python\n[{"id": 1, "step": "A", "depends_on": []}, {"id": 2, "step": "B", "depends_on": []}, '
+        '{"id": 3, "step": "汇总", "depends_on": [1, 2]}]\n```')
+REVISED = ('```python\n[{"id": 4, "step": "换一种方式完成B", "depends_on": []}, '
+           '{"id": 5, "step": "汇总", "depends_on": [1, 4]}]\n```')
+
+
+class FlakyResponder:
+    """执行步骤时按 failing 中的步骤返回空结果，记录每类调用的次数"""
+
+    def __init__(self, plan=PLAN, failing=("B",), revised=REVISED):
+        self.plan, self.failing, self.revised = plan, set(failing), revised
+        self.calls = []
+        self.prompts = {}
+
+    def __call__(self, messages):
+        prompt = messages[-1]["content"]
+        if "修订尚未完成" in prompt:
+            self.calls.append("replan")
+            self.prompts["replan"] = prompt
+            return self.revised
+        if "格式不正确" in prompt:
+            self.calls.append("repair")
+            return PLAN
+        if "规划专家" in prompt:
+            self.calls.append("plan")
+            return self.plan
+        step = prompt.split("# 当前步骤:")[1].split("请仅输出")[0].strip()
+        self.calls.append(step)
+        return "" if step in self.failing else f"{step}的结果"
+
+
+def test_extract_plan_tolerates_common_format_errors():
+    plan = Planner._parse_plan('```json\n[{“id”: 1, “step”: “A”, “depends_on”: []},]\n```')
+    assert [step.description for step in plan] == ["A"]
+    plan = Planner._parse_plan("计划如下：\n1. 收集数据\n2、计算结果\n- 汇总")
+    assert [step.description for step in plan] == ["收集数据", "计算结果", "汇总"]
+    assert Planner._parse_plan("抱歉，我无法给出计划。") == []
+
+
+def test_malformed_plan_is_repaired_without_replanning():
+    responder = FlakyResponder(plan="```python\n[{'id': 1 'step': 'A'}\n```", failing=())
+    assert PlanAndSolveAgent("ps", ScriptedLLM(responder=responder)).run("问题") == "汇总的结果"
+    assert responder.calls.count("plan") == 1 and responder.calls.count("repair") == 1
+
+
+def test_failed_step_replans_only_remaining_steps():
+    for mode in ("run", "arun", "astream"):
+        responder = FlakyResponder()
+        agent = PlanAndSolveAgent("ps", ScriptedLLM(responder=responder))
+        if mode == "run":
+            answer = agent.run("问题")
+        elif mode == "arun":
+            answer = asyncio.run(agent.arun("问题"))
+        else:
+            async def consume():
+                return "".join([chunk async for chunk in agent.astream("问题")])
+            answer = asyncio.run(consume())
+
+        assert answer == "汇总的结果", mode
+        # 已完成的步骤A不会重新执行，也不会重新生成整个计划
+        assert responder.calls.count("A") == 1 and responder.calls.count("plan") == 1
+        assert responder.calls.count("replan") == 1 and "换一种方式完成B" in responder.calls
+        assert "A的结果" in responder.prompts["replan"]
+
+
+def test_exhausted_replans_keep_checkpoint(tmp_path):
+    store = RunCheckpointStore(str(tmp_path))
+    responder = FlakyResponder(failing=("B", "换一种方式完成B"))
+    agent = PlanAndSolveAgent("ps", ScriptedLLM(responder=responder), checkpoint_store=store, max_replans=1)
+    answer = agent.run("问题", run_id="run-1")
+    assert "任务终止" in answer and responder.calls.count("replan") == 1
+
+    state = store.load("run-1")
+    assert list(state["results"].values()) == ["A的结果"]
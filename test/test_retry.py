@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/27 16:40
+# @Author  : wang ke
+# @File    : test_retry.py
+# @Software: PyCharm
+
+import time
+import asyncio
+
+import httpx
+import openai
+
+import pytest
+
+from core.rate_limit import RateLimiter
+from utils import metrics
+from core.retry import RetryPolicy, LatencyTracker, DeadlineExceeded, hedge_delay, retry_stream, aretry_stream, \
+    hedged_stream, ahedged_stream
+
+
+def _connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+
+
+def test_retry_before_first_token():
+    """首token前的瞬时错误会被重试"""
+    attempts = []
+
+    def factory(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise _connection_error()
+        yield "ok"
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001)
+    assert "".join(retry_stream(factory, policy)) == "ok"
+    assert len(attempts) == 3
+
+
+def test_no_retry_after_first_token():
+    attempts = []
+
+    def factory(timeout):
+        attempts.append(timeout)
+        yield "部分"
+        raise _connection_error()
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001)
+    chunks = []
+    try:
+        for chunk in retry_stream(factory, policy):
+            chunks.append(chunk)
+    except openai.APIConnectionError:
+        pass
+    assert chunks == ["部分"]
+    assert len(attempts) == 1
+
+
+def test_non_retryable_error_is_raised():
+    def factory(timeout):
+        raise ValueError("bad request")
+        yield
+
+    try:
+        list(retry_stream(factory, RetryPolicy(base_delay=0.001)))
+        assert False, "应当抛出异常"
+    except ValueError:
+        pass
+
+
+def test_hedge_delay_from_p95():
+    tracker = LatencyTracker()
+    policy = RetryPolicy(hedge=True, hedge_min_samples=10, hedge_min_delay=0.01)
+    assert hedge_delay(policy, tracker) is None
+    for i in range(100):
+        tracker.record(i / 100)
+    assert abs(hedge_delay(policy, tracker) - 0.95) < 1e-9
+
+
+def test_hedged_stream_prefers_fast_response():
+    """首个请求很慢时，对冲请求先返回首token并被采用"""
+    calls = []
+
+    def factory():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            yield "慢"
+        else:
+            yield "快"
+            yield "的回答"
+
+    start = time.monotonic()
+    assert "".join(hedged_stream(factory, delay=0.05)) == "快的回答"
+    assert time.monotonic() - start < 0.4
+    assert len(calls) == 2
+
+
+def test_async_hedged_stream():
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(0.5)
+            yield "慢"
+        else:
+            yield "快"
+
+    async def main():
+        return "".join([chunk async for chunk in ahedged_stream(factory, delay=0.05)])
+
+    assert asyncio.run(main()) == "快"
+
+
+def test_hedged_attempts_see_caller_context():
+    """对冲的两个请求都在后台线程中运行，仍要按调用方的 agent 记录指标"""
+    seen = []
+
+    def factory():
+        seen.append(metrics.current_agent.get())
+        time.sleep(0.1)
+        yield "答案"
+
+    token = metrics.current_agent.set("planner")
+    try:
+        assert "".join(hedged_stream(factory, delay=0.02)) == "答案"
+    finally:
+        metrics.current_agent.reset(token)
+    assert seen == ["planner", "planner"]
+
+
+if __name__ == "__main__":
+    test_retry_before_first_token()
+    test_no_retry_after_first_token()
+    test_non_retryable_error_is_raised()
+    test_hedge_delay_from_p95()
+    test_hedged_stream_prefers_fast_response()
+    test_async_hedged_stream()
+    print("✅ 重试与对冲测试通过")
+
+
+def test_deadline_interrupts_a_stream_that_keeps_producing():
+    """单次请求的超时只约束每次读操作，持续输出的流也要在总截止时间到达时中断"""
+    def endless(timeout):
+        while True:
+            time.sleep(0.02)
+            yield "x"
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        for _ in retry_stream(endless, RetryPolicy(deadline=0.2)):
+            pass
+    assert time.monotonic() - start < 0.5
+
+    async def aendless(timeout):
+        while True:
+            await asyncio.sleep(0.02)
+            yield "x"
+
+    async def consume():
+        async for _ in aretry_stream(aendless, RetryPolicy(deadline=0.2)):
+            pass
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(consume())
+
+
+def test_rate_limiter_gives_up_at_deadline():
+    """排队等待并发名额或令牌超过剩余时间时放弃，并释放占用的排队位置"""
+    limiter = RateLimiter(max_concurrency=1)
+    with limiter.limit():
+        with pytest.raises(TimeoutError):
+            with limiter.limit(timeout=0.05):
+                pass
+
+        async def queued():
+            async with limiter.alimit(timeout=0.05):
+                pass
+
+        with pytest.raises(TimeoutError):
+            asyncio.run(queued())
+    assert limiter.governor.active == 0 and limiter.governor.waiting == 0
+
+    limiter = RateLimiter(tokens_per_minute=60)
+    with pytest.raises(TimeoutError):
+        with limiter.limit(estimated_tokens=120, timeout=1):
+            pass
+    # 放弃时返还令牌
+    assert limiter.token_bucket.reserve(30) == 0
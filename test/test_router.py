@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/28 15:20
+# @Author  : wang ke
+# @File    : test_router.py
+# @Software: PyCharm
+
+from core.llm import AgentsLLM
+from core.router import Endpoint, EndpointRouter
+
+
+def _router(**kwargs) -> EndpointRouter:
+    endpoints = [
+        Endpoint(name="local", base_url="http://localhost:11434/v1", model="qwen", weight=2.0, max_in_flight=1),
+        Endpoint(name="cloud", base_url="https://ollama.com/v1", api_key="key", model="qwen"),
+    ]
+    return EndpointRouter(endpoints, explore_ratio=0, **kwargs)
+
+
+def test_prefers_faster_endpoint():
+    router = _router()
+    router.record_success("local", ttft=2.0, tokens=100, duration=4.0)
+    router.record_success("cloud", ttft=0.2, tokens=100, duration=1.2)
+    assert [e.name for e in router.rank()] == ["cloud", "local"]
+
+
+def test_weight_favours_local_when_close():
+    router = _router()
+    router.record_success("local", ttft=0.3, tokens=100, duration=1.3)
+    router.record_success("cloud", ttft=0.2, tokens=100, duration=1.2)
+    assert router.rank()[0].name == "local"
+
+
+def test_spills_over_when_local_saturated():
+    router = _router()
+    router.record_success("local", ttft=0.1, tokens=100, duration=1.0)
+    router.record_success("cloud", ttft=0.5, tokens=100, duration=2.0)
+    router.acquire("local")
+    assert [e.name for e in router.rank()] == ["cloud", "local"]
+    router.release("local")
+    assert router.rank()[0].name == "local"
+
+
+def test_circuit_breaker_moves_endpoint_last():
+    router = _router(failure_threshold=2, cooldown=60)
+    router.record_success("local", ttft=0.1, tokens=100, duration=1.0)
+    router.record_failure("local")
+    router.record_failure("local")
+    assert [e.name for e in router.rank()] == ["cloud", "local"]
+    assert router.get_stats()["local"]["healthy"] is False
+
+
+def test_keys_follow_the_routed_models():
+    messages = [{"role": "user", "content": "你好"}]
+    same_model = AgentsLLM(model="default", apiKey="key", baseUrl="http://127.0.0.1:9/v1", router=_router())
+    plain = AgentsLLM(model="qwen", apiKey="key", baseUrl="http://127.0.0.1:9/v1")
+    # 各端点服务同一个模型时按该模型缓存，而不是客户端的默认模型
+    assert same_model._cache_key(messages, 0, True, False) == plain._cache_key(messages, 0, True, False)
+    assert same_model._request_key(messages, 0) != plain._request_key(messages, 0)
+
+    mixed = AgentsLLM(model="default", apiKey="key", baseUrl="http://127.0.0.1:9/v1", router=EndpointRouter([
+        Endpoint(name="local", base_url="http://localhost:11434/v1", model="qwen"),
+        Endpoint(name="cloud", base_url="https://ollama.com/v1", model="deepseek"),
+    ]))
+    # 可能故障转移到其他模型时不缓存，合并键也与单一模型的配置区分开
+    assert mixed._cache_key(messages, 0, True, False) is None
+    assert mixed._request_key(messages, 0) != same_model._request_key(messages, 0)
+
+
+def test_from_settings_skips_local_endpoint_without_local_model(monkeypatch):
+    import settings.config as settings_config
+
+    monkeypatch.setattr(settings_config, "OLLAMA_LOCAL_URL", "http://localhost:11434/v1")
+    monkeypatch.setattr(settings_config, "OLLAMA_CLOUD_MODEL", "cloud-model")
+    monkeypatch.setattr(settings_config, "OLLAMA_LOCAL_MODEL", None, raising=False)
+    assert list(EndpointRouter.from_settings().endpoints) == ["cloud"]
+
+    monkeypatch.setattr(settings_config, "OLLAMA_LOCAL_MODEL", "qwen")
+    router = EndpointRouter.from_settings()
+    assert router.endpoints["local"].model == "qwen" and router.endpoints["cloud"].model == "cloud-model"
+
+
+if __name__ == "__main__":
+    test_prefers_faster_endpoint()
+    test_weight_favours_local_when_close()
+    test_spills_over_when_local_saturated()
+    test_circuit_breaker_moves_endpoint_last()
+    test_keys_follow_the_routed_models()
+    print("✅ 路由测试通过")
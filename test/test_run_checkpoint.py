@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/10 16:10
+# @Author  : wang ke
+# @File    : test_run_checkpoint.py
+# @Software: PyCharm
+
+import asyncio
+
+import pytest
+
+from agents.react_agent import ReActAgent
+from agents.plan_solve_agent import PlanAndSolveAgent
+from benchmarks.agent_bench import ScriptedLLM, scripted_response
+from core.run_checkpoint import RunCheckpointStore
+from tools.registry import ToolRegistry
+
+
+class SimulatedCrash(BaseException):
+    """模拟进程被杀死；LLM客户端会吞掉普通异常，所以继承 BaseException"""
+
+
+class CrashingResponder:
+    """记录调用次数，在第 crash_at 次调用时抛出异常，模拟进程崩溃"""
+
+    def __init__(self, crash_at=None):
+        self.calls = 0
+        self.crash_at = crash_at
+
+    def __call__(self, messages):
+        self.calls += 1
+        if self.calls == self.crash_at:
+            raise SimulatedCrash()
+        return scripted_response(messages)
+
+
+def _react(responder, store, tool_calls):
+    registry = ToolRegistry()
+    registry.register_function("search", "检索资料", lambda query: tool_calls.append(query) or "答案是42")
+    return ReActAgent("react", ScriptedLLM(responder=responder), tool_registry=registry, checkpoint_store=store)
+
+
+def test_react_resumes_after_completed_step(tmp_path):
+    store = RunCheckpointStore(str(tmp_path))
+    tool_calls = []
+    with pytest.raises(SimulatedCrash):
+        _react(CrashingResponder(crash_at=2), store, tool_calls).run("问题", run_id="run-1")
+    assert store.load("run-1")["step"] == 1
+
+    responder = CrashingResponder()
+    answer = _react(responder, store, tool_calls).run("问题", run_id="run-1")
+    assert answer == "答案是42"
+    # 恢复后只需要最后一次LLM调用，工具不会被重复调用
+    assert responder.calls == 1 and len(tool_calls) == 1
+    assert store.load("run-1") is None
+
+
+def test_plan_solve_resumes_plan_and_steps(tmp_path):
+    store = RunCheckpointStore(str(tmp_path))
+    # 第1次调用生成计划，第2、3次执行前两步，第4次（最后一步）崩溃
+    with pytest.raises(SimulatedCrash):
+        PlanAndSolveAgent("ps", ScriptedLLM(responder=CrashingResponder(crash_at=4)),
+                          checkpoint_store=store).run("问题", run_id="run-2")
+    state = store.load("run-2")
+    assert len(state["plan"]) == 3 and len(state["results"]) == 2
+
+    responder = CrashingResponder()
+    agent = PlanAndSolveAgent("ps", ScriptedLLM(responder=responder), checkpoint_store=store)
+    assert asyncio.run(agent.arun("问题", run_id="run-2")) == "该步骤的结果是42。"
+    assert responder.calls == 1
+    assert store.list_runs() == []
+
+
+def test_checkpoint_for_other_question_is_ignored(tmp_path):
+    store = RunCheckpointStore(str(tmp_path))
+    store.save("run-3", {"agent": "plan_solve", "input": "别的问题", "plan": ["a"], "results": ["x"]})
+
+    responder = CrashingResponder()
+    PlanAndSolveAgent("ps", ScriptedLLM(responder=responder), checkpoint_store=store).run("问题", run_id="run-3")
+    assert responder.calls == 4
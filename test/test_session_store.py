@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/2/5 16:40
+# @Author  : wang ke
+# @File    : test_session_store.py
+# @Software: PyCharm
+
+import os
+
+from core.config import Config
+from core.message import Message, FastMessage
+from core.session_store import SessionStore, SessionLog
+from agents.simple_agent import SimpleAgent
+from benchmarks.agent_bench import ScriptedLLM
+
+
+def test_recent_window_survives_reopen(tmp_path):
+    store = SessionStore(str(tmp_path), window=3)
+    history = store.open("s1")
+    for i in range(5):
+        history.append(Message(f"消息 {i}", "user" if i % 2 == 0 else "assistant", metadata={"i": i}))
+
+    reopened = store.open("s1")
+    assert not reopened.loaded
+    messages = list(reopened)
+    assert [m.content for m in messages] == ["消息 2", "消息 3", "消息 4"]
+    assert messages[0].metadata == {"i": 2} and messages[1].role == "assistant"
+
+
+def test_clear_marker_hides_older_messages(tmp_path):
+    store = SessionStore(str(tmp_path))
+    history = store.open("s1")
+    history.extend([Message("旧消息", "user"), Message("旧回复", "assistant")])
+    history.clear()
+    history.append(Message("新消息", "user"))
+
+    assert [m.content for m in store.open("s1")] == ["新消息"]
+
+
+def test_compaction_keeps_only_window(tmp_path):
+    path = str(tmp_path / "session.log")
+    log = SessionLog(path, window=10, compact_min_bytes=1024)
+    log.load_recent()
+    for i in range(200):
+        log.append([FastMessage(f"第 {i} 条消息" + "x" * 50, "user")])
+
+    # 压缩后文件只比窗口内数据略大，而不是随历史线性增长
+    assert os.path.getsize(path) == log.size < 4 * 1024
+    reopened = SessionLog(path, window=10)
+    assert [m.content[:8] for m in reopened.load_recent()][-1] == "第 199 条消息"[:8]
+    assert len(list(reopened.iter_all())) <= 40
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    store = SessionStore(str(tmp_path))
+    history = store.open("s1")
+    history.extend([Message("一", "user"), Message("二", "assistant")])
+    with open(store.path("s1"), "ab") as f:
+        f.write(b"\x00\x00\x00\x20partial")
+
+    reopened = store.open("s1")
+    assert [m.content for m in reopened] == ["一", "二"]
+    reopened.append(Message("三", "user"))
+    assert [m.content for m in store.open("s1")] == ["一", "二", "三"]
+
+
+def test_agent_history_persists_across_instances(tmp_path):
+    store = SessionStore(str(tmp_path))
+    config = Config(max_history_length=4)
+    agent = SimpleAgent("assistant", ScriptedLLM(), config=config)
+    agent.attach_session(store, "s1")
+    agent.run("第一个问题")
+    agent.run("第二个问题")
+
+    restored = SimpleAgent("assistant", ScriptedLLM(), config=config)
+    restored.attach_session(store, "s1")
+    assert [m.content for m in restored.get_history()] == [m.content for m in agent.get_history()]
+    assert len(restored.get_history()) == 4
+    # 对外接口返回 pydantic Message，内部热路径仍使用 FastMessage
+    assert all(isinstance(m, Message) for m in restored.get_history())
+    assert restored.get_history()[0].model_dump()["role"] == "user"
+
+
+def test_failed_llm_call_still_persists(tmp_path):
+    class FailingLLM(ScriptedLLM):
+        def think(self, messages, **kwargs):
+            return None
+
+    store = SessionStore(str(tmp_path))
+    agent = SimpleAgent("assistant", FailingLLM())
+    agent.attach_session(store, "s1")
+    assert agent.run("问题") is None
+
+    assert [(m.role, m.content) for m in store.open("s1")] == [("user", "问题"), ("assistant", "")]
+    assert FastMessage(None, "assistant").content == "" and FastMessage(42, "user").content == "42"
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/31 15:40
+# @Author  : wang ke
+# @File    : test_simple_agent_tools.py
+# @Software: PyCharm
+
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+from typing import Dict, Any, List
+
+from agents.simple_agent import SimpleAgent, ToolCallStreamParser
+from benchmarks.agent_bench import LatencyProfile, ScriptedLLM
+from core.stream import QueueSink
+from tools.base import Tool, ToolParameter
+from tools.registry import ToolRegistry
+
+
+class SlowTool(Tool):
+    """固定延迟的测试工具"""
+
+    def __init__(self, name: str, latency: float):
+        super().__init__(name, f"延迟 {latency} 秒的测试工具")
+        self.latency = latency
+        self.started_at: List[float] = []
+
+    def run(self, parameters: Dict[str, Any]) -> str:
+        self.started_at.append(time.perf_counter())
+        time.sleep(self.latency)
+        return f"{self.name}:{parameters.get('query')}"
+
+    def get_parameters(self) -> List[ToolParameter]:
+        return [ToolParameter(name="query", type="string", description="查询内容")]
+
+
+def test_parser_detects_calls_across_chunks():
+    parser = ToolCallStreamParser()
+    assert parser.feed("先查一下 [TOOL_") == []
+    assert parser.feed("CALL:search:query=北") == []
+    calls = parser.feed("京]，再算 [TOOL_CALL:calc:a=1,b=2] 然后")
+    assert [call['tool_name'] for call in calls] == ["search", "calc"]
+    assert calls[0]['parameters'] == "query=北京"
+    assert parser.feed("[TOOL_CALL:search:query=上海]")[0]['original'] == "[TOOL_CALL:search:query=上海]"
+    assert len(parser.calls) == 3
+
+
+def test_tool_runs_while_model_is_still_generating():
+    tail = "，".join(["继续说明"] * 20)
+    responses = iter([f"[TOOL_CALL:search:query=天气]{tail}", "最终回答"])
+    llm = ScriptedLLM(LatencyProfile(tokens_per_second=100), responder=lambda messages: next(responses))
+    tool = SlowTool("search", latency=0.2)
+    registry = ToolRegistry()
+    registry.register_tool(tool)
+    agent = SimpleAgent("simple", llm, tool_registry=registry)
+
+    start = time.perf_counter()
+    assert agent.run("北京天气") == "最终回答"
+    elapsed = time.perf_counter() - start
+
+    # 工具在首个标记闭合后立即开始执行，而不是等整段生成结束
+    assert tool.started_at[0] - start < 0.15
+    generation = len(tail) / 100
+    assert elapsed < generation + tool.latency
+
+
+def test_multiple_calls_run_concurrently_in_order():
+    registry = ToolRegistry()
+    for name, latency in (("search", 0.2), ("memory", 0.2), ("calc", 0.2)):
+        registry.register_tool(SlowTool(name, latency))
+    agent = SimpleAgent("simple", ScriptedLLM(), tool_registry=registry, speculative_tool_calls=False)
+    calls = agent._parse_tool_calls(
+        "[TOOL_CALL:search:query=a][TOOL_CALL:memory:query=b][TOOL_CALL:calc:query=c]")
+
+    start = time.perf_counter()
+    results = agent._execute_tool_calls(calls)
+    elapsed = time.perf_counter() - start
+
+    assert [result.splitlines()[-1] for result in results] == ["search:a", "memory:b", "calc:c"]
+    assert elapsed < 0.4
+
+
+def test_slow_call_times_out_without_blocking_others():
+    registry = ToolRegistry()
+    registry.register_tool(SlowTool("slow", 1.0))
+    registry.register_tool(SlowTool("fast", 0.01))
+    agent = SimpleAgent("simple", ScriptedLLM(), tool_registry=registry, tool_timeout=0.1)
+    calls = agent._parse_tool_calls("[TOOL_CALL:slow:query=x][TOOL_CALL:fast:query=y]")
+
+    start = time.perf_counter()
+    results = agent._execute_tool_calls(calls)
+
+    assert "超时" in results[0]
+    assert results[1].endswith("fast:y")
+    assert time.perf_counter() - start < 0.5
+
+
+class FakeCompletions:
+    """按顺序返回预设的 function calling 响应，并记录请求参数"""
+
+    def __init__(self, messages):
+        self.messages = iter(messages)
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=next(self.messages))],
+                               usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+
+
+def _tool_call(call_id: str, name: str, arguments: str):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def test_close_releases_tool_threads():
+    registry = ToolRegistry()
+    registry.register_tool(SlowTool("search", 0.01))
+    agent = SimpleAgent("closing", ScriptedLLM(), tool_registry=registry, speculative_tool_calls=False)
+    calls = agent._parse_tool_calls("[TOOL_CALL:search:query=a][TOOL_CALL:search:query=b]")
+    assert agent._execute_tool_calls(calls)[0].endswith("search:a")
+
+    agent.close()
+    time.sleep(0.05)
+    assert not [t for t in threading.enumerate() if t.name.startswith("closing-tool")]
+    # 关闭后再次使用会重新创建线程池
+    assert agent._execute_tool_calls(calls)[1].endswith("search:b")
+    agent.close()
+
+
+def test_function_calling_mode_runs_parallel_tool_calls():
+    completions = FakeCompletions([
+        SimpleNamespace(content=None, tool_calls=[
+            _tool_call("call_1", "search", '{"query": "北京"}'),
+            _tool_call("call_2", "calc", '{"input": "1+1"}'),
+        ]),
+        SimpleNamespace(content="北京晴，1+1=2", tool_calls=None),
+    ])
+    llm = ScriptedLLM()
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    registry = ToolRegistry()
+    registry.register_tool(SlowTool("search", 0.01))
+    registry.register_function("calc", "计算器", lambda expression: "2")
+    agent = SimpleAgent("simple", llm, tool_registry=registry, function_calling=True)
+
+    assert agent.run("北京天气，顺便算1+1") == "北京晴，1+1=2"
+
+    first, second = completions.requests
+    assert [tool["function"]["name"] for tool in first["tools"]] == ["search", "calc"]
+    assert first["tools"][0]["function"]["parameters"]["required"] == ["query"]
+    # 系统提示词中不再包含文本形式的工具说明
+    assert "TOOL_CALL" not in first["messages"][0]["content"]
+    tool_messages = [m for m in second["messages"] if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["call_1", "call_2"]
+    assert tool_messages[0]["content"].endswith("search:北京")
+    assert tool_messages[1]["content"].endswith("2")
+
+
+def test_function_calling_answers_without_tools_after_iteration_cap():
+    completions = FakeCompletions([
+        SimpleNamespace(content=None, tool_calls=[_tool_call("call_1", "search", '{"query": "北京"}')]),
+        SimpleNamespace(content="北京晴", tool_calls=None),
+    ])
+    llm = ScriptedLLM()
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    registry = ToolRegistry()
+    registry.register_tool(SlowTool("search", 0.01))
+    agent = SimpleAgent("simple", llm, tool_registry=registry, function_calling=True)
+
+    assert agent.run("北京天气", max_tool_iterations=1, temperature=0.3) == "北京晴"
+
+    final = completions.requests[-1]
+    # 历史中含有 tool 消息，最终回答仍携带工具定义，但禁止继续调用
+    assert final["tools"] and final["tool_choice"] == "none"
+    assert final["temperature"] == 0.3
+    assert [m["role"] for m in final["messages"]][-1] == "tool"
+
+
+def test_async_speculative_calls_keep_caller_sink_and_stop_when():
+    responses = iter(["[TOOL_CALL:search:query=天气]稍等", "最终回答"])
+    llm = ScriptedLLM(responder=lambda messages: next(responses))
+    registry = ToolRegistry()
+    registry.register_tool(SlowTool("search", 0.01))
+    agent = SimpleAgent("simple", llm, tool_registry=registry)
+    sink = QueueSink()
+
+    assert asyncio.run(agent.arun("北京天气", sink=sink, stop_when=lambda chunk: False)) == "最终回答"
+    chunks = []
+    while not sink.queue.empty():
+        chunks.append(sink.queue.get_nowait())
+    # 两轮调用的片段都转发给了调用方的接收器，每轮以结束标记收尾
+    assert "".join(c for c in chunks if c is not None) == "[TOOL_CALL:search:query=天气]稍等最终回答"
+    assert chunks.count(None) == 2
+
+
+def test_async_tool_limit_works_across_event_loops():
+    def responder(messages):
+        if "工具执行结果" in messages[-1]["content"]:
+            return "最终回答"
+        return "[TOOL_CALL:search:query=a][TOOL_CALL:search:query=b]"
+
+    registry = ToolRegistry()
+    registry.register_tool(SlowTool("search", 0.01))
+    agent = SimpleAgent("simple", ScriptedLLM(responder=responder), tool_registry=registry, max_tool_workers=1)
+
+    # 每次 asyncio.run 都是新的事件循环，排队等待的工具调用不能用到上一个循环的信号量
+    for _ in range(2):
+        assert asyncio.run(agent.arun("问题")) == "最终回答"
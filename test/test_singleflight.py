@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/22 11:05
+# @Author  : wang ke
+# @File    : test_singleflight.py
+# @Software: PyCharm
+
+import gc
+import time
+import asyncio
+import threading
+
+from core.singleflight import SingleFlight, AsyncSingleFlight
+from utils import metrics
+
+
+def test_concurrent_callers_share_one_upstream():
+    """同时到达的相同请求只发起一次上游调用，且每个调用者都拿到完整响应"""
+    single_flight = SingleFlight()
+    upstream_calls = []
+
+    def factory():
+        upstream_calls.append(1)
+        for token in ["步骤", "1", "，", "步骤", "2"]:
+            time.sleep(0.01)
+            yield token
+
+    results = []
+    barrier = threading.Barrier(5)
+
+    def worker():
+        barrier.wait()
+        results.append("".join(single_flight.stream("same-key", factory)))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(upstream_calls) == 1
+    assert results == ["步骤1，步骤2"] * 5
+    assert single_flight.get_stats()["followers"] == 4
+    assert single_flight.in_flight() == 0
+
+
+def test_async_single_flight():
+    single_flight = AsyncSingleFlight()
+    upstream_calls = []
+
+    async def factory():
+        upstream_calls.append(1)
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    async def consume():
+        return "".join([chunk async for chunk in single_flight.stream("k", factory)])
+
+    async def main():
+        return await asyncio.gather(*(consume() for _ in range(3)))
+
+    assert asyncio.run(main()) == ["abc"] * 3
+    assert len(upstream_calls) == 1
+
+
+def test_upstream_thread_sees_caller_context():
+    """上游请求在后台线程中读取，仍要按调用方的 agent 记录指标"""
+    single_flight = SingleFlight()
+    seen = []
+
+    def factory():
+        seen.append(metrics.current_agent.get())
+        yield "a"
+
+    token = metrics.current_agent.set("planner")
+    try:
+        assert "".join(single_flight.stream("k", factory)) == "a"
+    finally:
+        metrics.current_agent.reset(token)
+    assert seen == ["planner"]
+
+
+def test_unstarted_iterator_does_not_keep_upstream_open():
+    """创建后从未迭代的订阅不计入订阅数，其余订阅者放弃后上游仍会被提前关闭"""
+    single_flight = SingleFlight()
+    closed = threading.Event()
+
+    def factory():
+        try:
+            while True:
+                time.sleep(0.01)
+                yield "x"
+        finally:
+            closed.set()
+
+    leader = single_flight.stream("k", factory)
+    next(leader)
+    single_flight.stream("k", factory)  # 从未迭代
+    leader.close()
+
+    assert closed.wait(1)
+    assert single_flight.in_flight() == 0
+
+
+def test_async_pump_survives_garbage_collection():
+    """上游读取任务只被事件循环弱引用，由在途记录持有后回收不会使订阅者挂起"""
+    single_flight = AsyncSingleFlight()
+
+    async def factory():
+        for token in ["a", "b"]:
+            await asyncio.sleep(0.01)
+            gc.collect()
+            yield token
+
+    async def main():
+        stream = single_flight.stream("k", factory)
+        first = await stream.__anext__()
+        assert single_flight._flights["k"].task is not None
+        gc.collect()
+        rest = [chunk async for chunk in stream]
+        return first + "".join(rest)
+
+    assert asyncio.run(asyncio.wait_for(main(), 1)) == "ab"
+
+
+def test_async_pump_cancellation_reaches_subscribers():
+    """上游读取任务被取消时，订阅者收到取消异常而不是一直等待"""
+    single_flight = AsyncSingleFlight()
+
+    async def factory():
+        yield "a"
+        raise asyncio.CancelledError()
+
+    async def consume():
+        return [chunk async for chunk in single_flight.stream("k", factory)]
+
+    async def main():
+        results = await asyncio.wait_for(asyncio.gather(consume(), consume(), return_exceptions=True), 1)
+        return results, single_flight.get_stats()["in_flight"]
+
+    results, in_flight = asyncio.run(main())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert in_flight == 0
+
+
+if __name__ == "__main__":
+    test_concurrent_callers_share_one_upstream()
+    test_async_single_flight()
+    test_upstream_thread_sees_caller_context()
+    test_unstarted_iterator_does_not_keep_upstream_open()
+    test_async_pump_survives_garbage_collection()
+    test_async_pump_cancellation_reaches_subscribers()
+    print("✅ single-flight测试通过")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/21 11:20
+# @Author  : wang ke
+# @File    : test_stream.py
+# @Software: PyCharm
+
+import io
+
+from core.stream import ConsoleSink, QueueSink, SSESink
+from benchmarks.agent_bench import ScriptedLLM
+
+
+class CountingIO(io.StringIO):
+    """记录写出次数的输出流"""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def test_console_sink_buffers_tokens():
+    """逐token写入只在换行和结束时真正写出"""
+    output = CountingIO()
+    sink = ConsoleSink(buffer_size=1024, stream=output)
+    for token in ["你", "好", "，", "世界\n", "再", "见"]:
+        sink.write(token)
+    sink.on_end()
+
+    assert output.getvalue() == "你好，世界\n再见\n"
+    assert output.writes == 2
+
+
+def test_queue_sink_end_marker():
+    sink = QueueSink()
+    sink.write("a")
+    sink.on_end()
+    assert sink.queue.get_nowait() == "a"
+    assert sink.queue.get_nowait() is None
+
+
+def test_sse_sink_format():
+    frames = []
+    sink = SSESink(frames.append)
+    sink.write("你好")
+    sink.on_end()
+    assert frames[0] == 'event: message\ndata: {"content": "你好"}\n\n'.encode("utf-8")
+    assert frames[1].startswith(b"event: end\n")
+
+
+def test_failed_call_still_ends_sink():
+    """调用失败时 think 返回None，消费者仍能收到结束标记"""
+    def responder(messages):
+        raise ValueError("上游错误")
+
+    sink = QueueSink()
+    assert ScriptedLLM(responder=responder).think([{"role": "user", "content": "你好"}], sink=sink) is None
+    assert sink.queue.get_nowait() is None
+
+
+if __name__ == "__main__":
+    test_console_sink_buffers_tokens()
+    test_queue_sink_end_marker()
+    test_sse_sink_format()
+    test_failed_call_still_ends_sink()
+    print("✅ 所有流式输出测试通过")
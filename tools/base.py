@@ -1,5 +1,6 @@
 
 
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional, Callable, get_type_hints
 from pydantic import BaseModel
@@ -29,4 +30,55 @@ class Tool(ABC):
     @abstractmethod
     def get_parameters(self) -> List[ToolParameter]:
         """获取工具参数定义"""
-        pass
\ No newline at end of file
+        pass
+
+    async def arun(self, parameters: Dict[str, Any]) -> str:
+        """
+        异步执行工具
+
+        默认在线程池中运行同步的 run，原生支持异步IO的工具应重写此方法。
+        """
+        return await asyncio.to_thread(self.run, parameters)
+
+    def to_openai_schema(self) -> Dict[str, Any]:
+        """转换为 OpenAI function calling schema 格式
+
+        Returns:
+            符合 OpenAI function calling 标准的 schema
+        """
+        properties = {}
+        required = []
+
+        for param in self.get_parameters():
+            # 基础属性定义
+            prop = {
+                "type": param.type,
+                "description": param.description
+            }
+
+            # 如果有默认值，添加到描述中（OpenAI schema 不支持 default 字段）
+            if param.default is not None:
+                prop["description"] = f"{param.description} (默认: {param.default})"
+
+            # 如果是数组类型，添加 items 定义
+            if param.type == "array":
+                prop["items"] = {"type": "string"}  # 默认字符串数组
+
+            properties[param.name] = prop
+
+            # 收集必需参数
+            if param.required:
+                required.append(param.name)
+
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": required
+                }
+            }
+        }
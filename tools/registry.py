@@ -1,5 +1,5 @@
-
-from typing import Optional, Any, Callable, Dict
+import asyncio
+from typing import Optional, Any, Callable, Dict, List
 from tools.base import Tool
 
 class ToolRegistry:
@@ -34,6 +34,15 @@ class ToolRegistry:
         }
         print(f"✅ 工具 '{name}' 已注册。")
 
+    def get_tool(self, name: str) -> Optional[Tool]:
+        """获取Tool对象，不存在时返回None"""
+        return self._tools.get(name)
+
+    def get_function(self, name: str) -> Optional[Callable[[str], str]]:
+        """获取函数工具，不存在时返回None"""
+        info = self._functions.get(name)
+        return info["func"] if info else None
+
     def execute_tool(self, name: str, input_text: str) -> str:
         """
         执行工具
@@ -66,6 +75,37 @@ class ToolRegistry:
             return f"错误：未找到名为 '{name}' 的工具。"
 
 
+    async def aexecute_tool(self, name: str, input_text: str) -> str:
+        """
+        异步执行工具
+
+        Tool对象调用其 arun；函数工具如果是协程函数则直接等待，否则在线程池中执行。
+
+        Args:
+            name: 工具名称
+            input_text: 输入参数
+
+        Returns:
+            工具执行结果
+        """
+        if name in self._tools:
+            try:
+                return await self._tools[name].arun({"input": input_text})
+            except Exception as e:
+                return f"错误：执行工具 '{name}' 时发生异常: {str(e)}"
+
+        elif name in self._functions:
+            func = self._functions[name]["func"]
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    return await func(input_text)
+                return await asyncio.to_thread(func, input_text)
+            except Exception as e:
+                return f"错误：执行工具 '{name}' 时发生异常: {str(e)}"
+
+        else:
+            return f"错误：未找到名为 '{name}' 的工具。"
+
     def get_tools_description(self) -> str:
         """获取所有可用工具的格式化描述字符串"""
         descriptions = []
@@ -80,50 +120,27 @@ class ToolRegistry:
 
         return "\n".join(descriptions) if descriptions else "暂无可用工具"
 
-    def to_openai_schema(self) -> Dict[str, Any]:
+    def to_openai_schema(self) -> List[Dict[str, Any]]:
         """转换为 OpenAI function calling schema 格式
 
-        用于 FunctionCallAgent，使工具能够被 OpenAI 原生 function calling 使用
+        用于 SimpleAgent 的原生 function calling 模式。Tool对象使用其参数定义，
+        函数工具只接受一个字符串参数 input。
 
         Returns:
-            符合 OpenAI function calling 标准的 schema
+            所有工具的 schema 列表
         """
-        parameters = self.get_parameters()
-
-        # 构建 properties
-        properties = {}
-        required = []
-
-        for param in parameters:
-            # 基础属性定义
-            prop = {
-                "type": param.type,
-                "description": param.description
-            }
-
-            # 如果有默认值，添加到描述中（OpenAI schema 不支持 default 字段）
-            if param.default is not None:
-                prop["description"] = f"{param.description} (默认: {param.default})"
-
-            # 如果是数组类型，添加 items 定义
-            if param.type == "array":
-                prop["items"] = {"type": "string"}  # 默认字符串数组
-
-            properties[param.name] = prop
-
-            # 收集必需参数
-            if param.required:
-                required.append(param.name)
-
-        return {
-            "type": "function",
-            "function": {
-                "name": self.name,
-                "description": self.description,
-                "parameters": {
-                    "type": "object",
-                    "properties": properties,
-                    "required": required
+        schemas = [tool.to_openai_schema() for tool in self._tools.values()]
+        for name, info in self._functions.items():
+            schemas.append({
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": info["description"],
+                    "parameters": {
+                        "type": "object",
+                        "properties": {"input": {"type": "string", "description": "工具输入"}},
+                        "required": ["input"]
+                    }
                 }
-            }
-        }
+            })
+        return schemas
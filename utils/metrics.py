@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/29 10:40
+# @Author  : wang ke
+# @File    : metrics.py
+# @Software: PyCharm
+
+"""轻量指标 - 带标签的直方图，支持Prometheus文本格式导出"""
+
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Iterable, Optional, Sequence
+
+# 当前调用所属的Agent名称，由 Agent.run 设置，作为指标的 agent 标签
+current_agent: contextvars.ContextVar[str] = contextvars.ContextVar("current_agent", default="")
+
+
+@contextmanager
+def agent_label(name: str):
+    """在上下文内将指标的 agent 标签设置为 name"""
+    token = current_agent.set(name)
+    try:
+        yield
+    finally:
+        current_agent.reset(token)
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """
+    计算精确分位数（线性插值）
+
+    Args:
+        values: 样本
+        q: 分位点，0~1
+
+    Returns:
+        分位数，样本为空时返回None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+# 常用桶边界
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+GAP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """带标签的直方图"""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float],
+                 label_names: Tuple[str, ...] = ("model", "agent")):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.label_names = label_names
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, labels: Dict[str, str]) -> _Series:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        series = self._series.get(key)
+        if series is None:
+            # +1 为 +Inf 桶
+            series = self._series[key] = _Series(len(self.buckets) + 1)
+        return series
+
+    def observe(self, value: float, **labels: str):
+        """记录一个观测值"""
+        self.observe_many((value,), **labels)
+
+    def observe_many(self, values: Iterable[float], **labels: str):
+        """批量记录观测值，只加一次锁"""
+        with self._lock:
+            series = self._get_series(labels)
+            for value in values:
+                series.counts[bisect.bisect_left(self.buckets, value)] += 1
+                series.sum += value
+                series.count += 1
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        """按桶内线性插值估算分位数"""
+        with self._lock:
+            series = self._series.get(tuple(str(labels.get(name, "")) for name in self.label_names))
+            if series is None or series.count == 0:
+                return None
+            target = q * series.count
+            cumulative = 0
+            for index, count in enumerate(series.counts):
+                if cumulative + count >= target and count:
+                    lower = self.buckets[index - 1] if index > 0 else 0.0
+                    upper = self.buckets[index] if index < len(self.buckets) else lower
+                    return lower + (upper - lower) * (target - cumulative) / count
+                cumulative += count
+        return None
+
+    def collect(self) -> List[str]:
+        """导出为Prometheus文本格式的行"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                label_str = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{self.name}_bucket{{{label_str},le="{le}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{label_str}}} {series.sum}")
+                lines.append(f"{self.name}_count{{{label_str}}} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float],
+                  label_names: Tuple[str, ...] = ("model", "agent")) -> Histogram:
+        """获取或创建直方图"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Histogram(name, description, buckets, label_names)
+            return metric
+
+    def render(self) -> str:
+        """导出所有指标（Prometheus文本格式）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+# 默认注册表
+REGISTRY = MetricsRegistry()
+
+LLM_QUEUE_WAIT = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "限流排队等待时间", LATENCY_BUCKETS)
+LLM_TTFT = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds", "从发出请求到收到首个token的时间", LATENCY_BUCKETS)
+LLM_DURATION = REGISTRY.histogram(
+    "llm_request_duration_seconds", "单次请求的总耗时", LATENCY_BUCKETS)
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "llm_output_tokens_per_second", "首token之后的生成速度", RATE_BUCKETS)
+LLM_INTER_CHUNK_GAP = REGISTRY.histogram(
+    "llm_inter_chunk_gap_seconds", "相邻流式片段之间的间隔", GAP_BUCKETS)
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "llm_prompt_tokens", "单次请求的提示词token数", TOKEN_BUCKETS)
+LLM_COMPLETION_TOKENS = REGISTRY.histogram(
+    "llm_completion_tokens", "单次请求的生成token数", TOKEN_BUCKETS)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/30 10:15
+# @Author  : wang ke
+# @File    : mock_llm_server.py
+# @Software: PyCharm
+
+"""
+本地模拟LLM服务 - 兼容OpenAI chat.completions 接口，用于离线压测
+
+用法：
+    python -m utils.mock_llm_server --port 18080 --ttft 0.3 --tokens-per-second 40
+
+然后将 AgentsLLM 的 baseUrl 指向 http://127.0.0.1:18080/v1 即可。
+"""
+
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from typing import Optional, List, Dict, Any, Tuple
+
+from pydantic import BaseModel
+
+from utils.log import Log
+
+logger = Log()
+
+# 中日韩字符逐字切分，其余按“单词+空白”切分，近似模型的token粒度
+_TOKEN_PATTERN = re.compile(r"[぀-ヿ㐀-鿿가-힯]|[^\s぀-ヿ㐀-鿿가-힯]+\s*|\s+")
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+            500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+
+class MockLLMConfig(BaseModel):
+    """模拟服务的响应与延迟配置"""
+
+    model: str = "mock-llm"
+
+    # 响应内容：先按 rules（正则 -> 回复）匹配最后一条用户消息，
+    # 否则依次循环 responses，都没有时使用 template（可引用 {input}）
+    rules: List[Tuple[str, str]] = []
+    responses: List[str] = []
+    template: str = "这是对“{input}”的模拟回复。"
+
+    # 延迟配置（秒 / token每秒），jitter 为相对抖动比例，如 0.2 表示 ±20%
+    ttft: float = 0.2
+    tokens_per_second: float = 50.0
+    jitter: float = 0.0
+
+    # 错误注入：error_rate 概率在首token前返回 error_status；
+    # stream_error_rate 概率在输出一半后中断连接
+    error_rate: float = 0.0
+    error_status: int = 503
+    retry_after: Optional[float] = None
+    stream_error_rate: float = 0.0
+
+    # 随机种子，固定后延迟抖动与错误注入可复现
+    seed: Optional[int] = None
+
+
+def split_tokens(text: str) -> List[str]:
+    """将文本切分为模拟的token序列"""
+    return _TOKEN_PATTERN.findall(text)
+
+
+def apply_stop(text: str, stop: Any) -> str:
+    """按 stop 序列截断回复，与真实服务一致"""
+    if not stop:
+        return text
+    for sequence in [stop] if isinstance(stop, str) else stop:
+        index = text.find(sequence)
+        if index != -1:
+            text = text[:index]
+    return text
+
+
+class MockLLMServer:
+    """
+    基于asyncio的模拟LLM服务
+
+    支持 POST /v1/chat/completions（流式与非流式）和 GET /v1/models，
+    连接保持 keep-alive，流式响应采用分块传输的SSE，与真实服务的连接复用行为一致。
+    """
+
+    def __init__(self, config: Optional[MockLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            config: 响应与延迟配置
+            host: 监听地址
+            port: 监听端口，0表示随机分配
+        """
+        self.config = config or MockLLMConfig()
+        self.host = host
+        self.port = port
+        self._random = random.Random(self.config.seed)
+        self._response_index = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._connections = set()
+        self.stats = {"requests": 0, "errors_injected": 0, "completion_tokens": 0}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    # ---------- 生命周期 ----------
+
+    async def serve(self):
+        """在当前事件循环中启动服务"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"🧪 模拟LLM服务已启动: {self.base_url}")
+
+    async def aclose(self):
+        if self._server is not None:
+            self._server.close()
+            # keep-alive 连接上的处理协程会一直等待下一个请求，需要主动取消
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def start(self) -> str:
+        """在后台线程中启动服务，返回 base_url"""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.aclose())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self):
+        """停止后台线程中的服务"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = self._thread = None
+
+    def __enter__(self) -> "MockLLMServer":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # ---------- 响应内容 ----------
+
+    def render_response(self, messages: List[Dict[str, Any]]) -> str:
+        """根据配置生成本次请求的回复文本"""
+        user_input = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        for pattern, response in self.config.rules:
+            if re.search(pattern, user_input):
+                return response
+        if self.config.responses:
+            response = self.config.responses[self._response_index % len(self.config.responses)]
+            self._response_index += 1
+            return response
+        return self.config.template.replace("{input}", user_input)
+
+    def _jittered(self, seconds: float) -> float:
+        if self.config.jitter <= 0 or seconds <= 0:
+            return seconds
+        return max(0.0, seconds * (1 + self._random.uniform(-self.config.jitter, self.config.jitter)))
+
+    # ---------- HTTP ----------
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    keep_alive = await self._handle_chat(writer, body) and keep_alive
+                elif method == "GET" and path.rstrip("/").endswith("/models"):
+                    await self._send_json(writer, 200, {
+                        "object": "list",
+                        "data": [{"id": self.config.model, "object": "model", "owned_by": "mock"}]
+                    })
+                else:
+                    await self._send_json(writer, 404, {"error": {"message": f"未知路径: {path}"}})
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    @staticmethod
+    def _head(status: int, headers: Dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                         extra_headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+        headers.update(extra_headers or {})
+        writer.write(self._head(status, headers) + body)
+        await writer.drain()
+
+    async def _handle_chat(self, writer: asyncio.StreamWriter, body: bytes) -> bool:
+        """处理一次对话请求，返回连接是否可以继续复用"""
+        self.stats["requests"] += 1
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            await self._send_json(writer, 400, {"error": {"message": "请求体不是合法的JSON"}})
+            return True
+
+        if self._random.random() < self.config.error_rate:
+            self.stats["errors_injected"] += 1
+            headers = {"Retry-After": f"{self.config.retry_after:g}"} if self.config.retry_after is not None else None
+            await asyncio.sleep(self._jittered(self.config.ttft))
+            await self._send_json(writer, self.config.error_status,
+                                  {"error": {"message": "模拟服务注入的错误", "type": "mock_error"}}, headers)
+            return True
+
+        messages = payload.get("messages") or []
+        text = apply_stop(self.render_response(messages), payload.get("stop"))
+        tokens = split_tokens(text)
+        prompt_tokens = sum(len(split_tokens(str(m.get("content") or ""))) for m in messages)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        completion_id = f"chatcmpl-mock-{self.stats['requests']}"
+        model = payload.get("model") or self.config.model
+
+        if not payload.get("stream"):
+            await asyncio.sleep(self._jittered(self.config.ttft) + self._generation_time(len(tokens)))
+            self.stats["completion_tokens"] += len(tokens)
+            await self._send_json(writer, 200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            })
+            return True
+
+        writer.write(self._head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                      "Transfer-Encoding": "chunked"}))
+        await writer.drain()
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> Dict[str, Any]:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            data.update(extra)
+            return data
+
+        break_at = None
+        if self._random.random() < self.config.stream_error_rate:
+            self.stats["errors_injected"] += 1
+            break_at = len(tokens) // 2
+
+        await asyncio.sleep(self._jittered(self.config.ttft))
+        await self._send_event(writer, chunk({"role": "assistant", "content": ""}))
+        interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+        for index, token in enumerate(tokens):
+            if index == break_at:
+                # 模拟连接中途断开：不发送结束分块直接关闭
+                return False
+            if index:
+                await asyncio.sleep(self._jittered(interval))
+            await self._send_event(writer, chunk({"content": token}))
+            self.stats["completion_tokens"] += 1
+
+        await self._send_event(writer, chunk({}, "stop"))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            await self._send_event(writer, {"id": completion_id, "object": "chat.completion.chunk",
+                                            "created": int(time.time()), "model": model, "choices": [],
+                                            "usage": usage})
+        await self._write_chunk(writer, b"data: [DONE]\n\n")
+        await self._write_chunk(writer, b"")
+        return True
+
+    def _generation_time(self, token_count: int) -> float:
+        if self.config.tokens_per_second <= 0:
+            return 0.0
+        return self._jittered(max(0, token_count - 1) / self.config.tokens_per_second)
+
+    async def _send_event(self, writer: asyncio.StreamWriter, data: Dict[str, Any]):
+        await self._write_chunk(writer, f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    @staticmethod
+    async def _write_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务（OpenAI兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--config", help="MockLLMConfig 的JSON配置文件")
+    parser.add_argument("--ttft", type=float)
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--jitter", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    options: Dict[str, Any] = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            options.update(json.load(f))
+    for name in ("ttft", "tokens_per_second", "jitter", "error_rate", "seed"):
+        value = getattr(args, name)
+        if value is not None:
+            options[name] = value
+
+    server = MockLLMServer(MockLLMConfig(**options), args.host, args.port)
+
+    async def run():
+        await server.serve()
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("👋 模拟LLM服务已停止")
+
+
+if __name__ == "__main__":
+    main()
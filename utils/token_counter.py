@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/1/23 10:12
+# @Author  : wang ke
+# @File    : token_counter.py
+# @Software: PyCharm
+
+"""Token计数 - 优先使用tiktoken，不可用时退化为字符估算"""
+
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # 未安装或无法加载编码表
+    _ENCODING = None
+
+# 中日韩字符基本上一个字符对应一个token
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+# 每条消息在对话格式中的额外开销（role、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """
+    计算文本的token数
+
+    Args:
+        text: 文本
+
+    Returns:
+        token数（tiktoken不可用时为估算值，略偏大）
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def count_message_tokens(content: str) -> int:
+    """计算一条对话消息占用的token数（含格式开销）"""
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS